@@ -0,0 +1,119 @@
+"""
+Allocator traffic of the denoising loop, before/after the buffer pool.
+
+    python -m benchmarks.bench_buffers [--steps 50] [--batch 1]          # step-input microbenchmark
+    python -m benchmarks.bench_buffers --pipeline [--jobs 5]             # full CatVTONPipeline jobs
+
+The microbenchmark compares the old per-step `torch.cat` input assembly with
+writing into the pooled UNet input buffer. The pipeline mode runs the same
+jobs with `use_buffer_pool=False` and `True` and prints the CUDA
+caching-allocator counters (allocation requests, cudaMalloc calls,
+fragmentation) accumulated over the jobs.
+"""
+import argparse
+import time
+
+import torch
+
+from vton_model.model.buffer_pool import BufferPool, allocator_stats
+
+
+def diff_stats(before, after):
+    return {
+        "alloc_requests": after["alloc_requests"] - before["alloc_requests"],
+        "cuda_mallocs": after["cuda_mallocs"] - before["cuda_mallocs"],
+        "fragmentation": after["fragmentation"],
+        "reserved_mb": after["reserved_mb"],
+    }
+
+
+def step_inputs_cat(latents, mask_latent_concat, masked_latent_concat, steps):
+    for _ in range(steps):
+        model_input = torch.cat([latents] * 2)
+        model_input = torch.cat([model_input, mask_latent_concat, masked_latent_concat], dim=1)
+    return model_input
+
+
+def step_inputs_pooled(latents, mask_latent_concat, masked_latent_concat, steps, pool):
+    batch_size = latents.shape[0]
+    unet_input = pool.get("unet_input", (2 * batch_size, 9, *latents.shape[2:]), latents.dtype, latents.device)
+    unet_input[:, 4:5] = mask_latent_concat
+    unet_input[:, 5:] = masked_latent_concat
+    noisy_input = unet_input[:, :4].unflatten(0, (2, batch_size))
+    for _ in range(steps):
+        noisy_input.copy_(latents.unsqueeze(0))
+    return unet_input
+
+
+def micro(opts):
+    device = "cuda"
+    dtype = torch.float16
+    latents = torch.randn(opts.batch, 4, 192, 64, device=device, dtype=dtype)
+    mask_latent_concat = torch.rand(2 * opts.batch, 1, 192, 64, device=device, dtype=dtype)
+    masked_latent_concat = torch.randn(2 * opts.batch, 4, 192, 64, device=device, dtype=dtype)
+    pool = BufferPool()
+    runs = {
+        "torch.cat": lambda: step_inputs_cat(latents, mask_latent_concat, masked_latent_concat, opts.steps),
+        "pooled": lambda: step_inputs_pooled(latents, mask_latent_concat, masked_latent_concat, opts.steps, pool),
+    }
+    for name, fn in runs.items():
+        fn()
+        torch.cuda.synchronize()
+        before = allocator_stats()
+        start = time.perf_counter()
+        for _ in range(opts.jobs):
+            fn()
+        torch.cuda.synchronize()
+        elapsed = (time.perf_counter() - start) / opts.jobs
+        print(f"{name:<10} {elapsed * 1e3:7.2f} ms/job  {diff_stats(before, allocator_stats())}")
+
+
+def pipeline(opts):
+    from huggingface_hub import snapshot_download
+    from PIL import Image
+
+    from vton_model.model.pipeline import CatVTONPipeline
+
+    repo_path = snapshot_download(repo_id="zhengchong/CatVTON")
+    person = Image.new("RGB", (512, 768), (128, 128, 128))
+    cloth = Image.new("RGB", (512, 768), (200, 30, 30))
+    mask = Image.new("L", (512, 768), 0)
+    mask.paste(255, (128, 192, 384, 576))
+    for use_pool in (False, True):
+        pipe = CatVTONPipeline(
+            base_ckpt="booksforcharlie/stable-diffusion-inpainting",
+            attn_ckpt=repo_path,
+            weight_dtype=torch.float16,
+            device="cuda",
+            skip_safety_check=True,
+            use_buffer_pool=use_pool,
+        )
+        call = lambda: pipe(person, cloth, mask, num_inference_steps=opts.steps, height=768, width=512)
+        call()
+        torch.cuda.synchronize()
+        before = allocator_stats()
+        start = time.perf_counter()
+        for _ in range(opts.jobs):
+            call()
+        torch.cuda.synchronize()
+        elapsed = (time.perf_counter() - start) / opts.jobs
+        print(f"buffer_pool={use_pool!s:<5} {elapsed:6.2f} s/job  {diff_stats(before, allocator_stats())}  pool={pipe.buffers.stats()}")
+        del pipe
+        torch.cuda.empty_cache()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pipeline", action="store_true")
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--jobs", type=int, default=5)
+    opts = parser.parse_args()
+    if opts.pipeline:
+        pipeline(opts)
+    else:
+        micro(opts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Cost of mid-job checkpointing, and how faithful a resume is.
+
+    python -m benchmarks.bench_checkpoint [--steps 50] [--jobs 3] [--redis | --dir PATH]
+
+Runs the same seeded CatVTONPipeline call without snapshots, with the
+default `Checkpointer` (every VTON_CHECKPOINT_EVERY steps, at most one per
+VTON_CHECKPOINT_MIN_INTERVAL s) and with a snapshot on every step (worst
+case), and reports seconds per step, the added time, the time spent in the
+callback on the denoising thread and the snapshot size. Then it resumes
+from the snapshot taken at 60% of the schedule and reports the time saved
+and the max pixel difference to the uninterrupted result (fp16 latents, so
+expect a few levels, not 0). Snapshots stay in memory unless --redis
+(REDIS_URL) or --dir is given.
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.common import MemoryStore, pipeline_inputs, seconds_per_step, timed_callback
+from vton_model.app import args, automasker, mask_processor, pipeline
+from vton_model.model.checkpoint import Checkpointer, FileCheckpointStore, RedisCheckpointStore
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--jobs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--redis", action="store_true")
+    parser.add_argument("--dir", default=None)
+    opts = parser.parse_args()
+
+    person, cloth, mask = pipeline_inputs((args['width'], args['height']), automasker, mask_processor)
+    if opts.redis:
+        from utils.redis import r_bytes
+        store = RedisCheckpointStore(r_bytes)
+    elif opts.dir:
+        store = FileCheckpointStore(opts.dir)
+    else:
+        store = MemoryStore()
+
+    def run(checkpoint_callback=None, resume_state=None):
+        generator = torch.Generator(device='cuda').manual_seed(opts.seed)
+        return pipeline(
+            person, cloth, mask, num_inference_steps=opts.steps, generator=generator,
+            checkpoint_callback=checkpoint_callback, resume_state=resume_state,
+        )[0]
+
+    configs = {
+        "no snapshots": None,
+        "default": Checkpointer(store),
+        "every step": Checkpointer(store, every=1, min_interval=0.0),
+    }
+    results = {}
+    for name, checkpointer in configs.items():
+        spent = [0.0]
+
+        def job():
+            callback = timed_callback(checkpointer.callback("bench"), spent) if checkpointer else None
+            return run(callback)
+
+        results[name] = (*seconds_per_step(job, opts.jobs, opts.steps, spent), checkpointer)
+        if checkpointer:
+            checkpointer.clear("bench")
+
+    baseline = results["no snapshots"][0]
+    print(f"{'config':<13} {'ms/step':>8} {'added':>7} {'in callback':>12} {'saved':>6} {'skipped':>8} {'KiB each':>9}")
+    for name, (per_step, in_callback, checkpointer) in results.items():
+        added = (per_step - baseline) / baseline
+        saved = checkpointer.saved if checkpointer else 0
+        skipped = checkpointer.skipped if checkpointer else 0
+        size_kib = checkpointer.bytes / saved / 1024 if saved else 0.0
+        print(f"{name:<13} {per_step * 1e3:>8.1f} {added:>7.2%} {in_callback / per_step:>12.2%} "
+              f"{saved:>6} {skipped:>8} {size_kib:>9.1f}")
+
+    # Preempted at 60%: resume from that snapshot and compare with the uninterrupted run
+    resume_at = int(opts.steps * 0.6)
+    checkpointer = Checkpointer(store, every=resume_at, min_interval=0.0)
+    full = run(checkpointer.callback("bench"))
+    state = checkpointer.load("bench")
+    torch.cuda.synchronize()
+    start = time.perf_counter()
+    resumed = run(resume_state=state)
+    torch.cuda.synchronize()
+    resume_seconds = time.perf_counter() - start
+    checkpointer.clear("bench")
+    diff = np.abs(np.asarray(full, dtype=np.int16) - np.asarray(resumed, dtype=np.int16)).max()
+    print(f"resume from step {state['step']}/{state['num_steps']}: {resume_seconds:.2f}s "
+          f"(full job {baseline * opts.steps:.2f}s), max pixel diff {diff}")
+
+
+if __name__ == "__main__":
+    main()
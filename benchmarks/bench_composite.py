@@ -0,0 +1,84 @@
+"""
+Cost and alignment of compositing a result back onto a full-resolution photo.
+
+    python -m benchmarks.bench_composite [--original 3024 4032] [--repeat 10]
+
+Uses synthetic images, so it runs without a GPU or model weights. The photo
+goes through the serving framing: `resize_and_crop` to the 2:3 model size,
+then to the 3:4 size the pipeline outputs. A "result" that repaints nothing
+(the framed photo itself) must then composite back onto the photo
+pixel-aligned inside the mask, and leave everything outside the mask's
+footprint untouched.
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+from benchmarks.common import INFER_SIZE, SIZE
+from vton_model.utils import composite_full_resolution, frame_box, resize_and_crop
+
+
+def smooth_texture(size, rng):
+    """Low-frequency colour noise at `size`: detail survives the downscale, so misalignment shows."""
+    w, h = size
+    coarse = Image.fromarray(rng.integers(0, 256, (h // 32, w // 32, 3), dtype=np.uint8))
+    return coarse.resize(size, Image.BICUBIC)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--original", type=int, nargs=2, default=[3024, 4032], metavar=("W", "H"))
+    parser.add_argument("--repeat", type=int, default=10)
+    opts = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    original = smooth_texture(tuple(opts.original), rng)
+    # what the pipeline sees and returns: the model-size crop, brought to the inference size
+    person = resize_and_crop(original, SIZE)
+    result = resize_and_crop(person, INFER_SIZE)
+    mask = Image.new("L", SIZE, 0)
+    w, h = SIZE
+    ImageDraw.Draw(mask).rectangle((w // 4, h // 4, 3 * w // 4, 3 * h // 4), fill=255)
+    mask = mask.filter(ImageFilter.GaussianBlur(9))
+    result_mask = resize_and_crop(mask, result.size)
+    box = frame_box(original.size, SIZE, result.size)
+
+    composite_full_resolution(result, original, result_mask, box)
+    start = time.perf_counter()
+    for _ in range(opts.repeat):
+        output = composite_full_resolution(result, original, result_mask, box)
+    elapsed = (time.perf_counter() - start) / opts.repeat
+    print(f"{opts.original[0]}x{opts.original[1]} composite of {result.width}x{result.height}: {elapsed * 1e3:.1f} ms")
+
+    left, top, right, bottom = box
+    scale_x, scale_y = (right - left) / result.width, (bottom - top) / result.height
+
+    def in_original(rect):
+        x0, y0, x1, y1 = rect
+        return (left + x0 * scale_x, top + y0 * scale_y, left + x1 * scale_x, top + y1 * scale_y)
+
+    # outside: nothing changed beyond the mask's footprint (1 px for the rounding)
+    x0, y0, x1, y1 = in_original(result_mask.getbbox())
+    changed = np.any(np.asarray(output) != np.asarray(original), axis=-1)
+    ys, xs = np.nonzero(changed)
+    outside_ok = xs.min() >= math.floor(x0) - 1 and xs.max() <= math.ceil(x1) and \
+        ys.min() >= math.floor(y0) - 1 and ys.max() <= math.ceil(y1)
+    print(f"outside mask unchanged: {outside_ok}")
+
+    # inside: where the mask is fully on, the composite must reproduce the photo
+    core = (np.asarray(result_mask) == 255).nonzero()
+    x0, y0, x1, y1 = (math.ceil(v) for v in in_original((core[1].min(), core[0].min(), core[1].max(), core[0].max())))
+    inside = np.abs(np.asarray(output, dtype=np.float32)[y0:y1, x0:x1] - np.asarray(original, dtype=np.float32)[y0:y1, x0:x1])
+    # the same composite mapped with the result's own crop box (ignoring the 2:3 step) for comparison
+    naive = composite_full_resolution(result, original, result_mask)
+    naive_inside = np.abs(np.asarray(naive, dtype=np.float32)[y0:y1, x0:x1] - np.asarray(original, dtype=np.float32)[y0:y1, x0:x1])
+    inside_ok = inside.mean() < 2.0
+    print(f"inside mask mean |d| {inside.mean():.2f} (single crop box mapping: {naive_inside.mean():.2f}), aligned: {inside_ok}")
+    raise SystemExit(0 if outside_ok and inside_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Decode + resize cost of large phone photos: full decode vs reduced (draft) decode.
+
+    python -m benchmarks.bench_decode [image.jpg ...] [--megapixels 12 24 48] [--repeat 5]
+
+Without image paths, synthetic JPEGs of the given sizes are generated. Each
+variant runs in a fresh process so its peak RSS growth over the post-import
+baseline is measured in isolation.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+SIZE = (512, 768)
+
+
+def _decode_full(path):
+    from vton_model.utils import resize_and_crop
+    return resize_and_crop(Image.open(path).convert("RGB"), SIZE)
+
+
+def _decode_reduced(path):
+    from vton_model.utils import load_image_reduced, resize_and_crop
+    return resize_and_crop(load_image_reduced(path, SIZE, fit="crop"), SIZE)
+
+
+VARIANTS = {"full": _decode_full, "reduced": _decode_reduced}
+
+
+def _child(variant, path, repeat, out):
+    import vton_model.utils  # noqa: F401  keep import cost out of the measurement
+    fn = VARIANTS[variant]
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(path)
+        times.append(time.perf_counter() - start)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    out.put((min(times), sum(times) / len(times), peak_rss - base_rss))
+
+
+def run_variant(variant, path, repeat):
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(variant, path, repeat, out))
+    proc.start()
+    result = out.get()
+    proc.join()
+    return result
+
+
+def make_jpeg(megapixels, directory):
+    h = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    w = h * 3 // 4
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, w, dtype=np.float32)[None, :, None]
+    noise = rng.integers(0, 32, size=(h // 8, w // 8, 3), dtype=np.uint8)
+    noise = np.kron(noise, np.ones((8, 8, 1), dtype=np.uint8))[:h, :w]
+    pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+    path = os.path.join(directory, f"synthetic_{megapixels}mp.jpg")
+    Image.fromarray(pixels).save(path, quality=92)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("images", nargs="*")
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[12, 24, 48])
+    parser.add_argument("--repeat", type=int, default=5)
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = opts.images or [make_jpeg(mp_, tmp) for mp_ in opts.megapixels]
+        print(f"{'image':<28} {'variant':<8} {'best ms':>9} {'mean ms':>9} {'peak +RSS MB':>13}")
+        for path in paths:
+            w, h = Image.open(path).size
+            label = f"{os.path.basename(path)[:16]} {w}x{h}"
+            for variant in VARIANTS:
+                best, mean, peak = run_variant(variant, path, opts.repeat)
+                print(f"{label:<28} {variant:<8} {best * 1e3:>9.1f} {mean * 1e3:>9.1f} {peak / 1024:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
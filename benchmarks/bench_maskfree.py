@@ -0,0 +1,28 @@
+"""
+End-to-end `vton` latency: masked (AutoMasker + CatVTONPipeline) vs mask-free
+(CatVTONPix2PixPipeline, no parsing networks).
+
+    python -m benchmarks.bench_maskfree [--jobs 5] [--steps 50]
+"""
+import argparse
+
+from benchmarks.common import CLOTH, PERSON, median, timed
+from vton_model.app import automasker, vton
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=5)
+    parser.add_argument("--steps", type=int, default=50)
+    opts = parser.parse_args()
+
+    masking = median(timed(lambda: automasker(PERSON, "upper"), opts.jobs))
+    print(f"AutoMasker alone: {masking:.3f}s")
+    for mode in ["masked", "maskfree"]:
+        # the warm-up call also loads the mask-free pipeline on first use
+        times = timed(lambda: vton(PERSON, CLOTH, "upper", opts.steps, 2.5, 42, "result only", mode=mode), opts.jobs)
+        print(f"{mode:<9} median {median(times):.3f}s  max {times[-1]:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Peak device memory vs latency for each model offload policy.
+
+    python -m benchmarks.bench_offload [--policies none model sequential] [--jobs 3] [--steps 30]
+
+Each policy runs in its own process (models are loaded when `vton_model.app`
+is imported) on the bundled demo images.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import CLOTH, PERSON
+
+
+def child(jobs, steps):
+    import torch
+
+    from vton_model.app import offload, vton
+
+    vton(PERSON, CLOTH, "upper", steps, 2.5, 42, "result only")  # warm up
+    torch.cuda.synchronize()
+    torch.cuda.reset_peak_memory_stats()
+    start = time.perf_counter()
+    for _ in range(jobs):
+        vton(PERSON, CLOTH, "upper", steps, 2.5, 42, "result only")
+    torch.cuda.synchronize()
+    report = offload.report()
+    report["seconds_per_job"] = (time.perf_counter() - start) / jobs
+    print(json.dumps(report))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--policies", nargs="+", default=["none", "model", "sequential"])
+    parser.add_argument("--jobs", type=int, default=3)
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    opts = parser.parse_args()
+    if opts.child:
+        child(opts.jobs, opts.steps)
+        return
+
+    results = {}
+    for policy in opts.policies:
+        env = dict(os.environ, VTON_OFFLOAD=policy)
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_offload", "--child", "--jobs", str(opts.jobs), "--steps", str(opts.steps)],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        results[policy] = json.loads(out.strip().splitlines()[-1])
+
+    baseline = results.get("none", {}).get("seconds_per_job")
+    print(f"{'policy':<11} {'peak alloc MB':>14} {'peak reserved MB':>17} {'s/job':>7} {'added latency':>14}")
+    for policy, r in results.items():
+        added = f"{r['seconds_per_job'] - baseline:+.2f}s" if baseline else "n/a"
+        print(f"{policy:<11} {r['peak_allocated_mb']:>14.0f} {r['peak_reserved_mb']:>17.0f} {r['seconds_per_job']:>7.2f} {added:>14}")
+
+
+if __name__ == "__main__":
+    main()
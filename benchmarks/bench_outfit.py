@@ -0,0 +1,50 @@
+"""
+Outfit latency: one "outfit" job (union mask, both garments in one denoise)
+vs the two-job flow (an "upper" job, then a "lower" job on its result).
+
+    python -m benchmarks.bench_outfit [--jobs 3] [--steps 50] [--lower PATH]
+
+The demo set has no lower-body garments, so `--lower` defaults to an
+"overall" garment; latency does not depend on the garment content.
+"""
+import argparse
+
+import torch
+
+from benchmarks.common import CLOTH, LOWER, PERSON, median, timed
+from vton_model.app import vton
+
+
+def two_jobs(lower, steps):
+    upper_result = vton(PERSON, CLOTH, "upper", steps, 2.5, 42, "result only")
+    return vton(upper_result, lower, "lower", steps, 2.5, 42, "result only")
+
+
+def one_job(lower, steps):
+    return vton(PERSON, CLOTH, "outfit", steps, 2.5, 42, "result only", lower_cloth_image=lower)
+
+
+def timed_peak(fn, jobs):
+    """Median seconds and peak allocated MiB over the timed calls."""
+    return median(timed(fn, jobs)), torch.cuda.max_memory_allocated() / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=3)
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--lower", default=LOWER)
+    opts = parser.parse_args()
+
+    results = {
+        "two jobs": timed_peak(lambda: two_jobs(opts.lower, opts.steps), opts.jobs),
+        "outfit": timed_peak(lambda: one_job(opts.lower, opts.steps), opts.jobs),
+    }
+    baseline = results["two jobs"][0]
+    print(f"{'flow':<9} {'median s':>9} {'peak alloc MB':>14} {'speedup':>8}")
+    for name, (seconds, peak) in results.items():
+        print(f"{name:<9} {seconds:>9.2f} {peak:>14.0f} {baseline / seconds:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
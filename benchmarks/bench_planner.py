@@ -0,0 +1,75 @@
+"""
+Checks `MemoryPlanner`'s fallbacks against a stub pipeline (runs on CPU):
+variations chunked to the planned batch size give the same images as one
+full batch, and an OOM in the VAE decode retries the decode alone, not the
+denoising loop.
+
+    python -m benchmarks.bench_planner
+"""
+import torch
+
+from vton_model.model.memory_planner import MODES, MemoryPlanner
+from vton_model.model.pipeline import DecodeOutOfMemoryError
+
+
+class StubPipeline:
+    """Draws one noise sample per variation and "decodes" it; counts denoising runs and decodes."""
+
+    weight_dtype = torch.float16
+    device = "cpu"
+
+    def __init__(self, decode_oom_modes=()):
+        self.decode_oom_modes = set(decode_oom_modes)
+        self.vae_mode = None
+        self.denoise_runs = 0
+        self.decodes = []
+
+    def set_vae_mode(self, mode):
+        self.vae_mode = mode
+
+    def __call__(self, generator=None, num_variations=1, **kwargs):
+        self.denoise_runs += 1
+        generators = generator if isinstance(generator, list) else [generator] * num_variations
+        latents = torch.stack([torch.randn(4, generator=g) for g in generators])
+        return self.postprocess(latents)
+
+    def postprocess(self, latents):
+        self.decodes.append(self.vae_mode)
+        if self.vae_mode in self.decode_oom_modes:
+            raise DecodeOutOfMemoryError(latents)
+        return list(latents)
+
+
+def seeded(n, seed=42):
+    return [torch.Generator().manual_seed(seed + i) for i in range(n)]
+
+
+def main():
+    # free memory for exactly two samples in the leanest mode
+    pipeline = StubPipeline()
+    planner = MemoryPlanner(pipeline, device="cpu")
+    cfg_split, vae_mode = MODES[-1]
+    free = planner.estimate(1024, 768, 2, True, cfg_split, vae_mode, 2)
+    planner.free_bytes = lambda: free
+    plan = planner.plan(1024, 768, 5)
+    assert plan.batch_size == 2, plan
+    chunked = planner(image="person", generator=seeded(5), num_variations=5)
+    assert pipeline.denoise_runs == 3, pipeline.denoise_runs
+    planner.free_bytes = lambda: float("inf")
+    full = planner(image="person", generator=seeded(5), num_variations=5)
+    assert len(chunked) == len(full) == 5
+    assert all(torch.equal(a, b) for a, b in zip(chunked, full)), "chunked variations differ from one full batch"
+    print(f"5 variations in {plan.batch_size}-sample chunks: 3 passes, same images as one batch")
+
+    # decode OOM in "full" and "sliced": one denoising run, decode retried until tiled
+    pipeline = StubPipeline(decode_oom_modes={"full", "sliced"})
+    planner = MemoryPlanner(pipeline, device="cpu")
+    images = planner(image="person", generator=seeded(1)[0])
+    assert pipeline.denoise_runs == 1, pipeline.denoise_runs
+    assert pipeline.decodes == ["full", "sliced", "tiled"], pipeline.decodes
+    assert torch.equal(images[0], torch.randn(4, generator=seeded(1)[0]))
+    print(f"decode OOM: 1 denoising run, decode modes tried {pipeline.decodes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Overhead of streaming previews on the denoising loop.
+
+    python -m benchmarks.bench_preview [--steps 50] [--jobs 3] [--redis]
+
+Runs the same CatVTONPipeline call without a callback, with the default
+throttled `PreviewPublisher`, and with a preview on every step (worst case),
+and reports seconds per step, the added time and the time spent inside
+the callback on the denoising thread. Messages go to an in-memory sink
+unless --redis is given (then REDIS_URL is used).
+"""
+import argparse
+
+from benchmarks.common import MemorySink, pipeline_inputs, seconds_per_step, timed_callback
+from vton_model.app import args, automasker, mask_processor, pipeline
+from vton_model.model.preview import PreviewPublisher
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--jobs", type=int, default=3)
+    parser.add_argument("--redis", action="store_true")
+    opts = parser.parse_args()
+
+    person, cloth, mask = pipeline_inputs((args['width'], args['height']), automasker, mask_processor)
+    if opts.redis:
+        from utils.redis import r as sink
+    else:
+        sink = MemorySink()
+
+    configs = {
+        "no previews": None,
+        "throttled": PreviewPublisher(sink),
+        "every step": PreviewPublisher(sink, every=1, min_interval=0.0),
+    }
+    results = {}
+    for name, publisher in configs.items():
+        spent = [0.0]
+
+        def run():
+            callback = timed_callback(publisher.callback("bench"), spent) if publisher else None
+            pipeline(person, cloth, mask, num_inference_steps=opts.steps, callback=callback)
+
+        results[name] = (*seconds_per_step(run, opts.jobs, opts.steps, spent), publisher)
+
+    baseline = results["no previews"][0]
+    print(f"{'config':<12} {'ms/step':>8} {'added':>7} {'in callback':>12} {'published':>10} {'dropped':>8}")
+    for name, (per_step, in_callback, publisher) in results.items():
+        added = (per_step - baseline) / baseline
+        published = publisher.published if publisher else 0
+        dropped = publisher.dropped if publisher else 0
+        print(f"{name:<12} {per_step * 1e3:>8.1f} {added:>7.2%} {in_callback / per_step:>12.2%} {published:>10} {dropped:>8}")
+
+
+if __name__ == "__main__":
+    main()
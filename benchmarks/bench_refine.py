@@ -0,0 +1,59 @@
+"""
+Refinement latency: a full run vs img2img refinement of its result at several
+`strength` values (only the last strength * steps DDIM steps run). First
+checks that refining at strength ~0 (one step at the lowest noise level)
+gives back the previous result pixel-aligned: no zoom or shift between the
+init image and the output framing.
+
+    python -m benchmarks.bench_refine [--strengths 1.0 0.5 0.3] [--steps 50] [--jobs 3]
+"""
+import argparse
+
+import numpy as np
+
+from benchmarks.common import CLOTH, PERSON, median, timed
+from vton_model.app import vton
+
+
+def best_shift(a, b, radius=6):
+    """(dx, dy) within `radius` that best aligns `b` onto `a`, and the mean |difference| there."""
+    a = np.asarray(a.convert("L"), dtype=np.float32)
+    b = np.asarray(b.convert("L"), dtype=np.float32)
+    h, w = a.shape
+    scores = {}
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            crop_a = a[radius:h - radius, radius:w - radius]
+            crop_b = b[radius + dy:h - radius + dy, radius + dx:w - radius + dx]
+            scores[dx, dy] = np.abs(crop_a - crop_b).mean()
+    shift = min(scores, key=scores.get)
+    return shift, scores[shift]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--strengths", type=float, nargs="+", default=[1.0, 0.5, 0.3])
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--jobs", type=int, default=3)
+    opts = parser.parse_args()
+
+    previous = vton(PERSON, CLOTH, "upper", opts.steps, 2.5, 42, "result only")
+    # strength ~0: one step at the lowest noise level, so only the VAE round trip separates the two
+    same = vton(PERSON, CLOTH, "upper", opts.steps, 2.5, 42, "result only", init_image=previous, strength=1e-3)
+    assert same.size == previous.size, (same.size, previous.size)
+    shift, diff = best_shift(previous, same)
+    assert shift == (0, 0) and diff < 8, f"refinement output is misaligned: best shift {shift}, mean |d| {diff:.1f}"
+    print(f"strength ~0: aligned with the previous result (mean |d| {diff:.1f})")
+    full = median(timed(lambda: vton(PERSON, CLOTH, "upper", opts.steps, 2.5, 42, "result only"), opts.jobs))
+    print(f"{'run':<14} {'median s':>9} {'saving':>7}")
+    print(f"{'full':<14} {full:>9.2f} {1.0:>6.2f}x")
+    for strength in opts.strengths:
+        refine = median(timed(
+            lambda: vton(PERSON, CLOTH, "upper", opts.steps, 3.0, 7, "result only", init_image=previous, strength=strength),
+            opts.jobs,
+        ))
+        print(f"{f'strength {strength}':<14} {refine:>9.2f} {full / refine:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Parity and throughput of the batched tensor resize vs the PIL versions.
+
+    python -m benchmarks.bench_resize [--batch 16] [--device cuda] [--repeat 10]
+
+Parity is reported as max / mean absolute difference in uint8 units between
+`resize_and_crop` / `resize_and_padding` and their `*_tensor` counterparts,
+and asserted against RESIZE_PARITY_MAX / RESIZE_PARITY_MEAN (RESIZE_UPSCALE_* when enlarging) in
+vton_model/utils.py: the tensor path resizes with antialiased bicubic, not
+LANCZOS, so it is close but not bit-exact (exact at the target size). The
+last case is the serving one: `vton` on CUDA takes the prep-size person and
+garments (512x768) to the inference size (768x1024) with the tensor path.
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from benchmarks.common import INFER_SIZE, SIZE
+from vton_model.utils import (RESIZE_PARITY_MAX, RESIZE_PARITY_MEAN, RESIZE_UPSCALE_PARITY_MAX, RESIZE_UPSCALE_PARITY_MEAN, prepare_image, resize_and_crop,
+                              resize_and_crop_tensor, resize_and_padding, resize_and_padding_tensor)
+
+
+
+def make_images(batch, shape, seed=0):
+    rng = np.random.default_rng(seed)
+    h, w = shape
+    y, x = np.mgrid[0:h, 0:w]
+    images = []
+    for _ in range(batch):
+        base = (np.sin(x / rng.uniform(5, 40)) + np.cos(y / rng.uniform(5, 40))) * 60 + 128
+        noise = rng.normal(0, 10, size=(h, w, 3))
+        images.append(np.clip(base[..., None] + noise, 0, 255).astype(np.uint8))
+    return images
+
+
+def to_uint8(normalized):
+    return ((normalized + 1.0) * 127.5).round().clamp(0, 255).to(torch.uint8).cpu()
+
+
+def sync(device):
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize()
+
+
+def timeit(fn, repeat, device):
+    fn()
+    sync(device)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    sync(device)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--repeat", type=int, default=10)
+    opts = parser.parse_args()
+
+    for shape, size in [((1536, 1024), SIZE), ((1200, 1600), SIZE), ((3000, 2000), SIZE), ((SIZE[1], SIZE[0]), INFER_SIZE)]:
+        images = make_images(opts.batch, shape)
+        pil_images = [Image.fromarray(i) for i in images]
+        batch = torch.from_numpy(np.stack(images)).to(opts.device)
+        for name, pil_fn, tensor_fn in [
+            ("crop", resize_and_crop, resize_and_crop_tensor),
+            ("padding", resize_and_padding, resize_and_padding_tensor),
+        ]:
+            reference = prepare_image([pil_fn(i, size) for i in pil_images])
+            result = tensor_fn(batch, size)
+            diff = (to_uint8(result).int() - to_uint8(reference).int()).abs().float()
+            upscale = size[1] > shape[0]
+            max_diff = RESIZE_UPSCALE_PARITY_MAX if upscale else RESIZE_PARITY_MAX
+            mean_diff = RESIZE_UPSCALE_PARITY_MEAN if upscale else RESIZE_PARITY_MEAN
+            assert diff.max().item() <= max_diff and diff.mean().item() <= mean_diff, (
+                f"{name} {shape}: max|d|={diff.max().item()} mean|d|={diff.mean().item():.2f}"
+            )
+            # `vton` hands PIL images in and the normalized batch straight to the pipeline
+            served = prepare_image(tensor_fn(pil_images, size, device=opts.device))
+            assert torch.equal(served.cpu(), result.cpu()), f"{name} {shape}: PIL input differs from the uint8 batch"
+
+            pil_time = timeit(lambda: prepare_image([pil_fn(i, size) for i in pil_images]), opts.repeat, "cpu")
+            tensor_time = timeit(lambda: tensor_fn(batch, size), opts.repeat, opts.device)
+            print(
+                f"{shape[1]}x{shape[0]} {name:<8} max|d|={diff.max().item():5.1f} mean|d|={diff.mean().item():5.2f}  "
+                f"PIL {opts.batch / pil_time:8.1f} img/s  tensor[{opts.device}] {opts.batch / tensor_time:8.1f} img/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
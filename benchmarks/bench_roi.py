@@ -0,0 +1,37 @@
+"""
+Full-frame vs crop-to-ROI diffusion per garment type: ROI size, latent
+token count and latency.
+
+    python -m benchmarks.bench_roi [--types upper lower] [--steps 50] [--jobs 3]
+"""
+import argparse
+
+from benchmarks.common import CLOTH, PERSON, median, timed
+from vton_model.app import args, automasker, mask_processor, vton
+from vton_model.utils import load_image_reduced, mask_roi_box, resize_and_crop
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--types", nargs="+", default=["upper", "lower"])
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--jobs", type=int, default=3)
+    opts = parser.parse_args()
+
+    size = (args['width'], args['height'])
+    infer_size = (args['infer_width'], args['infer_height'])
+    person = resize_and_crop(load_image_reduced(PERSON, size), size)
+    full_tokens = (infer_size[0] // 8) * (infer_size[1] // 8)
+    print(f"{'type':<6} {'roi':>9} {'tokens':>7} {'full s':>7} {'roi s':>6} {'speedup':>8}")
+    for cloth_type in opts.types:
+        mask = mask_processor.blur(automasker(person, cloth_type)['mask'], blur_factor=9)
+        box = mask_roi_box(resize_and_crop(mask, infer_size), args['roi_margin'], args['roi_bucket'], args['roi_min_size'])
+        roi_size = (box[2] - box[0], box[3] - box[1]) if box else infer_size
+        tokens = (roi_size[0] // 8) * (roi_size[1] // 8)
+        full = median(timed(lambda: vton(PERSON, CLOTH, cloth_type, opts.steps, 2.5, 42, "result only"), opts.jobs))
+        roi = median(timed(lambda: vton(PERSON, CLOTH, cloth_type, opts.steps, 2.5, 42, "result only", roi_crop=True), opts.jobs))
+        print(f"{cloth_type:<6} {roi_size[0]:>4}x{roi_size[1]:<4} {tokens / full_tokens:>6.0%} {full:>7.2f} {roi:>6.2f} {full / roi:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Queue simulator: FIFO `blpop` vs the priority scheduler (weighted fair
+classes, cost-ordered with aging inside a class).
+
+    python -m benchmarks.bench_scheduler [--jobs 20000] [--workers 4] [--load 0.9]
+
+Poisson arrivals with a paid/free and short/long job mix; service time is
+proportional to `job_cost`. Prints p50/p95 end-to-end latency (queue wait
++ service) per class and job size for both policies. Pure simulation, no
+Redis or GPU needed.
+"""
+import argparse
+import heapq
+import random
+from collections import defaultdict
+
+from utils.scheduler import StrideSelector, job_cost, job_score, parse_classes
+
+# (num_inference_steps, share of jobs)
+STEP_MIX = [(10, 0.35), (30, 0.25), (50, 0.3), (100, 0.1)]
+PAID_SHARE = 0.3
+SECONDS_PER_COST = 0.05  # ~5 s for a 50-step CFG job
+
+
+def make_jobs(n, workers, load, seed):
+    rng = random.Random(seed)
+    steps, weights = zip(*STEP_MIX)
+    mean_service = sum(s * w for s, w in STEP_MIX) * 2 * SECONDS_PER_COST
+    rate = load * workers / mean_service
+    now, jobs = 0.0, []
+    for _ in range(n):
+        now += rng.expovariate(rate)
+        job = {
+            "num_inference_steps": rng.choices(steps, weights)[0],
+            "guidance_scale": 2.5,
+            "enqueued_at": now,
+            "priority": "paid" if rng.random() < PAID_SHARE else "free",
+        }
+        job["service"] = job_cost(job) * SECONDS_PER_COST
+        jobs.append(job)
+    return jobs
+
+
+class FifoQueue:
+    def __init__(self):
+        self.items = []
+        self.head = 0
+
+    def push(self, job):
+        self.items.append(job)
+
+    def __len__(self):
+        return len(self.items) - self.head
+
+    def pop(self):
+        self.head += 1
+        return self.items[self.head - 1]
+
+
+class PriorityQueues:
+    def __init__(self, classes):
+        self.heaps = {name: [] for name in classes}
+        self.selector = StrideSelector(classes)
+        self.count = 0
+
+    def push(self, job):
+        self.count += 1
+        heapq.heappush(self.heaps[job["priority"]], (job_score(job), self.count, job))
+
+    def __len__(self):
+        return sum(len(h) for h in self.heaps.values())
+
+    def pop(self):
+        name = self.selector.order([n for n, h in self.heaps.items() if h])[0]
+        self.selector.charge(name)
+        return heapq.heappop(self.heaps[name])[2]
+
+
+def simulate(jobs, workers, queue):
+    free_at = [0.0] * workers
+    latencies = []
+    i = 0
+    while i < len(jobs) or len(queue):
+        now = heapq.heappop(free_at)
+        if not len(queue) and jobs[i]["enqueued_at"] > now:
+            now = jobs[i]["enqueued_at"]
+        while i < len(jobs) and jobs[i]["enqueued_at"] <= now:
+            queue.push(jobs[i])
+            i += 1
+        job = queue.pop()
+        done = now + job["service"]
+        latencies.append((job, done - job["enqueued_at"]))
+        heapq.heappush(free_at, done)
+    return latencies
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--load", type=float, default=0.9, help="target GPU utilisation")
+    parser.add_argument("--seed", type=int, default=0)
+    opts = parser.parse_args()
+
+    jobs = make_jobs(opts.jobs, opts.workers, opts.load, opts.seed)
+    policies = {"fifo": FifoQueue(), "priority": PriorityQueues(parse_classes())}
+    print(f"{opts.jobs} jobs, {opts.workers} workers, load {opts.load:.0%}, classes {parse_classes()}")
+    print(f"{'policy':<9} {'class':<5} {'steps':>5} {'jobs':>6} {'p50 s':>8} {'p95 s':>8}")
+    for name, queue in policies.items():
+        groups = defaultdict(list)
+        for job, latency in simulate(jobs, opts.workers, queue):
+            groups[(job["priority"], job["num_inference_steps"])].append(latency)
+            groups[(job["priority"], "all")].append(latency)
+        for (priority, steps), latencies in sorted(groups.items(), key=lambda kv: (kv[0][0], str(kv[0][1]).zfill(3))):
+            print(f"{name:<9} {priority:<5} {steps:>5} {len(latencies):>6} "
+                  f"{percentile(latencies, 0.5):>8.1f} {percentile(latencies, 0.95):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
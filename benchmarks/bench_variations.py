@@ -0,0 +1,32 @@
+"""
+GPU time for N seeds: N separate `vton` jobs vs one job with num_variations=N
+(one parse + encode, one batched denoise).
+
+    python -m benchmarks.bench_variations [--variations 1 2 4] [--steps 50]
+"""
+import argparse
+
+from benchmarks.common import CLOTH, PERSON, timed
+from vton_model.app import vton
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--variations", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--steps", type=int, default=50)
+    opts = parser.parse_args()
+
+    vton(PERSON, CLOTH, "upper", opts.steps, 2.5, 42, "result only")  # warm up
+    single = None
+    print(f"{'N':>2} {'N jobs s':>9} {'batched s':>10} {'marginal s/variation':>21}")
+    for n in opts.variations:
+        separate = timed(lambda: [vton(PERSON, CLOTH, "upper", opts.steps, 2.5, 42 + i, "result only") for i in range(n)], warmup=False)[0]
+        batched = timed(lambda: vton(PERSON, CLOTH, "upper", opts.steps, 2.5, 42, "result only", num_variations=n), warmup=False)[0]
+        if n == 1:
+            single = batched
+        marginal = f"{(batched - single) / (n - 1):.2f}" if single is not None and n > 1 else "n/a"
+        print(f"{n:>2} {separate:>9.2f} {batched:>10.2f} {marginal:>21}")
+
+
+if __name__ == "__main__":
+    main()
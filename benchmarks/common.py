@@ -0,0 +1,107 @@
+"""
+Fixtures and helpers shared by the benchmark scripts: the demo images, the
+model / inference sizes, GPU timing, and in-memory stand-ins for the Redis
+sinks and stores.
+"""
+import os
+import time
+
+import torch
+from PIL import Image
+
+from vton_model.utils import resize_and_crop, resize_and_padding
+
+DEMO = os.path.join("vton_model", "resource", "demo", "example")
+PERSON = os.path.join(DEMO, "person", "men", "model_5.png")
+CLOTH = os.path.join(DEMO, "condition", "upper", "21514384_52353349_1000.jpg")
+LOWER = os.path.join(DEMO, "condition", "overall", "21744571_51588794_1000.jpg")
+
+SIZE = (512, 768)  # model size (args['width'], args['height'])
+INFER_SIZE = (768, 1024)  # pipeline output size (args['infer_width'], args['infer_height'])
+
+
+def sync():
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def timed(fn, jobs=1, warmup=True):
+    """
+    Sorted wall-clock seconds of `jobs` calls of `fn`, device work included,
+    after one untimed warm-up call. Peak memory stats are reset after the
+    warm-up, so `torch.cuda.max_memory_allocated()` covers the timed calls.
+    """
+    if warmup:
+        fn()
+    sync()
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+    times = []
+    for _ in range(jobs):
+        start = time.perf_counter()
+        fn()
+        sync()
+        times.append(time.perf_counter() - start)
+    return sorted(times)
+
+
+def median(times):
+    return times[len(times) // 2]
+
+
+def timed_callback(callback, spent):
+    """Wrap a denoising-loop callback, adding the seconds spent inside it to `spent[0]`."""
+    def on_step(*a):
+        start = time.perf_counter()
+        callback(*a)
+        spent[0] += time.perf_counter() - start
+    return on_step
+
+
+def seconds_per_step(job, jobs, steps, spent):
+    """(seconds per step, of which inside the timed callback) over `jobs` calls of `job` after a warm-up."""
+    job()  # warm up
+    sync()
+    spent[0] = 0.0
+    start = time.perf_counter()
+    for _ in range(jobs):
+        job()
+    sync()
+    total_steps = jobs * steps
+    return (time.perf_counter() - start) / total_steps, spent[0] / total_steps
+
+
+def pipeline_inputs(size, automasker, mask_processor, cloth_type="upper"):
+    """Demo person, garment and blurred mask at the model size, as `vton` hands them to the pipeline."""
+    person = resize_and_crop(Image.open(PERSON).convert("RGB"), size)
+    cloth = resize_and_padding(Image.open(CLOTH).convert("RGB"), size)
+    mask = mask_processor.blur(automasker(person, cloth_type)['mask'], blur_factor=9)
+    return person, cloth, mask
+
+
+class MemorySink:
+    """Stand-in for the Redis client `PreviewPublisher` publishes to."""
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    def publish(self, channel, message):
+        self.messages += 1
+        self.bytes += len(message)
+
+
+class MemoryStore:
+    """Stand-in for `RedisCheckpointStore` / `FileCheckpointStore`."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, job_id):
+        return self.data.get(job_id)
+
+    def put(self, job_id, data):
+        self.data[job_id] = data
+
+    def delete(self, job_id):
+        self.data.pop(job_id, None)
@@ -0,0 +1,192 @@
+"""
+End-to-end check of the mask stage -> diffusion stage hand-off on a fake
+Redis (no server, GPU or models needed).
+
+    pip install fakeredis lupa
+    python -m benchmarks.e2e_stages [--jobs 20]
+
+Jobs go through the real queue code (priority classes, lease claiming with
+the Lua scripts, the reaper) and the real payload format: a mask-stage
+worker claims each job, "preprocesses" it (the repo's demo photos as
+person / garment / init images and a synthetic binary mask at model size,
+standing in for downloads and AutoMasker), hands it off and acks; a
+diffusion-stage worker claims it from the ready queue and checks the inputs
+arrive pixel-identical (garments by URL through a stand-in garment cache,
+as main.py does with `GarmentCache` and `prepare_garments`). One mask-stage
+claim is abandoned to check that the reaper requeues it. Prints payload size and pack/unpack
+time against raw pixels and a PNG round trip of the same images.
+"""
+import argparse
+import glob
+import io
+import json
+import time
+
+import fakeredis
+import numpy as np
+from PIL import Image, ImageOps
+
+from benchmarks.common import DEMO, INFER_SIZE, SIZE
+from utils.handoff import InputStore, hand_off, pack_inputs, take_inputs, unpack_inputs
+from utils.scheduler import PriorityScheduler
+
+QUEUE = "vton_e2e"
+PHOTOS = sorted(glob.glob(f"{DEMO}/person/*/*.*g") + glob.glob(f"{DEMO}/condition/person/*.jpg"))
+GARMENTS = sorted(glob.glob(f"{DEMO}/condition/upper/*.jpg") + glob.glob(f"{DEMO}/condition/overall/*.jpg"))
+
+
+def demo_inputs(rng, cloth_type, mode, refine):
+    """Demo photos fitted to the model size and a blob mask, as `preprocess` would return them."""
+    def photo(paths, size=SIZE):
+        image = Image.open(paths[rng.integers(len(paths))]).convert("RGB")
+        return ImageOps.fit(image, size, Image.LANCZOS)
+
+    mask = None
+    if mode == "masked":
+        yy, xx = np.mgrid[:SIZE[1], :SIZE[0]]
+        cy, cx = rng.integers(250, 500), rng.integers(150, 350)
+        mask = Image.fromarray(((((yy - cy) / 220) ** 2 + ((xx - cx) / 140) ** 2 < 1) * 255).astype(np.uint8), mode="L")
+    return {
+        "person_image": photo(PHOTOS),
+        "cloth_images": [photo(GARMENTS) for _ in range(2 if cloth_type == "outfit" else 1)],
+        "mask": mask,
+        "init_image": photo(PHOTOS, INFER_SIZE) if refine else None,
+    }
+
+
+class CatalogCache:
+    """Stand-in for `GarmentCache` + `prepare_garments`: garment URL -> image at model size."""
+
+    def __init__(self):
+        self.images = {}
+
+    def get(self, url):
+        return self.images[url]
+
+
+def same_inputs(a, b):
+    pairs = [(a["person_image"], b["person_image"]), *zip(a["cloth_images"], b["cloth_images"])]
+    pairs += [(a[name], b[name]) for name in ("mask", "init_image") if a[name] is not None or b[name] is not None]
+    return len(a["cloth_images"]) == len(b["cloth_images"]) and all(
+        x is not None and y is not None and x.mode == y.mode and np.array_equal(np.asarray(x), np.asarray(y))
+        for x, y in pairs
+    )
+
+
+def png_round_trip(prepared):
+    """PNG size and encode + decode seconds of what the payload carries."""
+    images = [prepared["person_image"], prepared["mask"], prepared["init_image"]]
+    size, start = 0, time.perf_counter()
+    for image in filter(None, images):
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        size += buffer.tell()
+        Image.open(io.BytesIO(buffer.getvalue())).load()
+    return size, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    opts = parser.parse_args()
+    rng = np.random.default_rng(opts.seed)
+
+    server = fakeredis.FakeServer()
+    r = fakeredis.FakeRedis(server=server, decode_responses=True)
+    r_bytes = fakeredis.FakeRedis(server=server)
+    inputs = InputStore(r_bytes)
+    garment_cache = CatalogCache()
+    intake = PriorityScheduler(r, QUEUE, "mask-0")
+    ready_out = PriorityScheduler(r, f"{QUEUE}:ready", "mask-0")
+    ready_in = PriorityScheduler(r, f"{QUEUE}:ready", "diffusion-0")
+
+    # Producer
+    expected = {}
+    for i in range(opts.jobs):
+        cloth_type = ["upper", "lower", "overall", "outfit"][i % 4]
+        mode = "maskfree" if i % 5 == 4 and cloth_type != "outfit" else "masked"
+        job = {
+            "id": f"job-{i}",
+            "cloth_type": cloth_type,
+            "mode": mode,
+            "num_inference_steps": int(rng.choice([10, 30, 50])),
+            "guidance_scale": 2.5,
+            "priority": "paid" if i % 3 == 0 else "free",
+            "full_resolution": i % 7 == 6 and mode == "masked",
+        }
+        expected[job["id"]] = demo_inputs(rng, cloth_type, mode, refine=i % 6 == 1 and mode == "masked")
+        for key, cloth_image in zip(["cloth_image_url", "lower_cloth_image_url"], expected[job["id"]]["cloth_images"]):
+            job[key] = f"https://example.com/{job['id']}/{key}.jpg"
+            garment_cache.images[job[key]] = cloth_image
+        intake.enqueue(job)
+
+    # A mask-stage worker dies holding a lease: the reaper must put the job back
+    intake.leases.ttl = 0.2
+    _, raw, _ = intake.pop()
+    lost_id = json.loads(raw)["id"]
+    time.sleep(0.3)
+    requeued, dead = intake.leases.reap()
+    assert (requeued, dead) == (1, 0), (requeued, dead)
+    intake.leases.ttl = 60
+
+    # Mask stage
+    sizes, pack_seconds, png_sizes, png_seconds, raw_sizes = [], 0.0, 0, 0.0, 0
+    while (job_data := intake.pop(timeout=0)) is not None:
+        priority, raw, lease_id = job_data
+        job = json.loads(raw)
+        if job["id"] == lost_id:
+            assert job.get("attempts") == 1, job
+        prepared = None if job["full_resolution"] else expected[job["id"]]
+        if prepared is not None:
+            start = time.perf_counter()
+            pack_inputs(dict(prepared, cloth_images=[]))
+            pack_seconds += time.perf_counter() - start
+            png_size, png_time = png_round_trip(prepared)
+            png_sizes += png_size
+            png_seconds += png_time
+            raw_sizes += sum(np.asarray(image).nbytes for image in filter(None, [
+                prepared["person_image"], prepared["mask"], prepared["init_image"]]))
+        sizes.append(hand_off(job, priority, prepared, ready_out, inputs))
+        intake.ack(lease_id)
+
+    # Diffusion stage
+    done, unpack_seconds = 0, 0.0
+    while (job_data := ready_in.pop(timeout=0)) is not None:
+        priority, raw, lease_id = job_data
+        job = json.loads(raw)
+        assert "attempts" not in job and job["masked_at"], job
+        assert priority == job["priority"], (priority, job)
+        start = time.perf_counter()
+        prepared = take_inputs(job, inputs)
+        unpack_seconds += time.perf_counter() - start
+        if job["full_resolution"]:
+            assert prepared is None and job["inputs_key"] is None, job
+        else:
+            urls = [job["cloth_image_url"]] + ([job["lower_cloth_image_url"]] if job["cloth_type"] == "outfit" else [])
+            prepared["cloth_images"] = [garment_cache.get(url) for url in urls]
+            assert same_inputs(prepared, expected[job["id"]]), f"inputs of {job['id']} changed in transit"
+            inputs.delete(job["inputs_key"])
+        ready_in.ack(lease_id)
+        done += 1
+
+    assert done == opts.jobs, (done, opts.jobs)
+    for scheduler in (intake, ready_in):
+        assert scheduler.depth() == 0
+        assert r.hlen(scheduler.leases.processing_key) == 0 and r.zcard(scheduler.leases.leases_key) == 0
+    assert not r_bytes.keys(inputs.prefix + "*")
+
+    payload = sum(sizes)
+    packed_jobs = sum(1 for size in sizes if size)
+    print(f"{done} jobs through both stages, inputs identical, queues / leases / payloads empty, 1 reaped claim")
+    print(f"payload  {payload / packed_jobs / 1024:8.0f} KiB/job  pack {pack_seconds / packed_jobs * 1e3:6.1f} ms  "
+          f"unpack {unpack_seconds / packed_jobs * 1e3:6.1f} ms")
+    print(f"raw      {raw_sizes / packed_jobs / 1024:8.0f} KiB/job")
+    print(f"png      {png_sizes / packed_jobs / 1024:8.0f} KiB/job  encode + decode {png_seconds / packed_jobs * 1e3:6.1f} ms "
+          f"(not used by the hand-off)")
+    # sanity check of the format itself on one payload
+    assert same_inputs(unpack_inputs(pack_inputs(expected["job-0"])), expected["job-0"])
+
+
+if __name__ == "__main__":
+    main()
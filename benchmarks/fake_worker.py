@@ -0,0 +1,47 @@
+"""
+Stand-in for main.py under `python supervisor.py --fake-devices 0,1`: no
+GPU, Redis or models. Prints the device binding it was given, then
+"processes" jobs with a made-up step time (slower on CPU), reporting them
+to VTON_METRICS_FILE like `ThroughputTracker`, and crashes now and then
+(VTON_FAKE_CRASH_RATE per job) so restarts and backoff can be watched.
+"""
+import os
+import random
+import sys
+import time
+
+from utils.metrics import METRICS_FILE, write_metrics
+
+CRASH_RATE = float(os.getenv("VTON_FAKE_CRASH_RATE", "0.05"))
+STEPS_PER_JOB = 50
+
+
+def main():
+    device = os.getenv("VTON_DEVICE", "cuda")
+    worker_id = os.getenv("VTON_WORKER_ID", f"fake-{os.getpid()}")
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else "all"
+    print(f"[{worker_id}] device={device} CUDA_VISIBLE_DEVICES={os.getenv('CUDA_VISIBLE_DEVICES')!r} "
+          f"threads={os.getenv('VTON_NUM_THREADS')} cpus={cpus}", flush=True)
+    rng = random.Random()
+    base = 0.002 if device == "cuda" else 0.02
+    seconds_per_step, jobs = None, 0
+    while True:
+        per_step = base * rng.uniform(0.8, 1.2)
+        time.sleep(per_step * STEPS_PER_JOB)
+        if rng.random() < CRASH_RATE:
+            print(f"[{worker_id}] simulated crash", flush=True)
+            sys.exit(1)
+        jobs += 1
+        seconds_per_step = per_step if seconds_per_step is None else 0.8 * seconds_per_step + 0.2 * per_step
+        if METRICS_FILE:
+            write_metrics(METRICS_FILE, {
+                "worker_id": worker_id,
+                "seconds_per_step": seconds_per_step,
+                "steps_per_job": STEPS_PER_JOB,
+                "jobs": jobs,
+                "updated_at": time.time(),
+            })
+
+
+if __name__ == "__main__":
+    main()
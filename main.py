@@ -7,15 +7,23 @@
 
 # main.py
 import json
-import os
-import tempfile
-import io
-import requests
+import time
+from functools import partial
 from validators import url
-from utils.redis import r, QUEUE_NAME
+from utils.redis import r, r_bytes, QUEUE_NAME
 from utils.postgresql import update_job_status
-from utils.cloudinary import upload_image_to_cloudinary
-from vton_model.app import vton
+from utils.cancellation import CancellationToken, JobCancelled
+from utils.admission import WORKER_ID, ThroughputTracker, job_expired, job_steps
+from utils.scheduler import PriorityScheduler
+from utils.fetch import ImageFetcher
+from utils.handoff import READY_QUEUE, InputStore, hand_off, take_inputs
+from utils.garment_cache import GarmentCache
+from utils.storage import get_storage_backend
+from utils.uploader import UploadExecutor
+from vton_model.app import vton, preprocess, prepare_garments, args
+from vton_model.model.checkpoint import Checkpointer, get_checkpoint_store
+from vton_model.model.preview import PreviewPublisher
+from vton_model.utils import resize_and_padding
 
 REQUIRED_FIELDS = [
     "id",
@@ -28,28 +36,11 @@ REQUIRED_FIELDS = [
     "show_type",
 ]
 
-CLOTH_TYPES = ["upper", "lower", "overall"]
+CLOTH_TYPES = ["upper", "lower", "overall", "outfit"]
 SHOW_TYPES = ["result only", "input & result", "input & mask & result"]
-
-# Synchronous image download (returns temp file path)
-def download_image_to_temp(url_str):
-    ext = os.path.splitext(url_str)[-1]
-    if ext.lower() not in [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"]:
-        ext = ".jpg"
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=ext)
-    try:
-        resp = requests.get(url_str, stream=True, timeout=30)
-        resp.raise_for_status()
-        with open(temp_file.name, "wb") as f:
-            for chunk in resp.iter_content(1024):
-                if not chunk:
-                    break
-                f.write(chunk)
-        return temp_file.name
-    except Exception as e:
-        temp_file.close()
-        os.unlink(temp_file.name)
-        raise e
+MODES = ["masked", "maskfree"]
+MAX_VARIATIONS = 4
+SAMPLERS = ["ddim", "lcm"]
 
 def validate_job(job_dict):
     for field in REQUIRED_FIELDS:
@@ -60,8 +51,25 @@ def validate_job(job_dict):
     if not url(job_dict["cloth_image_url"]):
         raise ValueError("cloth_image_url is not valid")
     if job_dict["cloth_type"] not in CLOTH_TYPES:
-        raise ValueError("cloth_type must be one of 'upper', 'lower', 'overall'")
-    if not (10 <= int(job_dict["num_inference_steps"]) <= 100):
+        raise ValueError("cloth_type must be one of 'upper', 'lower', 'overall', 'outfit'")
+    if job_dict["cloth_type"] == "outfit":
+        # upper garment in cloth_image_url, lower garment here; tried on together in one pass
+        if not url(job_dict.get("lower_cloth_image_url") or ""):
+            raise ValueError("lower_cloth_image_url is required for cloth_type 'outfit'")
+        if job_dict.get("mode", "masked") != "masked":
+            raise ValueError("cloth_type 'outfit' is only supported in 'masked' mode")
+    sampler = job_dict.get("sampler", "ddim")
+    if sampler not in SAMPLERS:
+        raise ValueError("sampler must be one of 'ddim', 'lcm'")
+    if sampler == "lcm":
+        # few-step distilled mode, only on workers started with VTON_LCM_LORA
+        if not args['lcm_lora']:
+            raise ValueError("sampler 'lcm' is not available on this worker")
+        if job_dict.get("mode", "masked") != "masked":
+            raise ValueError("sampler 'lcm' is only supported in 'masked' mode")
+        if not (1 <= int(job_dict["num_inference_steps"]) <= 8):
+            raise ValueError("num_inference_steps must be between 1 and 8 for sampler 'lcm'")
+    elif not (10 <= int(job_dict["num_inference_steps"]) <= 100):
         raise ValueError("num_inference_steps must be between 10 and 100")
     if not (0.1 <= float(job_dict["guidance_scale"]) <= 7.5):
         raise ValueError("guidance_scale must be between 0.1 and 7.5")
@@ -69,89 +77,296 @@ def validate_job(job_dict):
         raise ValueError("seed must be between -1 and 1000")
     if job_dict["show_type"] not in SHOW_TYPES:
         raise ValueError("show_type must be one of 'result only', 'input & result', 'input & mask & result'")
+    for field in ("enqueued_at", "deadline"):
+        # unix timestamps (seconds), set by the API when the job is queued
+        if job_dict.get(field) is not None:
+            try:
+                float(job_dict[field])
+            except (TypeError, ValueError):
+                raise ValueError(f"{field} must be a unix timestamp")
+    if job_dict.get("mask_url") and not url(job_dict["mask_url"]):
+        raise ValueError("mask_url is not valid")
+    if job_dict.get("mode", "masked") not in MODES:
+        raise ValueError("mode must be one of 'masked', 'maskfree'")
+    if job_dict.get("mask_url") and job_dict.get("mode", "masked") != "masked":
+        # the mask-free model repaints the garment region itself and takes no mask
+        raise ValueError("mask_url is only supported in 'masked' mode")
+    if not (1 <= int(job_dict.get("num_variations", 1)) <= MAX_VARIATIONS):
+        raise ValueError(f"num_variations must be between 1 and {MAX_VARIATIONS}")
+    if job_dict.get("init_result_url"):
+        # refinement of a previous "result only" output: only the last `strength` of the schedule runs
+        if not url(job_dict["init_result_url"]):
+            raise ValueError("init_result_url is not valid")
+        if not (0.0 < float(job_dict.get("strength", 1.0)) <= 1.0):
+            raise ValueError("strength must be between 0 and 1")
+        if job_dict.get("mode", "masked") != "masked":
+            raise ValueError("init_result_url is only supported in 'masked' mode")
+    if job_dict.get("full_resolution"):
+        # result composited onto the original upload; the side-by-side layouts stay low-res
+        if job_dict.get("mode", "masked") != "masked":
+            raise ValueError("full_resolution is only supported in 'masked' mode")
+        if job_dict["show_type"] != "result only":
+            raise ValueError("full_resolution requires show_type 'result only'")
+    if job_dict.get("roi_crop") and job_dict.get("mode", "masked") != "masked":
+        raise ValueError("roi_crop is only supported in 'masked' mode")
 
-def worker_loop():
+def on_upload_success(job_id, image_url):
+    update_job_status(job_id, "completed", image_url=image_url, update=True)
+    print(f"✅ Job {job_id} completed: {image_url}")
+
+def on_variations_success(job_id, image_urls):
+    # several results for one job: vton_image_url holds a JSON list, in seed order
+    update_job_status(job_id, "completed", image_url=json.dumps(image_urls), update=True)
+    print(f"✅ Job {job_id} completed: {len(image_urls)} variations")
+
+def on_upload_failure(job_id, error):
+    print(f"Error uploading result for job {job_id}: {error}")
+    update_job_status(job_id, "failed", update=True)
+
+def mark_cancelled(job_id):
+    print(f"🛑 Job {job_id} cancelled")
+    update_job_status(job_id, "cancelled", update=True)
+
+def acking(callback, scheduler, lease_id):
+    # upload callbacks reach the final status: only then the job may leave processing
+    def wrapped(job_id, value):
+        try:
+            callback(job_id, value)
+        finally:
+            scheduler.ack(lease_id)
+    return wrapped
+
+def make_fetchers():
+    fetcher = ImageFetcher()
+    size = (args['width'], args['height'])
+    garment_cache = GarmentCache(
+        fetcher,
+        partial(resize_and_padding, size=size),
+        variant=f"pad{size[0]}x{size[1]}",
+    )
+    return fetcher, garment_cache
+
+def download_images(job_dict, fetcher, garment_cache):
+    # concurrently, decoded from memory; garments via the local cache
+    mask_url = job_dict.get("mask_url")
+    init_url = job_dict.get("init_result_url")
+    person_future = fetcher.submit_images(
+        job_dict["person_image_url"], *([mask_url] if mask_url else []), *([init_url] if init_url else [])
+    )
+    images = {"cloth_image": garment_cache.get(job_dict["cloth_image_url"]), "lower_cloth_image": None}
+    if job_dict["cloth_type"] == "outfit":
+        images["lower_cloth_image"] = garment_cache.get(job_dict["lower_cloth_image_url"])
+    person_image, *extra_images = person_future.result()
+    images["person_image"] = person_image
+    images["mask_image"] = extra_images.pop(0) if mask_url else None
+    images["init_image"] = extra_images.pop(0) if init_url else None
+    return images
+
+def begin_job(scheduler, priority, raw, lease_id):
+    """Parse, validate and mark a claimed job "processing"; None (lease acked) when it must not run."""
+    try:
+        job_dict = json.loads(raw)
+    except ValueError as e:
+        print(f"Invalid job payload: {e}")
+        scheduler.ack(lease_id)
+        return None
+    job_id = job_dict.get("id")
+    retry = bool(job_dict.get("attempts"))
+    print(f"Processing {priority} job {job_id} ..." + (f" (attempt {job_dict['attempts'] + 1})" if retry else ""))
+    try:
+        validate_job(job_dict)
+    except Exception as e:
+        print(f"Validation error: {e}")
+        if job_id:
+            update_job_status(job_id, "failed")
+        scheduler.ack(lease_id)
+        return None
+    # Drop jobs the client has given up on before spending anything on them
+    if job_expired(job_dict):
+        print(f"⌛ Job {job_id} expired in the queue, skipping")
+        update_job_status(job_id, "expired")
+        scheduler.ack(lease_id)
+        return None
+    if job_dict.get("enqueued_at") is not None:
+        print(f"Job {job_id} waited {time.time() - float(job_dict['enqueued_at']):.1f}s in the queue")
+    # upsert: the row may exist (mask stage hand-off, a retry) or not (first attempt, or one preempted before its write)
+    update_job_status(job_id, "processing")
+    return job_dict
+
+def mask_loop():
+    """
+    VTON_STAGE=mask: download and parse (DensePose + SCHP, no diffusion
+    models loaded, fine on CPU nodes), then hand the compact inputs to the
+    diffusion stage through READY_QUEUE. Scales independently of it.
+    """
+    fetcher, garment_cache = make_fetchers()
+    inputs = InputStore(r_bytes)
+    scheduler = PriorityScheduler(r, QUEUE_NAME, WORKER_ID)
+    scheduler.leases.start()
+    ready = PriorityScheduler(r, READY_QUEUE, WORKER_ID)
     while True:
         try:
-            job_data = r.blpop(QUEUE_NAME, timeout=0)
+            job_data = scheduler.pop()
             if not job_data:
-                print("Empty Queue")
                 continue
-            _, raw = job_data
-            job_dict = json.loads(raw)
-            job_id = job_dict.get("id")
-            print(f"Processing job {job_id} ...")
+            priority, _, lease_id = job_data
+            job_dict = begin_job(scheduler, *job_data)
+            if job_dict is None:
+                continue
+            job_id = job_dict["id"]
+            token = CancellationToken(job_id)
             try:
-                validate_job(job_dict)
+                prepared = None
+                # full_resolution composites onto the original photo: the diffusion stage fetches it itself
+                if not job_dict.get("full_resolution"):
+                    token.check()
+                    images = download_images(job_dict, fetcher, garment_cache)
+                    prepared = preprocess(
+                        images["person_image"],
+                        images["cloth_image"],
+                        job_dict["cloth_type"],
+                        mode=job_dict.get("mode", "masked"),
+                        mask=images["mask_image"],
+                        lower_cloth_image=images["lower_cloth_image"],
+                        init_image=images["init_image"],
+                        cancel_check=token.check,
+                    )
+                token.check()
+                size = hand_off(job_dict, priority, prepared, ready, inputs)
+            except JobCancelled:
+                mark_cancelled(job_id)
+                scheduler.ack(lease_id)
+                continue
             except Exception as e:
-                print(f"Validation error: {e}")
-                if job_id:
-                    update_job_status(job_id, "failed")
+                print(f"Error preparing inputs: {e}")
+                update_job_status(job_id, "failed", update=True)
+                scheduler.ack(lease_id)
                 continue
-            update_job_status(job_id, "processing")
+            print(f"🎭 Job {job_id} handed to {READY_QUEUE} ({size / 1024:.0f} KiB of inputs)")
+            scheduler.ack(lease_id)
+        except Exception as e:
+            print(f"❌ Worker error: {e}")
 
-            # Download images
-            try:
-                person_path = download_image_to_temp(job_dict["person_image_url"])
-            except Exception as e:
-                print(f"Error downloading person_image_url: {e}")
-                update_job_status(job_id, "failed")
+def worker_loop():
+    fetcher, garment_cache = make_fetchers()
+    inputs = InputStore(r_bytes)
+    uploader = UploadExecutor(get_storage_backend())
+    previews = PreviewPublisher(r)
+    checkpointer = Checkpointer(get_checkpoint_store(r_bytes))
+    throughput = ThroughputTracker()
+    # VTON_STAGE=diffusion: jobs come from the mask stage with their inputs prepared
+    scheduler = PriorityScheduler(r, READY_QUEUE if args['stage'] == 'diffusion' else QUEUE_NAME, WORKER_ID)
+    queues = [scheduler]
+    if args['stage'] == 'diffusion':
+        # jobs still waiting for the mask stage count towards the estimated wait too
+        queues.append(PriorityScheduler(r, QUEUE_NAME, WORKER_ID))
+    # heartbeats for our leases + requeueing jobs of workers that died or were preempted
+    scheduler.leases.start()
+    while True:
+        try:
+            # priority classes with weighted fair selection, cheapest/oldest job first inside a class
+            job_data = scheduler.pop()
+            if not job_data:
+                continue
+            lease_id = job_data[2]
+            job_dict = begin_job(scheduler, *job_data)
+            if job_dict is None:
                 continue
+            job_id = job_dict["id"]
+            retry = bool(job_dict.get("attempts"))
+            started = time.monotonic()
+            # checked between stages and at every denoising step (throttled)
+            token = CancellationToken(job_id)
+
+            # Inputs prepared by the mask stage, or download images ourselves
             try:
-                cloth_path = download_image_to_temp(job_dict["cloth_image_url"])
+                token.check()
+                prepared = take_inputs(job_dict, inputs)
+                if prepared is None:
+                    images = download_images(job_dict, fetcher, garment_cache)
+                else:
+                    # garments are not in the payload: same cache + resize as the mask stage
+                    images = {}
+                    lower_cloth_image = None
+                    if job_dict["cloth_type"] == "outfit":
+                        lower_cloth_image = garment_cache.get(job_dict["lower_cloth_image_url"])
+                    prepared["cloth_images"] = prepare_garments(
+                        garment_cache.get(job_dict["cloth_image_url"]), job_dict["cloth_type"], lower_cloth_image
+                    )
+            except JobCancelled:
+                mark_cancelled(job_id)
+                scheduler.ack(lease_id)
+                continue
             except Exception as e:
-                print(f"Error downloading cloth_image_url: {e}")
-                update_job_status(job_id, "failed")
-                os.unlink(person_path)
+                print(f"Error downloading images: {e}")
+                update_job_status(job_id, "failed", update=True)
+                scheduler.ack(lease_id)
                 continue
 
-            # Run VTON model
+            # Run VTON model (a requeued job continues from its last snapshot, if any)
+            preview_callback = previews.callback(job_id)
+            resume_state = checkpointer.load(job_id) if retry else None
+
+            def on_step(step, num_steps, latents):
+                token.check()
+                preview_callback(step, num_steps, latents)
+
             try:
                 result_image = vton(
-                    person_path,
-                    cloth_path,
+                    images.get("person_image"),
+                    images.get("cloth_image"),
                     job_dict["cloth_type"],
                     int(job_dict["num_inference_steps"]),
                     float(job_dict["guidance_scale"]),
                     int(job_dict["seed"]),
-                    job_dict["show_type"]
+                    job_dict["show_type"],
+                    mode=job_dict.get("mode", "masked"),
+                    mask=images.get("mask_image"),
+                    lower_cloth_image=images.get("lower_cloth_image"),
+                    num_variations=int(job_dict.get("num_variations", 1)),
+                    init_image=images.get("init_image"),
+                    strength=float(job_dict.get("strength", 1.0)) if job_dict.get("init_result_url") else 1.0,
+                    full_resolution=bool(job_dict.get("full_resolution", False)),
+                    roi_crop=bool(job_dict.get("roi_crop", False)),
+                    use_lcm=job_dict.get("sampler", "ddim") == "lcm",
+                    callback=on_step,
+                    cancel_check=token.check,
+                    resume_state=resume_state,
+                    checkpoint_callback=checkpointer.callback(job_id),
+                    prepared=prepared,
                 )
+                token.check()
+                previews.finish(job_id)
+                throughput.record(time.monotonic() - started, job_steps(job_dict))
+                throughput.publish(sum(queue.depth() for queue in queues))
+            except JobCancelled:
+                mark_cancelled(job_id)
+                scheduler.ack(lease_id)
+                continue
             except Exception as e:
                 print(f"Error running VTON model: {e}")
-                update_job_status(job_id, "failed")
-                os.unlink(person_path)
-                os.unlink(cloth_path)
+                update_job_status(job_id, "failed", update=True)
+                scheduler.ack(lease_id)
                 continue
+            finally:
+                # the snapshot is only useful while the job can still be requeued mid-denoise
+                checkpointer.clear(job_id)
+                if job_dict.get("inputs_key"):
+                    # a retry after this point preprocesses locally (see take_inputs)
+                    inputs.delete(job_dict["inputs_key"])
 
-            # Save result image to bytes
-            buffer = io.BytesIO()
-            try:
-                result_image.save(buffer, format="PNG")
-                buffer.seek(0)
-                image_bytes = buffer.read()
-            except Exception as e:
-                print(f"Error saving result image: {e}")
-                update_job_status(job_id, "failed")
-                os.unlink(person_path)
-                os.unlink(cloth_path)
-                continue
-            try:
-                image_url = upload_image_to_cloudinary(image_bytes)
-            except Exception as e:
-                print(f"Error uploading to Cloudinary: {e}")
-                update_job_status(job_id, "failed")
-                os.unlink(person_path)
-                os.unlink(cloth_path)
-                continue
-            # Update job status
-            update_job_status(job_id, "completed", image_url=image_url, update=True)
-            print(f"✅ Job {job_id} completed: {image_url}")
-            # Cleanup
-            os.unlink(person_path)
-            os.unlink(cloth_path)
+            # Encode + upload in the background; completion is marked (and the lease acked) by the upload callback
+            on_failure = acking(on_upload_failure, scheduler, lease_id)
+            if isinstance(result_image, list):
+                uploader.submit_many(job_id, result_image, acking(on_variations_success, scheduler, lease_id), on_failure)
+            else:
+                uploader.submit(job_id, result_image, acking(on_upload_success, scheduler, lease_id), on_failure)
         except Exception as e:
+            # the lease is left to expire: the reaper requeues the job (dead-lettered after VTON_MAX_ATTEMPTS)
             print(f"❌ Worker error: {e}")
-            # Optionally: add retry logic or DLQ
 
 if __name__ == "__main__":
-    worker_loop()
+    if args['stage'] == 'mask':
+        mask_loop()
+    else:
+        worker_loop()
@@ -0,0 +1,267 @@
+# supervisor.py
+"""
+Runs one worker process (main.py) per GPU, or N CPU workers, restarts
+crashed workers with exponential backoff and aggregates their metrics.
+
+    python supervisor.py                        # one worker per visible GPU
+    python supervisor.py --devices 0,1          # explicit GPU list
+    python supervisor.py --cpu-workers 4        # CPU-only workers
+    python supervisor.py --fake-devices 0,1,2   # local test: stand-in workers, no GPU/Redis/models
+
+Each worker sees exactly one GPU (CUDA_VISIBLE_DEVICES, VTON_DEVICE=cuda)
+or none (VTON_DEVICE=cpu), gets its own slice of the CPU cores (affinity,
+OMP/MKL/torch thread counts) and a stable VTON_WORKER_ID, and writes its
+throughput to VTON_METRICS_DIR/<worker>.json, which the supervisor sums up
+into VTON_METRICS_DIR/supervisor.json every report interval.
+"""
+import argparse
+import os
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import time
+from dotenv import load_dotenv
+
+from utils.metrics import read_metrics, write_metrics
+
+load_dotenv()
+
+METRICS_DIR = os.getenv("VTON_METRICS_DIR", "resource/metrics")
+THREADS_PER_WORKER = int(os.getenv("VTON_THREADS_PER_WORKER", "0"))  # 0 = the worker's share of the cores
+RESTART_BACKOFF = float(os.getenv("VTON_RESTART_BACKOFF", "1"))
+RESTART_BACKOFF_MAX = float(os.getenv("VTON_RESTART_BACKOFF_MAX", "60"))
+# a worker that ran this long before exiting starts over at the initial backoff
+STABLE_AFTER = float(os.getenv("VTON_STABLE_AFTER", "300"))
+REPORT_INTERVAL = float(os.getenv("VTON_REPORT_INTERVAL", "30"))
+SHUTDOWN_GRACE = float(os.getenv("VTON_SHUTDOWN_GRACE", "30"))
+METRICS_STALE_AFTER = float(os.getenv("VTON_WORKER_STATS_TTL", "120"))
+
+
+def visible_gpus():
+    """GPU indices from CUDA_VISIBLE_DEVICES, else from nvidia-smi, else []."""
+    visible = os.getenv("CUDA_VISIBLE_DEVICES")
+    if visible is not None:
+        return [d.strip() for d in visible.split(",") if d.strip() and d.strip() != "-1"]
+    try:
+        out = subprocess.run(
+            ["nvidia-smi", "--query-gpu=index", "--format=csv,noheader"],
+            capture_output=True, text=True, timeout=10, check=True,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return []
+    return [line.strip() for line in out.splitlines() if line.strip()]
+
+
+def split_cpus(n):
+    """Partition the cores this process may use into `n` contiguous slices (None without affinity support)."""
+    if not hasattr(os, "sched_getaffinity"):
+        return [None] * n
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < n:
+        return [set(cpus)] * n
+    size = len(cpus) // n
+    return [set(cpus[i * size:(i + 1) * size]) for i in range(n)]
+
+
+class Worker:
+    """One supervised worker process and its restart state."""
+
+    def __init__(self, name, command, env, cpus, metrics_path):
+        self.name = name
+        self.command = command
+        self.env = env
+        self.cpus = cpus
+        self.metrics_path = metrics_path
+        self.proc = None
+        self.started_at = None
+        self.next_start = 0.0
+        self.failures = 0
+        self.restarts = 0
+        self.jobs_before_restart = 0
+        self.last_exit = None
+
+    def start(self):
+        # a fresh metrics file per incarnation; jobs of earlier ones are kept in jobs_before_restart
+        self.drop_metrics()
+        preexec = (lambda: os.sched_setaffinity(0, self.cpus)) if self.cpus else None
+        self.proc = subprocess.Popen(self.command, env=self.env, preexec_fn=preexec)
+        self.started_at = time.monotonic()
+        print(f"▶️ Started {self.name} (pid {self.proc.pid})")
+
+    def check(self, now):
+        """Restart bookkeeping after an exit; returns True when the worker just died."""
+        code = self.proc.poll()
+        if code is None:
+            return False
+        uptime = now - self.started_at
+        self.failures = 0 if uptime >= STABLE_AFTER else self.failures + 1
+        delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF * 2 ** max(0, self.failures - 1))
+        # move the dead incarnation's count over in one go, so `aggregate` never sees it twice
+        self.jobs_before_restart += (self.metrics() or {}).get("jobs", 0)
+        self.drop_metrics()
+        self.last_exit = code
+        self.proc = None
+        self.next_start = now + delay
+        self.restarts += 1
+        print(f"❌ {self.name} exited with {code} after {uptime:.0f}s, restarting in {delay:.0f}s")
+        return True
+
+    def metrics(self):
+        return read_metrics(self.metrics_path)
+
+    def drop_metrics(self):
+        try:
+            os.remove(self.metrics_path)
+        except FileNotFoundError:
+            pass
+
+    def stop(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+
+
+def build_workers(args):
+    os.makedirs(args.metrics_dir, exist_ok=True)
+    host = socket.gethostname()
+    if args.worker_cmd:
+        command = shlex.split(args.worker_cmd)
+    elif args.fake_devices is not None:
+        command = [sys.executable, "-m", "benchmarks.fake_worker"]
+    else:
+        command = [sys.executable, "main.py"]
+
+    if args.cpu_workers:
+        slots = [("cpu", None)] * args.cpu_workers
+    else:
+        devices = args.fake_devices if args.fake_devices is not None else args.devices
+        devices = [d for d in devices.split(",") if d] if devices else visible_gpus()
+        if not devices:
+            raise SystemExit("No GPUs found; use --cpu-workers N, or --fake-devices for a local test")
+        slots = [("cuda", device) for device in devices]
+
+    workers = []
+    for i, ((device, index), cpus) in enumerate(zip(slots, split_cpus(len(slots)))):
+        name = f"{host}-gpu{index}" if device == "cuda" else f"{host}-cpu{i}"
+        threads = args.threads or (len(cpus) if cpus else os.cpu_count() // len(slots)) or 1
+        metrics_path = os.path.join(args.metrics_dir, f"{name}.json")
+        env = dict(
+            os.environ,
+            CUDA_VISIBLE_DEVICES=index if device == "cuda" else "",
+            VTON_DEVICE=device,
+            VTON_WORKER_ID=name,
+            VTON_NUM_THREADS=str(threads),
+            OMP_NUM_THREADS=str(threads),
+            MKL_NUM_THREADS=str(threads),
+            VTON_METRICS_FILE=metrics_path,
+        )
+        workers.append(Worker(name, command, env, cpus, metrics_path))
+        print(f"{name}: VTON_DEVICE={device} CUDA_VISIBLE_DEVICES={env['CUDA_VISIBLE_DEVICES']!r} "
+              f"threads={threads} cpus={sorted(cpus) if cpus else 'all'}")
+    return workers
+
+
+def aggregate(workers, now=None):
+    """Fleet summary: per-worker state plus total steps/s and jobs over live reports."""
+    now = now or time.time()
+    rows, steps_per_second, jobs = [], 0.0, 0
+    for worker in workers:
+        metrics = worker.metrics() or {}
+        fresh = bool(metrics) and now - metrics.get("updated_at", 0) <= METRICS_STALE_AFTER
+        worker_jobs = worker.jobs_before_restart + metrics.get("jobs", 0)
+        jobs += worker_jobs
+        if worker.proc is not None and fresh and metrics.get("seconds_per_step"):
+            steps_per_second += 1.0 / metrics["seconds_per_step"]
+        rows.append({
+            "worker": worker.name,
+            "running": worker.proc is not None,
+            "pid": worker.proc.pid if worker.proc is not None else None,
+            "restarts": worker.restarts,
+            "last_exit": worker.last_exit,
+            "jobs": worker_jobs,
+            "seconds_per_step": metrics.get("seconds_per_step") if fresh else None,
+        })
+    return {
+        "updated_at": now,
+        "workers": rows,
+        "running": sum(row["running"] for row in rows),
+        "steps_per_second": steps_per_second,
+        "jobs": jobs,
+    }
+
+
+def report(summary, metrics_dir):
+    write_metrics(os.path.join(metrics_dir, "supervisor.json"), summary)
+    print(f"📊 {summary['running']}/{len(summary['workers'])} workers up, "
+          f"{summary['steps_per_second']:.2f} steps/s, {summary['jobs']} jobs")
+    for row in summary["workers"]:
+        sps = f"{row['seconds_per_step']:.3f}" if row["seconds_per_step"] else "-"
+        print(f"   {row['worker']:<24} {'up' if row['running'] else 'down':<5} "
+              f"restarts={row['restarts']:<3} jobs={row['jobs']:<5} s/step={sps}")
+
+
+def supervise(workers, metrics_dir, report_interval=REPORT_INTERVAL, duration=None):
+    stopping = []
+
+    def on_signal(signum, _):
+        print(f"Received signal {signum}, stopping workers ...")
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    started = time.monotonic()
+    next_report = started + report_interval
+    while not stopping and (duration is None or time.monotonic() - started < duration):
+        now = time.monotonic()
+        for worker in workers:
+            if worker.proc is None:
+                if now >= worker.next_start:
+                    worker.start()
+            else:
+                worker.check(now)
+        if now >= next_report:
+            report(aggregate(workers), metrics_dir)
+            next_report = now + report_interval
+        time.sleep(0.5)
+
+    # SIGTERM first: a worker killed mid-job leaves its lease to the reaper, so nothing is lost
+    for worker in workers:
+        worker.stop()
+    deadline = time.monotonic() + SHUTDOWN_GRACE
+    for worker in workers:
+        if worker.proc is None:
+            continue
+        try:
+            worker.proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            worker.proc.kill()
+            worker.proc.wait()
+    for worker in workers:
+        worker.proc = None
+    summary = aggregate(workers)
+    report(summary, metrics_dir)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", default=os.getenv("VTON_SUPERVISOR_DEVICES", ""),
+                        help="comma separated GPU indices (default: all visible)")
+    parser.add_argument("--cpu-workers", type=int, default=int(os.getenv("VTON_CPU_WORKERS", "0")))
+    parser.add_argument("--fake-devices", default=None,
+                        help="comma separated device names; runs benchmarks.fake_worker instead of main.py")
+    parser.add_argument("--worker-cmd", default=None, help="override the worker command")
+    parser.add_argument("--threads", type=int, default=THREADS_PER_WORKER)
+    parser.add_argument("--metrics-dir", default=METRICS_DIR)
+    parser.add_argument("--report-interval", type=float, default=REPORT_INTERVAL)
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    args = parser.parse_args()
+
+    workers = build_workers(args)
+    supervise(workers, args.metrics_dir, args.report_interval, args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import json
+import os
+import socket
+import time
+from dotenv import load_dotenv
+
+from utils.metrics import METRICS_FILE, write_metrics
+from utils.redis import r
+
+load_dotenv()
+
+WORKER_ID = os.getenv("VTON_WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+WORKER_STATS_KEY = os.getenv("VTON_WORKER_STATS_KEY", "vton:workers")
+ESTIMATED_WAIT_KEY = os.getenv("VTON_ESTIMATED_WAIT_KEY", "vton:estimated_wait")
+WORKER_STATS_TTL = float(os.getenv("VTON_WORKER_STATS_TTL", "120"))
+# jobs without a deadline are dropped after waiting this long in the queue (0 = never)
+MAX_QUEUE_AGE = float(os.getenv("VTON_MAX_QUEUE_AGE", "0"))
+
+
+def job_steps(job_dict):
+    """Denoising steps a job costs (variations share the batch, but each one adds a slot)."""
+    return int(job_dict.get("num_inference_steps", 50)) * int(job_dict.get("num_variations", 1))
+
+
+def job_expired(job_dict, now=None):
+    """
+    True once the job's `deadline` (unix seconds) has passed, or it has been
+    queued since `enqueued_at` for longer than VTON_MAX_QUEUE_AGE.
+    """
+    now = now or time.time()
+    deadline = job_dict.get("deadline")
+    if deadline is not None:
+        return float(deadline) < now
+    enqueued_at = job_dict.get("enqueued_at")
+    return bool(MAX_QUEUE_AGE and enqueued_at is not None and now - float(enqueued_at) > MAX_QUEUE_AGE)
+
+
+class ThroughputTracker:
+    """
+    Per-worker moving average of seconds per denoising step (whole job wall
+    time, so download/parsing/upload overhead is included) and of steps per
+    job, published to the WORKER_STATS_KEY hash for `estimated_wait` (and
+    to VTON_METRICS_FILE when running under supervisor.py).
+    """
+
+    def __init__(self, worker_id=WORKER_ID, alpha=0.2):
+        self.worker_id = worker_id
+        self.alpha = alpha
+        self.seconds_per_step = None
+        self.steps_per_job = None
+        self.jobs = 0
+
+    def _average(self, current, value):
+        return value if current is None else (1 - self.alpha) * current + self.alpha * value
+
+    def record(self, seconds, steps):
+        if steps <= 0:
+            return
+        self.seconds_per_step = self._average(self.seconds_per_step, seconds / steps)
+        self.steps_per_job = self._average(self.steps_per_job, steps)
+        self.jobs += 1
+
+    def publish(self, queue_depth):
+        """Store this worker's throughput and refresh the fleet-wide wait estimate."""
+        if self.seconds_per_step is None:
+            return None
+        entry = {
+            "seconds_per_step": self.seconds_per_step,
+            "steps_per_job": self.steps_per_job,
+            "updated_at": time.time(),
+        }
+        try:
+            if METRICS_FILE:
+                write_metrics(METRICS_FILE, dict(entry, worker_id=self.worker_id, jobs=self.jobs, queue_depth=queue_depth))
+            r.hset(WORKER_STATS_KEY, self.worker_id, json.dumps(entry))
+            wait = estimated_wait(queue_depth)
+            if wait is not None:
+                r.set(ESTIMATED_WAIT_KEY, round(wait, 1), ex=int(WORKER_STATS_TTL))
+            return wait
+        except Exception as e:
+            print(f"Error publishing throughput: {e}")
+            return None
+
+
+def worker_stats(now=None):
+    """Throughput of workers that reported within WORKER_STATS_TTL seconds."""
+    now = now or time.time()
+    stats = []
+    for raw in r.hvals(WORKER_STATS_KEY):
+        entry = json.loads(raw)
+        if now - entry["updated_at"] <= WORKER_STATS_TTL:
+            stats.append(entry)
+    return stats
+
+
+def estimated_wait(queue_depth, extra_steps=0, stats=None):
+    """
+    Seconds until `queue_depth` queued jobs (plus `extra_steps` of a new
+    job) are done on the live workers, or None when no worker has reported.
+    """
+    stats = worker_stats() if stats is None else stats
+    if not stats:
+        return None
+    steps_per_second = sum(1.0 / s["seconds_per_step"] for s in stats)
+    steps_per_job = sum(s["steps_per_job"] for s in stats) / len(stats)
+    return (queue_depth * steps_per_job + extra_steps) / steps_per_second
+
+
+def admit(job_dict, queue_depth, now=None, stats=None):
+    """
+    Admission check for the API before enqueueing: returns (accepted,
+    estimated_seconds_until_done). A job with a `deadline` is refused when
+    it would not finish in time; without a deadline it is always accepted.
+    """
+    now = now or time.time()
+    wait = estimated_wait(queue_depth, job_steps(job_dict), stats=stats)
+    deadline = job_dict.get("deadline")
+    if deadline is None or wait is None:
+        return True, wait
+    return now + wait <= float(deadline), wait
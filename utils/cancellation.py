@@ -0,0 +1,49 @@
+import os
+import time
+from dotenv import load_dotenv
+
+from utils.redis import r
+
+load_dotenv()
+
+CANCEL_KEY_PREFIX = os.getenv("VTON_CANCEL_KEY_PREFIX", "vton:cancel:")
+CANCEL_KEY_TTL = int(os.getenv("VTON_CANCEL_KEY_TTL", "3600"))
+CANCEL_CHECK_INTERVAL = float(os.getenv("VTON_CANCEL_CHECK_INTERVAL", "0.25"))
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def request_cancel(job_id, ttl=CANCEL_KEY_TTL):
+    """Cancellation API: any process with Redis access can call this (or SET the key itself)."""
+    r.set(CANCEL_KEY_PREFIX + str(job_id), 1, ex=ttl)
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation for one job. `check()` raises `JobCancelled`
+    once `request_cancel(job_id)` was called; the worker calls it between
+    stages and from the per-step pipeline callback. Redis is asked at most
+    once per `check_interval` seconds, so checking every step is free.
+    """
+
+    def __init__(self, job_id, check_interval=CANCEL_CHECK_INTERVAL):
+        self.key = CANCEL_KEY_PREFIX + str(job_id)
+        self.check_interval = check_interval
+        self.cancelled = False
+        self._last_check = 0.0
+
+    def check(self, *_):
+        if not self.cancelled:
+            now = time.monotonic()
+            if now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            try:
+                self.cancelled = bool(r.exists(self.key))
+            except Exception as e:
+                # a Redis hiccup must not fail the job; try again on the next check
+                print(f"Cancellation check failed: {e}")
+        if self.cancelled:
+            raise JobCancelled(self.key)
@@ -0,0 +1,116 @@
+import asyncio
+import io
+import os
+import threading
+import aiohttp
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "16"))
+FETCH_CHUNK_SIZE = int(os.getenv("FETCH_CHUNK_SIZE", str(1 << 20)))
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(25 << 20)))
+FETCH_MAX_PIXELS = int(os.getenv("FETCH_MAX_PIXELS", "50000000"))
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "30"))
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class ImageFetcher:
+    """
+    Downloads images over one shared keep-alive aiohttp session.
+
+    The session lives on a private event loop running in a daemon thread, so
+    the synchronous worker can call `fetch_images(url_a, url_b)` and have the
+    downloads run concurrently. Bodies are read into memory (no temp files)
+    and rejected once they exceed `max_bytes`; the image header is then
+    checked against `max_pixels` before anything is decoded.
+    """
+
+    def __init__(
+        self,
+        max_connections=FETCH_MAX_CONNECTIONS,
+        chunk_size=FETCH_CHUNK_SIZE,
+        max_bytes=FETCH_MAX_BYTES,
+        max_pixels=FETCH_MAX_PIXELS,
+        timeout=FETCH_TIMEOUT,
+    ):
+        self.max_connections = max_connections
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fetch", daemon=True)
+        self._thread.start()
+        self._session = self._run(self._create_session())
+
+    async def _create_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            keepalive_timeout=60,
+            ttl_dns_cache=300,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _read(self, url, headers=None):
+        async with self._session.get(url, headers=headers) as resp:
+            if resp.status == 304:
+                return resp.status, None, resp.headers
+            resp.raise_for_status()
+            if resp.content_length is not None and resp.content_length > self.max_bytes:
+                raise ImageTooLarge(f"{resp.content_length} bytes exceeds limit of {self.max_bytes}")
+            data = bytearray()
+            async for chunk in resp.content.iter_chunked(self.chunk_size):
+                data += chunk
+                if len(data) > self.max_bytes:
+                    raise ImageTooLarge(f"body exceeds limit of {self.max_bytes} bytes")
+            return resp.status, bytes(data), resp.headers
+
+    async def _fetch_images(self, urls):
+        results = await asyncio.gather(*(self._read(u) for u in urls), return_exceptions=True)
+        for url, result in zip(urls, results):
+            if isinstance(result, BaseException):
+                raise ValueError(f"Error downloading {url}: {result}") from result
+        return [self.open_image(data) for _, data, _ in results]
+
+    def open_image(self, data):
+        # Image.open only parses the header; pixels are decoded on first use
+        image = Image.open(io.BytesIO(data))
+        w, h = image.size
+        if w * h > self.max_pixels:
+            raise ImageTooLarge(f"{w}x{h} exceeds limit of {self.max_pixels} pixels")
+        return image
+
+    def submit_images(self, *urls):
+        """Start downloading `urls` concurrently; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(self._fetch_images(urls), self._loop)
+
+    def fetch_images(self, *urls):
+        return self.submit_images(*urls).result()
+
+    def fetch_conditional(self, url, etag=None, last_modified=None):
+        """
+        GET `url` with If-None-Match / If-Modified-Since validators.
+        Returns (status, body, headers); body is None on 304 Not Modified.
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return self._run(self._read(url, headers=headers))
+
+    def close(self):
+        self._run(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
@@ -0,0 +1,184 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GARMENT_CACHE_DIR = os.getenv("GARMENT_CACHE_DIR") or os.path.expanduser("~/.cache/vton/garments")
+GARMENT_CACHE_MAX_BYTES = int(os.getenv("GARMENT_CACHE_MAX_BYTES", str(2 << 30)))
+GARMENT_CACHE_REVALIDATE_AFTER = float(os.getenv("GARMENT_CACHE_REVALIDATE_AFTER", "300"))
+
+
+def _atomic_write(path, write_fn):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_fn(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _digest(object_path):
+    # objects/<digest>-<variant>.npy
+    return os.path.basename(object_path).split("-", 1)[0]
+
+
+class GarmentCache:
+    """
+    Host-local cache of preprocessed garment images, shared by every worker
+    process on the machine.
+
+    Layout under `root`:
+        index/<sha256(url)>.json    validators (ETag / Last-Modified) and content digest
+        objects/<digest>-<variant>.npy   decoded uint8 RGB after `transform`
+
+    Objects are keyed by the sha256 of the downloaded bytes, so catalog URLs
+    pointing at identical files share one entry. Entries are revalidated with
+    a conditional GET once older than `revalidate_after` seconds. All writes go
+    through a temp file + os.replace, and eviction (least recently used first,
+    down to 90% of `max_bytes`) runs under an flock, so concurrent workers
+    never see partial files; a reader racing an eviction just misses. Index
+    entries whose digest has no object left are removed in the same pass.
+    """
+
+    def __init__(
+        self,
+        fetcher,
+        transform,
+        variant,
+        root=GARMENT_CACHE_DIR,
+        max_bytes=GARMENT_CACHE_MAX_BYTES,
+        revalidate_after=GARMENT_CACHE_REVALIDATE_AFTER,
+    ):
+        self.fetcher = fetcher
+        self.transform = transform
+        self.variant = variant
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.index_dir = os.path.join(root, "index")
+        self.objects_dir = os.path.join(root, "objects")
+        self.lock_path = os.path.join(root, ".lock")
+        os.makedirs(self.index_dir, exist_ok=True)
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def _index_path(self, url):
+        return os.path.join(self.index_dir, hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, f"{digest}-{self.variant}.npy")
+
+    def _read_index(self, url):
+        try:
+            with open(self._index_path(url), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_index(self, url, entry):
+        _atomic_write(self._index_path(url), lambda f: f.write(json.dumps(entry).encode()))
+
+    def _load_object(self, digest):
+        path = self._object_path(digest)
+        try:
+            array = np.load(path)
+            os.utime(path)  # LRU bookkeeping
+        except (FileNotFoundError, ValueError):
+            return None
+        return Image.fromarray(array)
+
+    def get(self, url):
+        entry = self._read_index(url)
+        if entry is not None:
+            image = self._load_object(entry["digest"])
+            if image is not None:
+                if time.time() - entry["checked_at"] < self.revalidate_after:
+                    return image
+                status, data, headers = self.fetcher.fetch_conditional(
+                    url, entry.get("etag"), entry.get("last_modified")
+                )
+                if status == 304:
+                    entry["checked_at"] = time.time()
+                    self._write_index(url, entry)
+                    return image
+                return self._store(url, data, headers)
+        _, data, headers = self.fetcher.fetch_conditional(url)
+        return self._store(url, data, headers)
+
+    def _store(self, url, data, headers):
+        digest = hashlib.sha256(data).hexdigest()
+        image = self._load_object(digest)
+        if image is None:
+            image = self.transform(self.fetcher.open_image(data).convert("RGB"))
+            array = np.asarray(image, dtype=np.uint8)
+            _atomic_write(self._object_path(digest), lambda f: np.save(f, array))
+            self._evict()
+        self._write_index(url, {
+            "url": url,
+            "digest": digest,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "checked_at": time.time(),
+        })
+        return image
+
+    def _evict_index(self, evicted, remaining):
+        """Drop index entries pointing at digests evicted in every variant (caller holds the lock)."""
+        gone = evicted - remaining
+        if not gone:
+            return
+        for entry in os.scandir(self.index_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path, "r") as f:
+                    digest = json.load(f).get("digest")
+            except (FileNotFoundError, ValueError):
+                continue
+            if digest in gone:
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _evict(self):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                objects = []
+                for entry in os.scandir(self.objects_dir):
+                    if not entry.name.endswith(".npy"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    objects.append((stat.st_mtime, stat.st_size, entry.path))
+                total = sum(size for _, size, _ in objects)
+                if total <= self.max_bytes:
+                    return
+                target = self.max_bytes * 0.9
+                evicted = set()
+                for _, size, path in sorted(objects):
+                    if total <= target:
+                        break
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                    evicted.add(path)
+                    total -= size
+                self._evict_index(
+                    {_digest(path) for path in evicted},
+                    {_digest(path) for _, _, path in objects if path not in evicted},
+                )
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LEASE_TTL = float(os.getenv("VTON_LEASE_TTL", "60"))
+HEARTBEAT_INTERVAL = float(os.getenv("VTON_HEARTBEAT_INTERVAL", "10"))
+REAP_INTERVAL = float(os.getenv("VTON_REAP_INTERVAL", "15"))
+MAX_ATTEMPTS = int(os.getenv("VTON_MAX_ATTEMPTS", "3"))
+
+# KEYS: processing hash, leases zset, legacy list, class zsets (in pick order)
+# ARGV: lease id, worker id, lease ttl, class zset for legacy jobs
+CLAIM_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local key, raw, score
+for i = 4, #KEYS do
+    local popped = redis.call('ZPOPMIN', KEYS[i])
+    if popped[1] then
+        key, raw, score = KEYS[i], popped[1], popped[2]
+        break
+    end
+end
+if not raw then
+    raw = redis.call('LPOP', KEYS[3])
+    if not raw then
+        return nil
+    end
+    key, score = ARGV[4], tostring(now)
+end
+redis.call('HSET', KEYS[1], ARGV[1], cjson.encode({job = raw, key = key, score = score, worker = ARGV[2], claimed_at = now}))
+redis.call('ZADD', KEYS[2], now + tonumber(ARGV[3]), ARGV[1])
+return {key, raw}
+"""
+
+# KEYS: processing hash, leases zset, dead-letter list, queue zsets (the first one
+#       takes jobs whose recorded queue isn't among them, e.g. a removed class)
+# ARGV: max attempts, max leases per call
+REAP_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local queues = {}
+for i = 4, #KEYS do
+    queues[KEYS[i]] = true
+end
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now, 'LIMIT', 0, tonumber(ARGV[2]))
+local requeued, dead = 0, 0
+for _, lease in ipairs(expired) do
+    local record = redis.call('HGET', KEYS[1], lease)
+    redis.call('ZREM', KEYS[2], lease)
+    redis.call('HDEL', KEYS[1], lease)
+    if record then
+        record = cjson.decode(record)
+        -- unparseable payloads can't carry an attempt count: dead-letter them right away
+        local attempts = tonumber(ARGV[1]) + 1
+        local ok, job = pcall(cjson.decode, record.job)
+        if ok and type(job) == 'table' then
+            attempts = (tonumber(job.attempts) or 0) + 1
+            job.attempts = attempts
+            record.job = cjson.encode(job)
+        end
+        if attempts > tonumber(ARGV[1]) then
+            redis.call('RPUSH', KEYS[3], record.job)
+            dead = dead + 1
+        else
+            local key = queues[record.key] and record.key or KEYS[4]
+            redis.call('ZADD', key, record.score, record.job)
+            requeued = requeued + 1
+        end
+    end
+end
+return {requeued, dead}
+"""
+
+# KEYS: leases zset
+# ARGV: lease ttl, lease ids
+# Extends the leases that still exist (deadline from the server clock, like
+# the claim and the reaper); returns the ids of those that are gone.
+HEARTBEAT_SCRIPT = """
+local t = redis.call('TIME')
+local expires = tonumber(t[1]) + tonumber(t[2]) / 1000000 + tonumber(ARGV[1])
+local lost = {}
+for i = 2, #ARGV do
+    if redis.call('ZSCORE', KEYS[1], ARGV[i]) then
+        redis.call('ZADD', KEYS[1], expires, ARGV[i])
+    else
+        table.insert(lost, ARGV[i])
+    end
+end
+return lost
+"""
+
+
+class LeaseKeeper:
+    """
+    Reliable claiming: a job is atomically moved from its queue into the
+    `<queue>:processing` hash under a lease that expires after `ttl` seconds
+    (`<queue>:leases` sorted set) instead of being popped and lost if the
+    worker dies. A heartbeat thread extends this worker's leases until they
+    are acked; the same thread runs the reaper, which puts jobs with expired
+    leases back on their queue with their original score (and `attempts`
+    incremented), or on `<queue>:dead` after `max_attempts`. `queue_keys`
+    are the sorted sets jobs are claimed from, i.e. where reaped jobs may go
+    back; lease deadlines always come from the Redis server clock.
+    """
+
+    def __init__(self, redis_client, queue_name, worker_id, queue_keys, ttl=LEASE_TTL,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, reap_interval=REAP_INTERVAL, max_attempts=MAX_ATTEMPTS):
+        self.redis = redis_client
+        self.processing_key = f"{queue_name}:processing"
+        self.leases_key = f"{queue_name}:leases"
+        self.dead_key = f"{queue_name}:dead"
+        self.legacy_key = queue_name
+        self.queue_keys = list(queue_keys)
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.reap_interval = reap_interval
+        self.max_attempts = max_attempts
+        self._claim = redis_client.register_script(CLAIM_SCRIPT)
+        self._reap = redis_client.register_script(REAP_SCRIPT)
+        self._heartbeat = redis_client.register_script(HEARTBEAT_SCRIPT)
+        self._active = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def claim(self, keys, legacy_target):
+        """Returns (queue key, raw job, lease id) from the first non-empty key, or None."""
+        lease_id = f"{self.worker_id}:{uuid.uuid4().hex}"
+        claimed = self._claim(
+            keys=[self.processing_key, self.leases_key, self.legacy_key, *keys],
+            args=[lease_id, self.worker_id, self.ttl, legacy_target],
+        )
+        if not claimed:
+            return None
+        with self._lock:
+            self._active.add(lease_id)
+        key, raw = claimed
+        return key, raw, lease_id
+
+    def ack(self, lease_id):
+        """The job is finished (whatever the outcome): drop it from processing for good."""
+        with self._lock:
+            self._active.discard(lease_id)
+        pipe = self.redis.pipeline()
+        pipe.hdel(self.processing_key, lease_id)
+        pipe.zrem(self.leases_key, lease_id)
+        pipe.execute()
+
+    def heartbeat(self):
+        with self._lock:
+            active = list(self._active)
+        if not active:
+            return
+        for lease_id in self._heartbeat(keys=[self.leases_key], args=[self.ttl, *active]):
+            # reaped after a stall longer than the ttl: another worker may run it too
+            print(f"⚠️ Lease {lease_id} was lost")
+            with self._lock:
+                self._active.discard(lease_id)
+
+    def reap(self):
+        requeued, dead = self._reap(
+            keys=[self.processing_key, self.leases_key, self.dead_key, *self.queue_keys],
+            args=[self.max_attempts, 100],
+        )
+        if requeued or dead:
+            print(f"Reaper: requeued {requeued} job(s) with expired leases, {dead} to {self.dead_key}")
+        return requeued, dead
+
+    def _run(self):
+        next_reap = 0.0
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+                if time.monotonic() >= next_reap:
+                    self.reap()
+                    next_reap = time.monotonic() + self.reap_interval
+            except Exception as e:
+                print(f"Lease keeper error: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,23 @@
+import json
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# per-worker metrics snapshot, set by supervisor.py so it can aggregate without Redis
+METRICS_FILE = os.getenv("VTON_METRICS_FILE", "")
+
+
+def write_metrics(path, metrics):
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "w") as f:
+        json.dump(metrics, f)
+    os.replace(tmp_path, path)
+
+
+def read_metrics(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
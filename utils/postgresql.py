@@ -4,7 +4,8 @@ from psycopg2 import pool,sql
 
 load_dotenv()
 
-db_pool = pool.SimpleConnectionPool(
+# Threaded pool: upload callbacks update job status from worker threads
+db_pool = pool.ThreadedConnectionPool(
     minconn=1,
     maxconn=10,
     user=os.getenv('PG_USER'),
@@ -17,6 +18,8 @@ db_pool = pool.SimpleConnectionPool(
 
 
 def update_job_status(job_id: str, status: str, image_url: str = None, update: bool = False):
+    # update=True: plain UPDATE of a row an earlier status write created; otherwise upsert, so a
+    # retried job whose first attempt died before its INSERT still gets its row
     conn = db_pool.getconn()
     try:
         with conn.cursor() as cur:
@@ -41,15 +44,19 @@ def update_job_status(job_id: str, status: str, image_url: str = None, update: b
                     query = sql.SQL("""
                         INSERT INTO vton_jobs (id, status, vton_image_url)
                         VALUES (%s, %s, %s)
+                        ON CONFLICT (id) DO UPDATE
+                        SET status = EXCLUDED.status, vton_image_url = EXCLUDED.vton_image_url
                     """)
                     cur.execute(query, (job_id, status, image_url))
                 else:
                     query = sql.SQL("""
                         INSERT INTO vton_jobs (id, status)
                         VALUES (%s, %s)
+                        ON CONFLICT (id) DO UPDATE
+                        SET status = EXCLUDED.status
                     """)
                     cur.execute(query, (job_id, status))
-                print(f"Added job {job_id} with status {status} and image_url {image_url}")
+                print(f"Upserted job {job_id} with status {status} and image_url {image_url}")
             conn.commit()
     except Exception as e:
         conn.rollback()
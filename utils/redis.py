@@ -11,4 +11,7 @@ r = redis.from_url(
     decode_responses=True
 )
 
+# raw bytes (denoising checkpoints)
+r_bytes = redis.from_url(os.getenv("REDIS_URL"))
+
 QUEUE_NAME = os.getenv("VTON_QUEUE")
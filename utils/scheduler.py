@@ -0,0 +1,131 @@
+import json
+import os
+import time
+from dotenv import load_dotenv
+
+from utils.leases import LeaseKeeper
+
+load_dotenv()
+
+# "class:weight,..." from highest to lowest priority; a class with weight 3 gets
+# three picks for every pick of a weight-1 class while both have work
+PRIORITY_CLASSES = os.getenv("VTON_PRIORITY_CLASSES", "paid:3,free:1")
+DEFAULT_PRIORITY = os.getenv("VTON_DEFAULT_PRIORITY", "free")
+# seconds of queue position one unit of cost is worth (a 50-step 512x768 CFG job is 100
+# units); a job is never overtaken by more than COST_PENALTY_CAP seconds worth of newer jobs
+COST_WEIGHT = float(os.getenv("VTON_COST_WEIGHT", "0.1"))
+COST_PENALTY_CAP = float(os.getenv("VTON_COST_PENALTY_CAP", "60"))
+POP_TIMEOUT = int(os.getenv("VTON_POP_TIMEOUT", "1"))
+# claiming is a script call, not a blocking pop: an idle worker polls with backoff up to this
+POP_POLL_MAX = float(os.getenv("VTON_POP_POLL_MAX", "0.5"))
+
+
+def parse_classes(spec=PRIORITY_CLASSES):
+    classes = {}
+    for item in spec.split(","):
+        name, _, weight = item.strip().partition(":")
+        classes[name] = float(weight or 1)
+    return classes
+
+
+def job_cost(job_dict, width=512, height=768):
+    """Relative GPU cost: steps x resolution (vs 512x768) x CFG factor x variations."""
+    steps = int(job_dict.get("num_inference_steps", 50))
+    cfg = 2 if float(job_dict.get("guidance_scale", 2.5)) > 1.0 else 1
+    resolution = (width * height) / (512 * 768)
+    return steps * resolution * cfg * int(job_dict.get("num_variations", 1))
+
+
+def job_score(job_dict, now=None):
+    """
+    Sort key inside a class: arrival time plus a cost penalty (shortest job
+    first with aging). The penalty is capped, so waiting long enough always
+    wins over newer cheap jobs and nothing starves.
+    """
+    enqueued_at = float(job_dict.get("enqueued_at") or now or time.time())
+    return enqueued_at + min(COST_PENALTY_CAP, COST_WEIGHT * job_cost(job_dict))
+
+
+class StrideSelector:
+    """
+    Weighted fair choice between priority classes (stride scheduling): each
+    class has a pass value that grows by 1 / weight per job taken from it,
+    and the class with the lowest pass among those with work goes first.
+    """
+
+    def __init__(self, weights):
+        self.weights = dict(weights)
+        self.passes = {name: 0.0 for name in self.weights}
+
+    def order(self, names=None):
+        names = list(self.weights) if names is None else names
+        return sorted(names, key=lambda name: (self.passes[name], -self.weights[name]))
+
+    def charge(self, name, skipped=()):
+        """Account one job to `name`; `skipped` classes were ahead of it but empty."""
+        for other in skipped:
+            # idle classes don't bank credit for when they get work again
+            self.passes[other] = max(self.passes[other], self.passes[name])
+        self.passes[name] += 1.0 / self.weights[name]
+
+
+class PriorityScheduler:
+    """
+    Jobs live in one sorted set per priority class (`<queue>:<class>`,
+    scored by `job_score`). `pop` claims from all of them at once with the
+    class order from a `StrideSelector`, so a worker takes the cheapest /
+    oldest job of the class whose turn it is, falling back to the next class
+    when that one is empty. The legacy FIFO list `queue_name` is still
+    drained (after the sorted sets) so old producers keep working.
+
+    A popped job is leased, not removed (see `LeaseKeeper`): call `ack`
+    with its lease id once the job has reached a final status, otherwise it
+    is requeued when the lease expires.
+    """
+
+    def __init__(self, redis_client, queue_name, worker_id, classes=None):
+        self.redis = redis_client
+        self.queue_name = queue_name
+        self.classes = classes or parse_classes()
+        self.selector = StrideSelector(self.classes)
+        # reaped jobs go back to their class; the default class takes any other
+        queue_keys = [self.key(DEFAULT_PRIORITY)] + [self.key(name) for name in self.classes if name != DEFAULT_PRIORITY]
+        self.leases = LeaseKeeper(redis_client, queue_name, worker_id, queue_keys)
+
+    def key(self, priority):
+        return f"{self.queue_name}:{priority}"
+
+    def enqueue(self, job_dict, priority=None):
+        """Producer side: stamp `enqueued_at` and add the job to its class."""
+        priority = priority or job_dict.get("priority") or DEFAULT_PRIORITY
+        assert priority in self.classes, f"priority should be one of {list(self.classes)}, but got {priority}"
+        job_dict.setdefault("enqueued_at", time.time())
+        self.redis.zadd(self.key(priority), {json.dumps(job_dict): job_score(job_dict)})
+
+    def pop(self, timeout=POP_TIMEOUT):
+        """Returns (priority, raw job, lease id) or None after `timeout` seconds without work."""
+        deadline = time.monotonic() + timeout
+        delay = 0.05
+        while True:
+            order = self.selector.order()
+            claimed = self.leases.claim([self.key(name) for name in order], self.key(DEFAULT_PRIORITY))
+            if claimed:
+                key, raw, lease_id = claimed
+                priority = key[len(self.queue_name) + 1:]
+                self.selector.charge(priority, skipped=order[:order.index(priority)])
+                return priority, raw, lease_id
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, POP_POLL_MAX)
+
+    def ack(self, lease_id):
+        self.leases.ack(lease_id)
+
+    def depth(self):
+        pipe = self.redis.pipeline()
+        for name in self.classes:
+            pipe.zcard(self.key(name))
+        pipe.llen(self.queue_name)
+        return sum(pipe.execute())
@@ -0,0 +1,84 @@
+import os
+import time
+import uuid
+import threading
+from abc import ABC, abstractmethod
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cloudinary")
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "resource/uploads")
+LOCAL_STORAGE_BASE_URL = os.getenv("LOCAL_STORAGE_BASE_URL")
+LOCAL_STORAGE_PORT = os.getenv("LOCAL_STORAGE_PORT")
+LOCAL_STORAGE_LATENCY = float(os.getenv("LOCAL_STORAGE_LATENCY", "0"))
+
+
+class StorageBackend(ABC):
+    """
+    Where finished result images go. `upload` takes encoded image bytes and
+    returns a URL the frontend can load; it may raise, the caller retries.
+    """
+
+    @abstractmethod
+    def upload(self, image_bytes, ext="png"):
+        ...
+
+
+class CloudinaryStorage(StorageBackend):
+    def upload(self, image_bytes, ext="png"):
+        # imported lazily so the local backend works without Cloudinary credentials
+        from utils.cloudinary import upload_image_to_cloudinary
+        return upload_image_to_cloudinary(image_bytes)
+
+
+class LocalStorage(StorageBackend):
+    """
+    Stand-in for Cloudinary used for load tests: writes images under `root`
+    and returns `base_url/<name>` (or a file:// URL when no base_url is set).
+    `latency` adds an artificial delay per upload to mimic a remote store.
+    """
+
+    def __init__(self, root=LOCAL_STORAGE_DIR, base_url=None, latency=0.0):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.latency = latency
+        os.makedirs(self.root, exist_ok=True)
+
+    def upload(self, image_bytes, ext="png"):
+        if not image_bytes:
+            raise ValueError("Image bytes cannot be None")
+        if self.latency:
+            time.sleep(self.latency)
+        name = f"{uuid.uuid4().hex}.{ext}"
+        path = os.path.join(self.root, name)
+        tmp_path = path + ".part"
+        with open(tmp_path, "wb") as f:
+            f.write(image_bytes)
+        os.replace(tmp_path, path)
+        if self.base_url:
+            return f"{self.base_url}/{name}"
+        return f"file://{path}"
+
+    def serve(self, port, host="0.0.0.0"):
+        """Serve `root` over HTTP from a daemon thread so returned URLs resolve."""
+        handler = partial(SimpleHTTPRequestHandler, directory=self.root)
+        server = ThreadingHTTPServer((host, port), handler)
+        threading.Thread(target=server.serve_forever, name="local-storage", daemon=True).start()
+        if self.base_url is None:
+            self.base_url = f"http://localhost:{port}"
+        print(f"Serving {self.root} at {self.base_url}")
+        return server
+
+
+def get_storage_backend(name=STORAGE_BACKEND):
+    if name == "cloudinary":
+        return CloudinaryStorage()
+    if name == "local":
+        storage = LocalStorage(LOCAL_STORAGE_DIR, LOCAL_STORAGE_BASE_URL, LOCAL_STORAGE_LATENCY)
+        if LOCAL_STORAGE_PORT:
+            storage.serve(int(LOCAL_STORAGE_PORT))
+        return storage
+    raise ValueError(f"Unknown storage backend: {name}")
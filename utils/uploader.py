@@ -0,0 +1,124 @@
+import io
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+UPLOAD_MAX_RETRIES = int(os.getenv("UPLOAD_MAX_RETRIES", "3"))
+UPLOAD_BACKOFF = float(os.getenv("UPLOAD_BACKOFF", "1.0"))
+
+
+class UploadExecutor:
+    """
+    Encodes and uploads result images off the inference thread.
+
+    At most `max_in_flight` uploads run at once; `submit` blocks when all
+    slots are busy so a slow store applies backpressure instead of piling
+    decoded images up in memory. Failed uploads are retried with jittered
+    exponential backoff, then `on_failure(job_id, error)` is called.
+    `on_success(job_id, url)` is called from the upload thread.
+    """
+
+    def __init__(
+        self,
+        storage,
+        max_in_flight=UPLOAD_CONCURRENCY,
+        max_retries=UPLOAD_MAX_RETRIES,
+        backoff=UPLOAD_BACKOFF,
+        max_backoff=30.0,
+        image_format="PNG",
+    ):
+        self.storage = storage
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.image_format = image_format
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="upload")
+
+    def submit(self, job_id, image, on_success, on_failure):
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._run, job_id, image, on_success, on_failure)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def submit_many(self, job_id, images, on_success, on_failure):
+        """
+        Upload several images for one job. `on_success(job_id, urls)` is
+        called once, with the URLs in input order, after all of them are
+        stored; if any upload fails `on_failure` is called once instead.
+        """
+        urls = [None] * len(images)
+        errors = []
+        remaining = [len(images)]
+        lock = threading.Lock()
+
+        def done(index, url=None, error=None):
+            with lock:
+                if error is not None:
+                    errors.append(error)
+                else:
+                    urls[index] = url
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            if errors:
+                self._callback(on_failure, job_id, errors[0])
+            else:
+                self._callback(on_success, job_id, urls)
+
+        return [
+            self.submit(
+                job_id,
+                image,
+                lambda _, url, index=index: done(index, url=url),
+                lambda _, error, index=index: done(index, error=error),
+            )
+            for index, image in enumerate(images)
+        ]
+
+    def _encode(self, image):
+        buffer = io.BytesIO()
+        image.save(buffer, format=self.image_format)
+        return buffer.getvalue()
+
+    def _upload_with_retry(self, image_bytes):
+        attempt = 0
+        while True:
+            try:
+                return self.storage.upload(image_bytes, ext=self.image_format.lower())
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                print(f"Upload failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+
+    def _run(self, job_id, image, on_success, on_failure):
+        try:
+            image_url = self._upload_with_retry(self._encode(image))
+        except Exception as e:
+            self._callback(on_failure, job_id, e)
+            return None
+        self._callback(on_success, job_id, image_url)
+        return image_url
+
+    @staticmethod
+    def _callback(fn, job_id, value):
+        try:
+            fn(job_id, value)
+        except Exception as e:
+            print(f"Upload callback error for job {job_id}: {e}")
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
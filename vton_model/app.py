@@ -11,16 +11,19 @@ import numpy as np
 import torch
 from diffusers.image_processor import VaeImageProcessor
 from huggingface_hub import snapshot_download
-from PIL import Image
+from PIL import Image, ImageOps
 
 torch.backends.cuda.matmul.allow_tf32 = True
 torch.backends.cudnn.allow_tf32 = True
 torch.jit.script = lambda f: f
 
 from vton_model.model.cloth_masker import AutoMasker, vis_mask
-from vton_model.model.pipeline import CatVTONPipeline
+from vton_model.model.memory_planner import MemoryPlanner
+from vton_model.model.offload import OffloadManager
+from vton_model.model.pipeline import CatVTONPipeline, CatVTONPix2PixPipeline
 
-from vton_model.utils import resize_and_crop, resize_and_padding
+from vton_model.utils import (composite_full_resolution, frame_box, load_image_reduced, mask_roi_box, resize_and_crop, resize_and_crop_tensor,
+                              resize_and_padding, resize_and_padding_tensor)
 
 
 def image_grid(imgs, rows, cols):
@@ -36,82 +39,300 @@ args ={
     'output_dir':'resource/demo/output',
     'width':512,
     'height':768,
+    'infer_width':768,   # resolution the pipeline denoises at (inputs are resized to it)
+    'infer_height':1024,
+    'roi_margin':48,     # crop-to-ROI mode: context around the mask, in inference pixels
+    'roi_bucket':64,
+    'roi_min_size':256,
     'allow_tf32':True,
-    'mixed_precision':'fp16'
+    'mixed_precision':'fp16',
+    'offload': os.getenv("VTON_OFFLOAD", "none"),  # none / model / sequential
+    'lcm_lora': os.getenv("VTON_LCM_LORA", ""),  # adapter from vton_model/distill_lcm.py, enables 4-8 step jobs
+    'device': os.getenv("VTON_DEVICE", "cuda"),  # set per worker by supervisor.py (cuda pinned via CUDA_VISIBLE_DEVICES, or cpu)
+    'num_threads': int(os.getenv("VTON_NUM_THREADS", "0")),  # intra-op CPU threads, 0 = torch default
+    'tensor_resize': os.getenv("VTON_TENSOR_RESIZE", "1") == "1",  # CUDA workers: inputs to the inference size on the GPU
+    'stage': os.getenv("VTON_STAGE", "all"),  # all / mask (parsing only, CPU nodes) / diffusion (parsing loaded on demand)
+    'p2p_base_model_path':'timbrooks/instruct-pix2pix',
+    'p2p_resume_path':'zhengchong/CatVTON-MaskFree',
 }
 
+if args['num_threads']:
+    torch.set_num_threads(args['num_threads'])
+# fp16 kernels are a GPU thing; CPU workers run in fp32
+weight_dtype = torch.float16 if args['device'].startswith('cuda') else torch.float32
+
 repo_path = snapshot_download(repo_id=args['resume_path'])
 
-pipeline = CatVTONPipeline(
-    base_ckpt=args['base_model_path'],
-    attn_ckpt=repo_path,
-    attn_ckpt_version="mix",
-    weight_dtype=torch.float16,
-    use_tf32=args['allow_tf32'],
-    device='cuda'
-)
+# Move each component to the GPU only for its stage on small-memory workers
+offload = OffloadManager(device=args['device'], policy=args['offload'])
+
+# A mask-stage worker never denoises: it doesn't load the diffusion models at all
+pipeline = planner = None
+if args['stage'] != 'mask':
+    pipeline = CatVTONPipeline(
+        base_ckpt=args['base_model_path'],
+        attn_ckpt=repo_path,
+        attn_ckpt_version="mix",
+        weight_dtype=weight_dtype,
+        use_tf32=args['allow_tf32'],
+        device=args['device']
+    )
+    if args['lcm_lora']:
+        pipeline.load_lcm_lora(args['lcm_lora'])
+    # Picks batch size / CFG split / VAE mode from free memory and degrades instead of failing on OOM
+    planner = MemoryPlanner(pipeline)
+    # one blank 1-step call rescales its estimates to this card (CUDA only), before the weights can be offloaded
+    infer_size = (args['infer_width'], args['infer_height'])
+    planner.calibrate(
+        infer_size[1], infer_size[0],
+        image=Image.new("RGB", infer_size), condition_image=Image.new("RGB", infer_size), mask=Image.new("L", infer_size, 255),
+    )
+    pipeline.enable_offload(offload)
 
 
 mask_processor = VaeImageProcessor(vae_scale_factor=8, do_normalize=False, do_binarize=True, do_convert_grayscale=True)
-automasker = AutoMasker(
-    densepose_ckpt=os.path.join(repo_path, "DensePose"),
-    schp_ckpt=os.path.join(repo_path, "SCHP"),
-    device='cuda',
-)
 
 
+def load_automasker():
+    masker = AutoMasker(
+        densepose_ckpt=os.path.join(repo_path, "DensePose"),
+        schp_ckpt=os.path.join(repo_path, "SCHP"),
+        device=args['device'],
+    )
+    masker.enable_offload(offload)
+    return masker
 
 
+# Diffusion-stage workers get their masks from the mask stage; they only load the
+# parsing networks for jobs that reach them unmasked (see get_automasker)
+automasker = load_automasker() if args['stage'] != 'diffusion' else None
+
+
+def get_automasker():
+    global automasker
+    if automasker is None:
+        automasker = load_automasker()
+    return automasker
+
+# Mask-free pipeline, loaded on first "maskfree" job so masked-only workers don't pay for it
+maskfree = {}
+
+
+def get_maskfree_planner():
+    if 'planner' not in maskfree:
+        p2p_pipeline = CatVTONPix2PixPipeline(
+            base_ckpt=args['p2p_base_model_path'],
+            attn_ckpt=snapshot_download(repo_id=args['p2p_resume_path']),
+            attn_ckpt_version="mix-48k-1024",
+            weight_dtype=weight_dtype,
+            use_tf32=args['allow_tf32'],
+            device=args['device']
+        )
+        maskfree['planner'] = MemoryPlanner(p2p_pipeline)
+        infer_size = (args['infer_width'], args['infer_height'])
+        maskfree['planner'].calibrate(
+            infer_size[1], infer_size[0], image=Image.new("RGB", infer_size), condition_image=Image.new("RGB", infer_size)
+        )
+        p2p_pipeline.enable_offload(OffloadManager(device=args['device'], policy=args['offload']))
+    return maskfree['planner']
+
+
+
+
+
+def resize_device():
+    """Where `vton` brings the inputs to the inference size: the GPU with VTON_TENSOR_RESIZE, else PIL in the pipeline (None)."""
+    return args['device'] if args['tensor_resize'] and args['device'].startswith('cuda') else None
 
-@spaces.GPU(duration=120)
-def vton(person_image, cloth_image, cloth_type, num_inference_steps, guidance_scale, seed, show_type):
-    print({'cloth_type': cloth_type, 'num_inference_steps': num_inference_steps, 'guidance_scale': guidance_scale, 'seed': seed, 'show_type': show_type})
 
-    mask = None
+def prepare_garments(cloth_image, cloth_type, lower_cloth_image=None):
+    """Garment(s) padded to the model size; "outfit": upper garment in `cloth_image`, lower one tried on in the same pass."""
+    size = (args['width'], args['height'])
+    cloth_images = [resize_and_padding(load_image_reduced(cloth_image, size, fit="padding"), size)]
+    if cloth_type == "outfit":
+        cloth_images.append(resize_and_padding(load_image_reduced(lower_cloth_image, size, fit="padding"), size))
+    return cloth_images
+
+
+def preprocess(person_image, cloth_image, cloth_type, mode="masked", mask=None, lower_cloth_image=None, init_image=None, cancel_check=None):
+    """
+    Everything before denoising that needs no diffusion model: resize the
+    person (crop) and garments (padding) to the model size, the init image
+    (a previous result, already in the inference framing) to the inference
+    size and, in masked mode, compute the try-on mask (unblurred) with the
+    parsing networks unless `mask` is given. Runs on its own on mask-stage workers.
+    Returns {"person_image", "cloth_images", "mask", "init_image"}.
+    """
+    size = (args['width'], args['height'])
+    if cloth_type == "outfit":
+        assert mode == "masked", "outfit try-on needs the masked pipeline"
+    cloth_images = prepare_garments(cloth_image, cloth_type, lower_cloth_image)
+    person_image = resize_and_crop(load_image_reduced(person_image, size, fit="crop"), size)
+    if init_image is not None:
+        assert mode == "masked", "refinement needs the masked pipeline"
+        # a previous result is already framed like the pipeline output: a plain resize, no
+        # crop to the 2:3 model size (and back to 3:4 in the pipeline) that would zoom and shift it
+        infer_size = (args['infer_width'], args['infer_height'])
+        init_image = load_image_reduced(init_image, infer_size, fit="crop")
+        if init_image.size != infer_size:
+            init_image = init_image.resize(infer_size, Image.LANCZOS)
+
+    if cancel_check is not None:
+        cancel_check()
+    if mode == "masked":
+        if mask is not None:
+            # client-supplied mask (same framing as the person photo): skip human parsing entirely
+            mask = resize_and_crop(load_image_reduced(mask, size, fit="crop").convert("L"), size)
+        else:
+            # one parsing pass; an outfit gets the union of the upper and lower masks
+            mask_type = ['upper', 'lower'] if cloth_type == "outfit" else cloth_type
+            mask = get_automasker()(person_image, mask_type)['mask']
+    else:
+        mask = None
+    return {"person_image": person_image, "cloth_images": cloth_images, "mask": mask, "init_image": init_image}
+
+
+@spaces.GPU(duration=120)
+def vton(person_image, cloth_image, cloth_type, num_inference_steps, guidance_scale, seed, show_type, mode="masked", mask=None, lower_cloth_image=None, num_variations=1, init_image=None, strength=1.0, full_resolution=False, roi_crop=False, use_lcm=False, callback=None, cancel_check=None, resume_state=None, checkpoint_callback=None, prepared=None):
+    """
+    Returns one image, or a list of `num_variations` images (seeds seed, seed + 1, ...) when more than one.
+    With `init_image` (a previous "result only" output) only the last `strength` of the schedule is run.
+    With `full_resolution` the masked region is composited onto the original photo (show_type is ignored).
+    With `roi_crop` only the mask's bounding box (plus context) is denoised and pasted back.
+    With `use_lcm` the distilled LoRA + LCM sampler run (4-8 steps; CFG is distilled in, guidance_scale is forced to 1).
+    `callback(step, num_steps, latents)` is called after each denoising step (e.g. `PreviewPublisher`).
+    `cancel_check()` is called between stages and may raise to abandon the job.
+    `checkpoint_callback` / `resume_state` snapshot and resume the denoising loop (`Checkpointer`, masked mode).
+    `prepared` is the output of `preprocess` from the mask stage; the images and mask arguments are then unused.
+    """
+    if use_lcm:
+        # CFG on top of the CFG-distilled LoRA doubles the UNet batch and degrades the output
+        guidance_scale = 1.0
+    print({'cloth_type': cloth_type, 'num_inference_steps': num_inference_steps, 'guidance_scale': guidance_scale, 'seed': seed, 'show_type': show_type, 'mode': mode, 'mask': mask is not None, 'num_variations': num_variations})
 
     tmp_folder = args['output_dir']
     date_str = datetime.now().strftime("%Y%m%d%H%M%S")
     result_save_path = os.path.join(tmp_folder, date_str[:8], date_str[8:] + ".png")
     os.makedirs(os.path.dirname(result_save_path), exist_ok=True)
 
-    generator = torch.Generator(device='cuda').manual_seed(seed) if seed != -1 else None
+    generator = None
+    if seed != -1:
+        generator = [torch.Generator(device=args['device']).manual_seed(seed + i) for i in range(num_variations)]
+        if num_variations == 1:
+            generator = generator[0]
+
+    if full_resolution:
+        assert mode == "masked", "full-resolution compositing needs a mask"
+        assert prepared is None, "full-resolution compositing needs the original photo, not stage inputs"
+        # decode the original once at full size (no draft); the model input is derived from it
+        original = person_image if isinstance(person_image, Image.Image) else Image.open(person_image)
+        original = person_image = ImageOps.exif_transpose(original).convert("RGB")
 
-    person_image = resize_and_crop(Image.open(person_image).convert("RGB"), (args['width'], args['height']))
-    cloth_image = resize_and_padding(Image.open(cloth_image).convert("RGB"), (args['width'], args['height']))
+    check_cancelled = cancel_check or (lambda: None)
+    check_cancelled()
+    if prepared is None:
+        prepared = preprocess(person_image, cloth_image, cloth_type, mode, mask, lower_cloth_image, init_image, check_cancelled)
+    person_image, cloth_images = prepared["person_image"], prepared["cloth_images"]
+    mask, init_image = prepared["mask"], prepared["init_image"]
+    cloth_image = cloth_images[0]
 
-    if mask is not None:
-        mask = resize_and_crop(mask, (args['width'], args['height']))
+    if mode == "maskfree":
+        # No parsing networks at all: the mask-free model repaints the garment region itself
+        result_images = get_maskfree_planner()(
+            image=person_image,
+            condition_image=cloth_image,
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            generator=generator,
+            num_variations=num_variations,
+            callback=callback,
+        )
+        masked_person = person_image
     else:
-        mask = automasker(person_image, cloth_type)['mask']
-    mask = mask_processor.blur(mask, blur_factor=9)
-
-    result_image = pipeline(
-        image=person_image,
-        condition_image=cloth_image,
-        mask=mask,
-        num_inference_steps=num_inference_steps,
-        guidance_scale=guidance_scale,
-        generator=generator
-    )[0]
-
-    masked_person = vis_mask(person_image, mask)
-    save_result_image = image_grid([person_image, masked_person, cloth_image, result_image], 1, 4)
+        mask = mask_processor.blur(mask, blur_factor=9)
+        check_cancelled()
+
+        infer_size = (args['infer_width'], args['infer_height'])
+        inputs = dict(
+            image=person_image,
+            condition_image=cloth_images[0],
+            extra_condition_images=cloth_images[1:],
+            mask=mask,
+            init_image=init_image,
+            width=infer_size[0],
+            height=infer_size[1],
+        )
+        box = None
+        if roi_crop:
+            # Denoise only the mask's region: the frame is brought to the inference size,
+            # the ROI is cropped at that scale and the garments are padded to its shape
+            frame = resize_and_crop(person_image, infer_size)
+            frame_mask = resize_and_crop(mask, infer_size)
+            box = mask_roi_box(frame_mask, args['roi_margin'], args['roi_bucket'], args['roi_min_size'])
+        if box is not None:
+            roi_size = (box[2] - box[0], box[3] - box[1])
+            roi_mask = frame_mask.crop(box)
+            inputs.update(
+                image=frame.crop(box),
+                condition_image=resize_and_padding(cloth_images[0], roi_size),
+                extra_condition_images=[resize_and_padding(c, roi_size) for c in cloth_images[1:]],
+                mask=roi_mask,
+                init_image=init_image.crop(box) if init_image is not None else None,
+                width=roi_size[0],
+                height=roi_size[1],
+            )
+        elif resize_device() is not None:
+            # person and garments go to the inference size on the GPU, straight into the
+            # pipeline's [-1, 1] layout (no PIL upscale, no host round trip)
+            garments = resize_and_padding_tensor(cloth_images, infer_size, device=resize_device())
+            inputs.update(
+                image=resize_and_crop_tensor([person_image], infer_size, device=resize_device()),
+                condition_image=garments[:1],
+                extra_condition_images=[garments[i:i + 1] for i in range(1, len(garments))],
+            )
+
+        result_images = planner(
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            generator=generator,
+            num_variations=num_variations,
+            strength=strength,
+            use_lcm=use_lcm,
+            callback=callback,
+            resume_state=resume_state,
+            checkpoint_callback=checkpoint_callback,
+            **inputs,
+        )
+        if box is not None:
+            for i, result_image in enumerate(result_images):
+                # blurred mask as alpha, so the ROI edge never shows a seam
+                result_images[i] = frame.copy()
+                result_images[i].paste(result_image, box[:2], roi_mask)
+        masked_person = vis_mask(person_image, mask)
+
+    save_result_image = image_grid([person_image, masked_person, *cloth_images, *result_images], 1, 2 + len(cloth_images) + len(result_images))
     save_result_image.save(result_save_path)
 
-    if show_type == "result only":
-        return result_image
-    else:
+    if full_resolution:
+        # the pipeline runs at another aspect than `size`: the result shows the 2:3 crop of the
+        # photo cropped again to 3:4, so the mask and the mapping back both go through both crops
+        result_mask = resize_and_crop(mask, result_images[0].size)
+        box = frame_box(original.size, (args['width'], args['height']), result_images[0].size)
+        result_images = [composite_full_resolution(result_image, original, result_mask, box) for result_image in result_images]
+    elif show_type != "result only":
         width, height = person_image.size
         if show_type == "input & result":
-            condition_width = width // 2
-            conditions = image_grid([person_image, cloth_image], 2, 1)
+            panels = [person_image, *cloth_images]
         else:
-            condition_width = width // 3
-            conditions = image_grid([person_image, masked_person, cloth_image], 3, 1)
+            panels = [person_image, masked_person, *cloth_images]
+        condition_width = width // len(panels)
+        conditions = image_grid(panels, len(panels), 1)
         conditions = conditions.resize((condition_width, height), Image.NEAREST)
-        new_result_image = Image.new("RGB", (width + condition_width + 5, height))
-        new_result_image.paste(conditions, (0, 0))
-        new_result_image.paste(result_image, (condition_width + 5, 0))
-        return new_result_image
+        for i, result_image in enumerate(result_images):
+            new_result_image = Image.new("RGB", (width + condition_width + 5, height))
+            new_result_image.paste(conditions, (0, 0))
+            new_result_image.paste(result_image, (condition_width + 5, 0))
+            result_images[i] = new_result_image
+    return result_images if num_variations > 1 else result_images[0]
 
 
@@ -0,0 +1,255 @@
+"""
+Latent-consistency distillation of a LoRA on the CatVTON attention modules.
+
+The teacher is the CatVTON UNet itself (adapter switched off, DDIM with CFG);
+the student is the same UNet with the LoRA switched on, trained so one
+consistency step from x_t lands where the teacher's DDIM step + student
+would (LCM-LoRA). The saved adapter is loaded with
+`CatVTONPipeline.load_lcm_lora` / VTON_LCM_LORA for 4-8 step jobs.
+
+    # end to end on CPU with a randomly initialised tiny UNet/VAE and synthetic data
+    python -m vton_model.distill_lcm --tiny --output resource/lcm/tiny.safetensors
+
+    # real run: DIR holds person/, cloth/ and mask/ images with matching file names
+    python -m vton_model.distill_lcm --data DIR --device cuda --steps 4000 --output resource/lcm/catvton-lcm.safetensors
+"""
+import argparse
+import itertools
+import os
+
+import torch
+from PIL import Image
+from torch.nn import functional as F
+
+from vton_model.model.lcm import add_lcm_lora, consistency_scalings, save_lcm_lora, set_lora_enabled
+from vton_model.utils import (compute_vae_encodings, prepare_image, prepare_inpainting_input,
+                              prepare_mask_image, resize_and_crop, resize_and_padding)
+
+
+def tiny_models(device):
+    from diffusers import AutoencoderKL, DDIMScheduler, UNet2DConditionModel
+
+    from vton_model.model.attn_processor import SkipAttnProcessor
+    from vton_model.model.utils import get_trainable_module, init_adapter
+
+    torch.manual_seed(0)
+    unet = UNet2DConditionModel(
+        sample_size=16,
+        in_channels=9,
+        out_channels=4,
+        block_out_channels=(32, 64),
+        down_block_types=("CrossAttnDownBlock2D", "DownBlock2D"),
+        up_block_types=("UpBlock2D", "CrossAttnUpBlock2D"),
+        layers_per_block=1,
+        cross_attention_dim=32,
+        attention_head_dim=8,
+        norm_num_groups=8,
+    ).to(device)
+    init_adapter(unet, cross_attn_cls=SkipAttnProcessor)
+    vae = AutoencoderKL(
+        block_out_channels=(8, 16, 16, 16),
+        down_block_types=("DownEncoderBlock2D",) * 4,
+        up_block_types=("UpDecoderBlock2D",) * 4,
+        latent_channels=4,
+        norm_num_groups=8,
+    ).to(device)
+    scheduler = DDIMScheduler(beta_schedule="scaled_linear", beta_start=0.00085, beta_end=0.012, clip_sample=False)
+    return unet, vae, scheduler, get_trainable_module(unet, "attention")
+
+
+def catvton_models(opts):
+    from vton_model.model.pipeline import CatVTONPipeline
+
+    pipeline = CatVTONPipeline(
+        base_ckpt=opts.base_model,
+        attn_ckpt=opts.attn_ckpt,
+        attn_ckpt_version="mix",
+        weight_dtype=torch.float32,
+        device=opts.device,
+        skip_safety_check=True,
+    )
+    return pipeline.unet, pipeline.vae, pipeline.noise_scheduler, pipeline.attn_modules
+
+
+def synthetic_batches(batch_size, width, height, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    while True:
+        person = torch.rand(batch_size, 3, height, width, generator=generator) * 2 - 1
+        cloth = torch.rand(batch_size, 3, height, width, generator=generator) * 2 - 1
+        mask = torch.zeros(batch_size, 1, height, width)
+        mask[:, :, height // 4: 3 * height // 4, width // 4: 3 * width // 4] = 1
+        yield person, cloth, mask
+
+
+def folder_batches(root, batch_size, width, height):
+    names = sorted(os.listdir(os.path.join(root, "person")))
+    assert names, f"no images in {os.path.join(root, 'person')}"
+    for start in itertools.cycle(range(0, len(names), batch_size)):
+        chunk = names[start:start + batch_size]
+        person = [resize_and_crop(Image.open(os.path.join(root, "person", n)).convert("RGB"), (width, height)) for n in chunk]
+        cloth = [resize_and_padding(Image.open(os.path.join(root, "cloth", n)).convert("RGB"), (width, height)) for n in chunk]
+        mask = [resize_and_crop(Image.open(os.path.join(root, "mask", n)).convert("L"), (width, height)) for n in chunk]
+        yield prepare_image(person), prepare_image(cloth), prepare_mask_image(mask)
+
+
+def encode_batch(vae, person, cloth, mask, device):
+    """Targets and conditioning in the layout `CatVTONPipeline` feeds the UNet (person / garment along y)."""
+    person, cloth, mask = person.to(device), cloth.to(device), mask.to(device)
+    person_latent = compute_vae_encodings(person, vae, device)
+    cloth_latent = compute_vae_encodings(cloth, vae, device)
+    masked_latent = compute_vae_encodings(person * (mask < 0.5), vae, device)
+    mask_latent = F.interpolate(mask, size=masked_latent.shape[-2:], mode="nearest")
+    latents = torch.cat([person_latent, cloth_latent], dim=-2)
+    mask_concat = torch.cat([mask_latent, torch.zeros_like(mask_latent)], dim=-2)
+    condition = torch.cat([masked_latent, cloth_latent], dim=-2)
+    uncondition = torch.cat([masked_latent, torch.zeros_like(cloth_latent)], dim=-2)
+    return latents, mask_concat, condition, uncondition
+
+
+def predict_noise(unet, noisy_latents, timesteps, mask_concat, condition):
+    model_input = prepare_inpainting_input(noisy_latents, mask_concat, condition, condition_concat_dim=-2)
+    return unet(model_input, timesteps, encoder_hidden_states=None, return_dict=False)[0]
+
+
+def expand(values):
+    return values[:, None, None, None]
+
+
+def predicted_original(scheduler, sample, noise_pred, timesteps):
+    alphas = expand(scheduler.alphas_cumprod.to(sample.device)[timesteps])
+    return (sample - (1 - alphas).sqrt() * noise_pred) / alphas.sqrt()
+
+
+def consistency_output(scheduler, sample, noise_pred, timesteps):
+    c_skip, c_out = consistency_scalings(timesteps)
+    return expand(c_skip) * sample + expand(c_out) * predicted_original(scheduler, sample, noise_pred, timesteps)
+
+
+def distill_step(unet, scheduler, attn_modules, batch, opts):
+    latents, mask_concat, condition, uncondition = batch
+    step_ratio = scheduler.config.num_train_timesteps // opts.ddim_timesteps
+    index = torch.randint(1, opts.ddim_timesteps, (latents.shape[0],), device=latents.device)
+    timesteps = (index + 1) * step_ratio - 1
+    prev_timesteps = timesteps - step_ratio
+    noise = torch.randn_like(latents)
+    noisy_latents = scheduler.add_noise(latents, noise, timesteps)
+
+    set_lora_enabled(attn_modules, True)
+    student = consistency_output(
+        scheduler, noisy_latents, predict_noise(unet, noisy_latents, timesteps, mask_concat, condition), timesteps
+    )
+    with torch.no_grad():
+        # teacher: one CFG-guided DDIM step with the original weights
+        set_lora_enabled(attn_modules, False)
+        noise_cond = predict_noise(unet, noisy_latents, timesteps, mask_concat, condition)
+        noise_uncond = predict_noise(unet, noisy_latents, timesteps, mask_concat, uncondition)
+        noise_teacher = noise_uncond + opts.guidance_scale * (noise_cond - noise_uncond)
+        original = predicted_original(scheduler, noisy_latents, noise_teacher, timesteps)
+        prev_alphas = expand(scheduler.alphas_cumprod.to(latents.device)[prev_timesteps])
+        prev_latents = prev_alphas.sqrt() * original + (1 - prev_alphas).sqrt() * noise_teacher
+        # target: the student's own consistency output one step earlier
+        set_lora_enabled(attn_modules, True)
+        target = consistency_output(
+            scheduler, prev_latents, predict_noise(unet, prev_latents, prev_timesteps, mask_concat, condition), prev_timesteps
+        )
+    # pseudo-Huber loss as in LCM
+    return (torch.sqrt((student.float() - target.float()) ** 2 + opts.huber_c ** 2) - opts.huber_c).mean()
+
+
+@torch.no_grad()
+def sample(unet, scheduler, batch, steps, guidance_scale, seed):
+    latents, mask_concat, condition, uncondition = batch
+    generator = torch.Generator(latents.device).manual_seed(seed)
+    scheduler.set_timesteps(steps, device=latents.device)
+    sample_latents = torch.randn(latents.shape, generator=generator, device=latents.device) * scheduler.init_noise_sigma
+    for t in scheduler.timesteps:
+        timesteps = t.repeat(latents.shape[0])
+        noise_pred = predict_noise(unet, sample_latents, timesteps, mask_concat, condition)
+        if guidance_scale > 1.0:
+            noise_uncond = predict_noise(unet, sample_latents, timesteps, mask_concat, uncondition)
+            noise_pred = noise_uncond + guidance_scale * (noise_pred - noise_uncond)
+        sample_latents = scheduler.step(noise_pred, t, sample_latents, generator=generator).prev_sample
+    # only the person half is the try-on result
+    return sample_latents.chunk(2, dim=-2)[0]
+
+
+def validate(unet, scheduler, attn_modules, batch, opts):
+    """Latent MSE of few-step LCM sampling against the teacher's many-step DDIM result, adapter on vs off."""
+    from diffusers import LCMScheduler
+
+    lcm_scheduler = LCMScheduler.from_config(scheduler.config)
+    set_lora_enabled(attn_modules, False)
+    teacher = sample(unet, scheduler, batch, opts.teacher_steps, opts.guidance_scale, seed=0)
+    without_lora = sample(unet, lcm_scheduler, batch, opts.val_steps, 1.0, seed=0)
+    set_lora_enabled(attn_modules, True)
+    with_lora = sample(unet, lcm_scheduler, batch, opts.val_steps, 1.0, seed=0)
+    error_without = F.mse_loss(without_lora, teacher).item()
+    error_with = F.mse_loss(with_lora, teacher).item()
+    print(f"{opts.val_steps}-step LCM vs {opts.teacher_steps}-step DDIM teacher: "
+          f"MSE {error_without:.4f} without LoRA, {error_with:.4f} with LoRA")
+    return error_with < error_without
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiny", action="store_true", help="random tiny UNet/VAE and synthetic data (CPU smoke run)")
+    parser.add_argument("--data", help="folder with person/, cloth/ and mask/ images")
+    parser.add_argument("--base-model", default="booksforcharlie/stable-diffusion-inpainting")
+    parser.add_argument("--attn-ckpt", default="zhengchong/CatVTON")
+    parser.add_argument("--output", default=os.path.join("resource", "lcm", "catvton-lcm.safetensors"))
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--width", type=int, default=None)
+    parser.add_argument("--height", type=int, default=None)
+    parser.add_argument("--steps", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--lr", type=float, default=None)
+    parser.add_argument("--rank", type=int, default=None)
+    parser.add_argument("--guidance-scale", type=float, default=2.5)
+    parser.add_argument("--ddim-timesteps", type=int, default=50)
+    parser.add_argument("--huber-c", type=float, default=0.001)
+    parser.add_argument("--val-steps", type=int, default=4)
+    parser.add_argument("--teacher-steps", type=int, default=50)
+    opts = parser.parse_args()
+    assert opts.tiny or opts.data, "pass --data DIR, or --tiny for a synthetic smoke run"
+
+    # tiny config: runs end to end on a laptop CPU in about a minute
+    defaults = dict(width=48, height=64, steps=200, batch_size=2, lr=1e-3, rank=4) if opts.tiny else \
+        dict(width=384, height=512, steps=4000, batch_size=4, lr=1e-4, rank=64)
+    for key, value in defaults.items():
+        if getattr(opts, key) is None:
+            setattr(opts, key, value)
+
+    unet, vae, scheduler, attn_modules = tiny_models(opts.device) if opts.tiny else catvton_models(opts)
+    unet.requires_grad_(False)
+    vae.requires_grad_(False)
+    add_lcm_lora(attn_modules, rank=opts.rank)
+    attn_modules.to(opts.device)
+    params = [p for name, p in attn_modules.named_parameters() if "lora_" in name]
+    for p in params:
+        p.requires_grad_(True)
+    print(f"LoRA rank {opts.rank}: {sum(p.numel() for p in params) / 1e6:.2f}M trainable parameters")
+    optimizer = torch.optim.AdamW(params, lr=opts.lr)
+
+    batches = synthetic_batches(opts.batch_size, opts.width, opts.height) if opts.tiny else \
+        folder_batches(opts.data, opts.batch_size, opts.width, opts.height)
+    val_batch = encode_batch(vae, *next(batches), opts.device)
+    unet.train()
+    for step in range(1, opts.steps + 1):
+        loss = distill_step(unet, scheduler, attn_modules, encode_batch(vae, *next(batches), opts.device), opts)
+        loss.backward()
+        torch.nn.utils.clip_grad_norm_(params, 1.0)
+        optimizer.step()
+        optimizer.zero_grad(set_to_none=True)
+        if step % 50 == 0 or step == opts.steps:
+            print(f"step {step}/{opts.steps} loss {loss.item():.5f}")
+    unet.eval()
+
+    os.makedirs(os.path.dirname(opts.output) or ".", exist_ok=True)
+    save_lcm_lora(attn_modules, opts.output, rank=opts.rank)
+    print(f"Saved LCM LoRA to {opts.output}")
+    improved = validate(unet, scheduler, attn_modules, val_batch, opts)
+    raise SystemExit(0 if improved else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+
+import torch
+
+
+class BufferPool:
+    """
+    Persistent tensors reused across denoising steps and across jobs.
+
+    Buffers are keyed by (name, shape, dtype, device), so every resolution
+    bucket / batch size combination gets its own slot and a steady stream of
+    same-sized jobs never goes back to the caching allocator. At most
+    `max_entries` buffers are kept (least recently used dropped first).
+    Contents are NOT cleared between uses; callers overwrite what they read.
+    With `enabled=False` every `get` allocates, which is useful as a baseline.
+    """
+
+    def __init__(self, max_entries=16, enabled=True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._buffers = OrderedDict()
+
+    def get(self, name, shape, dtype, device, pin_memory=False):
+        key = (name, tuple(shape), dtype, str(device))
+        buffer = self._buffers.get(key) if self.enabled else None
+        if buffer is not None:
+            self.hits += 1
+            self._buffers.move_to_end(key)
+            return buffer
+        self.misses += 1
+        if pin_memory:
+            buffer = torch.empty(shape, dtype=dtype, pin_memory=True)
+        else:
+            buffer = torch.empty(shape, dtype=dtype, device=device)
+        if self.enabled:
+            self._buffers[key] = buffer
+            while len(self._buffers) > self.max_entries:
+                self._buffers.popitem(last=False)
+        return buffer
+
+    def clear(self):
+        self._buffers.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._buffers),
+            "bytes": sum(b.numel() * b.element_size() for b in self._buffers.values()),
+        }
+
+
+def allocator_stats(device=None):
+    """
+    Snapshot of CUDA caching-allocator counters: cumulative allocation
+    requests, cudaMalloc calls (segments) and fragmentation, i.e. the share
+    of reserved memory sitting in inactive split blocks.
+    """
+    if not torch.cuda.is_available():
+        return {}
+    stats = torch.cuda.memory_stats(device)
+    reserved = stats.get("reserved_bytes.all.current", 0)
+    inactive = stats.get("inactive_split_bytes.all.current", 0)
+    return {
+        "alloc_requests": stats.get("allocation.all.allocated", 0),
+        "cuda_mallocs": stats.get("segment.all.allocated", 0),
+        "alloc_retries": stats.get("num_alloc_retries", 0),
+        "allocated_mb": stats.get("allocated_bytes.all.current", 0) / 2 ** 20,
+        "reserved_mb": reserved / 2 ** 20,
+        "fragmentation": inactive / reserved if reserved else 0.0,
+    }
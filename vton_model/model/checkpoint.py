@@ -0,0 +1,213 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from safetensors.torch import load as load_tensors
+from safetensors.torch import save as save_tensors
+
+from vton_model.model.buffer_pool import BufferPool
+
+CHECKPOINT_DIR = os.getenv("VTON_CHECKPOINT_DIR", "")
+CHECKPOINT_KEY_PREFIX = os.getenv("VTON_CHECKPOINT_KEY_PREFIX", "vton:checkpoint:")
+CHECKPOINT_TTL = int(os.getenv("VTON_CHECKPOINT_TTL", "3600"))
+CHECKPOINT_EVERY = int(os.getenv("VTON_CHECKPOINT_EVERY", "10"))
+CHECKPOINT_MIN_INTERVAL = float(os.getenv("VTON_CHECKPOINT_MIN_INTERVAL", "5"))
+
+LATENT_KEYS = ("latents", "masked_latent", "mask_latent")
+
+
+def pack_state(state):
+    """
+    Denoising state -> safetensors bytes (no pickle, so a snapshot from
+    shared storage can't run code). Latents are stored as fp16.
+    """
+    tensors = {key: state[key].to(torch.float16).contiguous() for key in LATENT_KEYS}
+    for k, latent in enumerate(state["condition_latents"]):
+        tensors[f"condition_latent.{k}"] = latent.to(torch.float16).contiguous()
+    for k, generator_state in enumerate(state["generator_states"]):
+        tensors[f"generator.{k}"] = generator_state
+    tensors["step"] = torch.tensor([state["step"]], dtype=torch.int64)
+    tensors["num_steps"] = torch.tensor([state["num_steps"]], dtype=torch.int64)
+    return save_tensors(tensors)
+
+
+def unpack_state(data):
+    tensors = load_tensors(data)
+
+    def indexed(prefix):
+        keys = sorted((key for key in tensors if key.startswith(prefix)), key=lambda key: int(key[len(prefix):]))
+        return [tensors[key] for key in keys]
+
+    state = {key: tensors[key] for key in LATENT_KEYS}
+    state["condition_latents"] = indexed("condition_latent.")
+    state["generator_states"] = indexed("generator.")
+    state["step"] = int(tensors["step"][0])
+    state["num_steps"] = int(tensors["num_steps"][0])
+    return state
+
+
+class RedisCheckpointStore:
+    """Snapshots as Redis strings with a TTL; needs a client with decode_responses=False."""
+
+    def __init__(self, redis_client, prefix=CHECKPOINT_KEY_PREFIX, ttl=CHECKPOINT_TTL):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, job_id):
+        return self.redis.get(self.prefix + str(job_id))
+
+    def put(self, job_id, data):
+        self.redis.set(self.prefix + str(job_id), data, ex=self.ttl)
+
+    def delete(self, job_id):
+        self.redis.delete(self.prefix + str(job_id))
+
+
+class FileCheckpointStore:
+    """Snapshots as files under `root` (storage shared by the workers, e.g. an NFS mount)."""
+
+    def __init__(self, root=CHECKPOINT_DIR):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, job_id):
+        return os.path.join(self.root, f"{job_id}.safetensors")
+
+    def get(self, job_id):
+        try:
+            with open(self.path(job_id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, job_id, data):
+        path = self.path(job_id)
+        tmp_path = f"{path}.{os.getpid()}.part"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def delete(self, job_id):
+        try:
+            os.remove(self.path(job_id))
+        except FileNotFoundError:
+            pass
+
+
+def get_checkpoint_store(redis_client, root=CHECKPOINT_DIR):
+    """VTON_CHECKPOINT_DIR when set, otherwise Redis."""
+    if root:
+        return FileCheckpointStore(root)
+    return RedisCheckpointStore(redis_client)
+
+
+class Checkpointer:
+    """
+    Periodic snapshots of the denoising state, so a job requeued after its
+    worker was preempted resumes at the last snapshot instead of step 0.
+
+    A snapshot holds the latents after the step, the step index, the state
+    of every generator and the cached masked / mask / garment latents (so
+    the VAE encode is skipped on resume). One is taken every `every` steps
+    and at most once per `min_interval` seconds; on the denoising thread it
+    costs an fp16 cast and an async copy into pinned buffers, while
+    serialization and the store write happen on a background thread. A
+    snapshot is skipped while the previous one is still being written.
+    """
+
+    def __init__(self, store, every=CHECKPOINT_EVERY, min_interval=CHECKPOINT_MIN_INTERVAL):
+        self.store = store
+        self.every = max(1, every)
+        self.min_interval = min_interval
+        self.buffers = BufferPool(max_entries=8)
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self._in_flight = threading.Event()
+        self.saved = 0
+        self.skipped = 0
+        self.bytes = 0
+
+    def callback(self, job_id):
+        """Returns a `checkpoint_callback(step, num_steps, get_state)` for `CatVTONPipeline.__call__`."""
+        last = [time.monotonic()]
+
+        def on_step(step, num_steps, get_state):
+            done = step + 1
+            # the last step is followed by the decode: resuming there saves nothing
+            if done % self.every or done == num_steps:
+                return
+            now = time.monotonic()
+            if now - last[0] < self.min_interval or self._in_flight.is_set():
+                self.skipped += 1
+                return
+            last[0] = now
+            self._in_flight.set()
+            try:
+                state = get_state()
+                host = {"condition_latents": [], "generator_states": state["generator_states"]}
+                tensors = [(key, state[key]) for key in LATENT_KEYS]
+                tensors += [(f"condition_latent.{k}", latent) for k, latent in enumerate(state["condition_latents"])]
+                for key, tensor in tensors:
+                    tensor = tensor.to(torch.float16)
+                    buffer = self.buffers.get(key, tensor.shape, torch.float16, "cpu", pin_memory=tensor.is_cuda)
+                    buffer.copy_(tensor, non_blocking=True)
+                    if key.startswith("condition_latent."):
+                        host["condition_latents"].append(buffer)
+                    else:
+                        host[key] = buffer
+                host["step"] = done
+                host["num_steps"] = num_steps
+                event = None
+                if state["latents"].is_cuda:
+                    event = torch.cuda.Event()
+                    event.record()
+                self._pool.submit(self._save, job_id, host, event)
+            except Exception:
+                self._in_flight.clear()
+                raise
+
+        return on_step
+
+    def _save(self, job_id, host, event):
+        try:
+            if event is not None:
+                event.synchronize()
+            data = pack_state(host)
+            self.store.put(job_id, data)
+            self.saved += 1
+            self.bytes += len(data)
+        except Exception as e:
+            print(f"Checkpoint failed for job {job_id}: {e}")
+        finally:
+            self._in_flight.clear()
+
+    def load(self, job_id):
+        """The job's last snapshot (tensors on the CPU), or None (waits for a pending write)."""
+        return self._pool.submit(self._load, job_id).result()
+
+    def _load(self, job_id):
+        try:
+            data = self.store.get(job_id)
+            if data is None:
+                return None
+            state = unpack_state(data)
+            print(f"Resuming job {job_id} from step {state['step']}/{state['num_steps']}")
+            return state
+        except Exception as e:
+            print(f"Ignoring unreadable checkpoint for job {job_id}: {e}")
+            return None
+
+    def clear(self, job_id):
+        """Drop the job's snapshot once it reached a final status (waits for a pending write)."""
+        self._pool.submit(self._delete, job_id).result()
+
+    def _delete(self, job_id):
+        try:
+            self.store.delete(job_id)
+        except Exception as e:
+            print(f"Checkpoint cleanup failed for job {job_id}: {e}")
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
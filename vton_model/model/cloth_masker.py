@@ -8,6 +8,7 @@ import torch
 
 from vton_model.model.SCHP import SCHP  # type: ignore
 from vton_model.model.DensePose import DensePose  # type: ignore
+from vton_model.model.offload import offload_stage
 
 DENSE_INDEX_MAP = {
     "background": [0],
@@ -167,21 +168,38 @@ class AutoMasker:
         self.schp_processor_lip = SCHP(ckpt_path=os.path.join(schp_ckpt, 'exp-schp-201908261155-lip.pth'), device=device)
         
         self.mask_processor = VaeImageProcessor(vae_scale_factor=8, do_normalize=False, do_binarize=True, do_convert_grayscale=True)
+        self.offload = None
+
+    def enable_offload(self, manager):
+        manager.register("densepose", self.densepose_processor.predictor.model)
+        manager.register("schp_atr", self.schp_processor_atr.model)
+        manager.register("schp_lip", self.schp_processor_lip.model)
+        self.offload = manager
 
     def process_densepose(self, image_or_path):
-        return self.densepose_processor(image_or_path, resize=1024)
+        with offload_stage(self.offload, "densepose"):
+            return self.densepose_processor(image_or_path, resize=1024)
 
     def process_schp_lip(self, image_or_path):
-        return self.schp_processor_lip(image_or_path)
+        with offload_stage(self.offload, "schp_lip"):
+            return self.schp_processor_lip(image_or_path)
 
     def process_schp_atr(self, image_or_path):
-        return self.schp_processor_atr(image_or_path)
+        with offload_stage(self.offload, "schp_atr"):
+            return self.schp_processor_atr(image_or_path)
         
     def preprocess_image(self, image_or_path):
+        # each stage prefetches the next one's weights; the last one warms up the diffusion VAE
+        with offload_stage(self.offload, "densepose", prefetch="schp_atr"):
+            densepose = self.densepose_processor(image_or_path, resize=1024)
+        with offload_stage(self.offload, "schp_atr", prefetch="schp_lip"):
+            schp_atr = self.schp_processor_atr(image_or_path)
+        with offload_stage(self.offload, "schp_lip", prefetch="vae"):
+            schp_lip = self.schp_processor_lip(image_or_path)
         return {
-            'densepose': self.densepose_processor(image_or_path, resize=1024),
-            'schp_atr': self.schp_processor_atr(image_or_path),
-            'schp_lip': self.schp_processor_lip(image_or_path)
+            'densepose': densepose,
+            'schp_atr': schp_atr,
+            'schp_lip': schp_lip
         }
     
     @staticmethod
@@ -251,16 +269,23 @@ class AutoMasker:
     def __call__(
         self,
         image: Union[str, Image.Image],
-        mask_type: str = "upper",
+        mask_type: Union[str, list] = "upper",
     ):
-        assert mask_type in ['upper', 'lower', 'overall', 'inner', 'outer'], f"mask_type should be one of ['upper', 'lower', 'overall', 'inner', 'outer'], but got {mask_type}"
+        # a list of mask types (e.g. ['upper', 'lower'] for an outfit) gives the union of their masks
+        mask_types = mask_type if isinstance(mask_type, (list, tuple)) else [mask_type]
+        for part in mask_types:
+            assert part in ['upper', 'lower', 'overall', 'inner', 'outer'], f"mask_type should be one of ['upper', 'lower', 'overall', 'inner', 'outer'], but got {part}"
         preprocess_results = self.preprocess_image(image)
-        mask = self.cloth_agnostic_mask(
-            preprocess_results['densepose'], 
-            preprocess_results['schp_lip'], 
-            preprocess_results['schp_atr'], 
-            part=mask_type,
-        )
+        masks = [
+            np.array(self.cloth_agnostic_mask(
+                preprocess_results['densepose'], 
+                preprocess_results['schp_lip'], 
+                preprocess_results['schp_atr'], 
+                part=part,
+            ))
+            for part in mask_types
+        ]
+        mask = Image.fromarray(np.maximum.reduce(masks))
         return {
             'mask': mask,
             'densepose': preprocess_results['densepose'],
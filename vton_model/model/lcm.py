@@ -0,0 +1,57 @@
+import torch
+from peft import LoraConfig, get_peft_model_state_dict, inject_adapter_in_model, set_peft_model_state_dict
+from peft.tuners.tuners_utils import BaseTunerLayer
+from safetensors import safe_open
+from safetensors.torch import load_file, save_file
+
+# Linear layers of the self-attention blocks CatVTON fine-tunes (`get_trainable_module(unet, "attention")`)
+LCM_TARGET_MODULES = ["to_q", "to_k", "to_v", "to_out.0"]
+LCM_ADAPTER_NAME = "lcm"
+
+
+def add_lcm_lora(attn_modules, rank=64, alpha=None):
+    """Inject a (zero-initialised) LoRA adapter into the attention modules, in place."""
+    config = LoraConfig(
+        r=rank,
+        lora_alpha=alpha or rank,
+        target_modules=LCM_TARGET_MODULES,
+        init_lora_weights="gaussian",
+    )
+    inject_adapter_in_model(config, attn_modules, adapter_name=LCM_ADAPTER_NAME)
+    return attn_modules
+
+
+def save_lcm_lora(attn_modules, path, rank, alpha=None):
+    state_dict = get_peft_model_state_dict(attn_modules, adapter_name=LCM_ADAPTER_NAME)
+    state_dict = {k: v.detach().to("cpu", torch.float16).contiguous() for k, v in state_dict.items()}
+    save_file(state_dict, path, metadata={"rank": str(rank), "alpha": str(alpha or rank)})
+
+
+def load_lcm_lora(attn_modules, path):
+    """Add the adapter saved by `save_lcm_lora` to the attention modules (same dtype/device as the layers)."""
+    with safe_open(path, framework="pt") as f:
+        metadata = f.metadata() or {}
+    rank = int(metadata.get("rank", 64))
+    reference = next(attn_modules.parameters())
+    add_lcm_lora(attn_modules, rank=rank, alpha=float(metadata.get("alpha", rank)))
+    attn_modules.to(reference.device, reference.dtype)
+    state_dict = {k: v.to(reference.device, reference.dtype) for k, v in load_file(path).items()}
+    result = set_peft_model_state_dict(attn_modules, state_dict, adapter_name=LCM_ADAPTER_NAME)
+    unexpected = getattr(result, "unexpected_keys", None)
+    assert not unexpected, f"LCM LoRA does not match the attention modules: {unexpected[:5]}"
+    return attn_modules
+
+
+def set_lora_enabled(module, enabled):
+    """Turn the injected adapters on (few-step student) or off (original teacher weights)."""
+    for layer in module.modules():
+        if isinstance(layer, BaseTunerLayer):
+            layer.enable_adapters(enabled)
+
+
+def consistency_scalings(timesteps, sigma_data=0.5, timestep_scaling=10.0):
+    """LCM boundary-condition coefficients: f(x, t) = c_skip * x + c_out * x0_pred."""
+    scaled = timesteps.float() * timestep_scaling
+    c_skip = sigma_data ** 2 / (scaled ** 2 + sigma_data ** 2)
+    c_out = scaled / (scaled ** 2 + sigma_data ** 2) ** 0.5
+    return c_skip, c_out
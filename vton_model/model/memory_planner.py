@@ -0,0 +1,172 @@
+from collections import namedtuple
+
+import torch
+
+from vton_model.model.pipeline import DecodeOutOfMemoryError
+
+MemoryPlan = namedtuple("MemoryPlan", ["batch_size", "cfg_split", "vae_mode", "estimated_bytes"])
+
+# Execution modes from fastest / most memory hungry to slowest / leanest.
+# Each OOM moves one step down this ladder.
+MODES = [
+    (False, "full"),
+    (False, "sliced"),
+    (True, "sliced"),
+    (True, "tiled"),
+]
+# VAE modes alone, for retrying just the decode of finished latents
+VAE_MODES = ["full", "sliced", "tiled"]
+
+# Rough fp16 activation footprints for SD-1.5 sized UNet / VAE, per sample.
+# `calibrate` (run at model load) rescales them against a measured run on the actual card.
+UNET_BYTES_PER_TOKEN = 160 * 1024       # per latent pixel at peak (memory-efficient SDPA)
+VAE_DECODE_BYTES_PER_PIXEL = 10 * 1024  # per output pixel at peak
+VAE_ENCODE_BYTES_PER_PIXEL = 5 * 1024   # per input pixel at peak
+VAE_TILE_PIXELS = 512 * 512
+
+
+class MemoryPlanner:
+    """
+    Chooses how to run a `CatVTONPipeline` call on the current card.
+
+    `estimate` models the peak device memory of one call from the resolution,
+    batch size, CFG on/off and VAE mode (weights are already resident and
+    show up as used memory). `plan` returns the largest batch, and for it
+    the fastest mode, that fits in free memory minus `reserve_bytes`; when
+    not every variation fits, calling the planner runs them that many at a
+    time. On CUDA OOM it empties the cache and retries one step down `MODES`
+    (split the CFG batch, then tile the VAE) instead of failing the job; an
+    OOM in the final VAE decode retries only the decode, in a leaner VAE
+    mode. Every attempt starts from the same generator states, so a seeded
+    job gives the same image whichever mode it ends up in.
+    """
+
+    def __init__(self, pipeline, reserve_bytes=512 * 2 ** 20, device=None):
+        self.pipeline = pipeline
+        self.reserve_bytes = reserve_bytes
+        self.device = torch.device(device or pipeline.device)
+        self.scale = 1.0
+
+    def free_bytes(self):
+        if self.device.type != "cuda":
+            return float("inf")
+        free, _ = torch.cuda.mem_get_info(self.device)
+        # memory cached by the allocator but not in use is also available to us
+        cached = torch.cuda.memory_reserved(self.device) - torch.cuda.memory_allocated(self.device)
+        return free + cached - self.reserve_bytes
+
+    def estimate(self, height, width, batch_size=1, do_cfg=True, cfg_split=False, vae_mode="full", num_parts=2):
+        dtype_scale = torch.finfo(self.pipeline.weight_dtype).bits / 16
+        # person and garment(s) are concatenated along y, so the UNet sees `num_parts` times the height
+        tokens = (height // 8) * (width // 8) * num_parts
+        unet_batch = batch_size * (2 if do_cfg and not cfg_split else 1)
+        unet = unet_batch * tokens * UNET_BYTES_PER_TOKEN
+        pixels = height * width
+        vae_batch = 1 if vae_mode in ("sliced", "tiled") else batch_size
+        vae_pixels = min(pixels, VAE_TILE_PIXELS) if vae_mode == "tiled" else pixels
+        # encode runs on num_parts * N images (masked person + garments per sample), decode on N
+        encode = num_parts * vae_batch * vae_pixels * VAE_ENCODE_BYTES_PER_PIXEL
+        decode = vae_batch * vae_pixels * VAE_DECODE_BYTES_PER_PIXEL
+        # inputs, latents and pooled buffers that live for the whole call
+        resident = batch_size * pixels * 3 * 4 * 4
+        return int((max(unet, encode, decode) + resident) * dtype_scale * self.scale)
+
+    def plan(self, height, width, batch_size=1, guidance_scale=2.5, num_parts=2):
+        do_cfg = guidance_scale > 1.0
+        free = self.free_bytes()
+        # a bigger batch in a leaner mode beats running the samples in more passes
+        for batch in range(batch_size, 0, -1):
+            for cfg_split, vae_mode in MODES:
+                estimated = self.estimate(height, width, batch, do_cfg, cfg_split, vae_mode, num_parts)
+                if estimated <= free:
+                    return MemoryPlan(batch, cfg_split, vae_mode, estimated)
+        cfg_split, vae_mode = MODES[-1]
+        return MemoryPlan(1, cfg_split, vae_mode, self.estimate(height, width, 1, do_cfg, cfg_split, vae_mode, num_parts))
+
+    def calibrate(self, height, width, guidance_scale=2.5, **call_kwargs):
+        """
+        Run one short call and rescale the model so `estimate` matches the
+        measured peak. Meant for model load, before offloading is enabled, so
+        the weights are resident on both sides of the measurement.
+        """
+        if self.device.type != "cuda":
+            return self.scale
+        self.scale = 1.0
+        self.pipeline.set_vae_mode("full")
+        torch.cuda.synchronize(self.device)
+        baseline = torch.cuda.memory_allocated(self.device)
+        torch.cuda.reset_peak_memory_stats(self.device)
+        try:
+            self.pipeline(height=height, width=width, guidance_scale=guidance_scale, num_inference_steps=1, **call_kwargs)
+        except torch.cuda.OutOfMemoryError:
+            # not even one full-mode call fits: keep the default model, the OOM fallback covers the rest
+            print("Memory planner calibration ran out of memory, keeping the default estimates")
+            return self.scale
+        finally:
+            torch.cuda.empty_cache()
+        peak = torch.cuda.max_memory_allocated(self.device) - baseline
+        self.scale = peak / self.estimate(height, width, 1, guidance_scale > 1.0)
+        print(f"Memory planner calibrated: peak {peak / 2 ** 30:.2f} GiB, scale {self.scale:.2f}")
+        return self.scale
+
+    def __call__(self, height=1024, width=768, guidance_scale=2.5, **call_kwargs):
+        image = call_kwargs.get("image")
+        num_variations = call_kwargs.get("num_variations", 1)
+        batch_size = (len(image) if isinstance(image, list) else 1) * num_variations
+        num_parts = 2 + len(call_kwargs.get("extra_condition_images") or [])
+        plan = self.plan(height, width, batch_size, guidance_scale, num_parts)
+        if plan.batch_size >= batch_size or isinstance(image, list):
+            return self.run(plan, height, width, guidance_scale, call_kwargs)
+        # Not every variation fits at once: run them `plan.batch_size` at a time, each with
+        # its own generators. A snapshot covers one whole call, so chunks are not checkpointed.
+        print(f"Running {num_variations} variations {plan.batch_size} at a time")
+        generator = call_kwargs.pop("generator", None)
+        call_kwargs.update(resume_state=None, checkpoint_callback=None)
+        images = []
+        for start in range(0, num_variations, plan.batch_size):
+            count = min(plan.batch_size, num_variations - start)
+            chunk_generator = generator[start:start + count] if isinstance(generator, list) else generator
+            images += self.run(plan, height, width, guidance_scale, dict(call_kwargs, generator=chunk_generator, num_variations=count))
+        return images
+
+    def run(self, plan, height, width, guidance_scale, call_kwargs):
+        """One pipeline call under `plan`, stepping down `MODES` on CUDA OOM."""
+        start = MODES.index((plan.cfg_split, plan.vae_mode))
+        generator = call_kwargs.get("generator")
+        generators = generator if isinstance(generator, list) else [generator] if generator is not None else []
+        # a failed attempt has already drawn noise from the generators
+        generator_states = [g.get_state() for g in generators]
+        for cfg_split, vae_mode in MODES[start:]:
+            for g, state in zip(generators, generator_states):
+                g.set_state(state)
+            self.pipeline.set_vae_mode(vae_mode)
+            latents = None
+            try:
+                return self.pipeline(
+                    height=height, width=width, guidance_scale=guidance_scale, cfg_split=cfg_split, **call_kwargs
+                )
+            except DecodeOutOfMemoryError as error:
+                if vae_mode == VAE_MODES[-1]:
+                    raise
+                latents = error.latents
+            except torch.cuda.OutOfMemoryError:
+                if (cfg_split, vae_mode) == MODES[-1]:
+                    raise
+                print(f"CUDA OOM with cfg_split={cfg_split} vae_mode={vae_mode}, retrying with less memory")
+            # outside the except block so the failed call's tensors are released first
+            torch.cuda.empty_cache()
+            if latents is not None:
+                return self.decode(latents, vae_mode)
+
+    def decode(self, latents, vae_mode):
+        """Decode finished `latents` after an OOM in `vae_mode`, in the leaner VAE modes only."""
+        for mode in VAE_MODES[VAE_MODES.index(vae_mode) + 1:]:
+            print(f"CUDA OOM in the VAE decode with vae_mode={vae_mode}, retrying the decode with vae_mode={mode}")
+            self.pipeline.set_vae_mode(mode)
+            try:
+                return self.pipeline.postprocess(latents)
+            except DecodeOutOfMemoryError:
+                if mode == VAE_MODES[-1]:
+                    raise
+            vae_mode = mode
+            torch.cuda.empty_cache()
@@ -0,0 +1,145 @@
+import itertools
+from contextlib import contextmanager, nullcontext
+
+import torch
+
+OFFLOAD_POLICIES = ["none", "model", "sequential"]
+
+
+class OffloadManager:
+    """
+    Keeps model components in pinned host memory and puts them on the
+    accelerator only while their stage runs.
+
+    policy:
+        "none"       everything stays resident (default, fastest).
+        "model"      a whole component is copied in when its stage starts and
+                     dropped when it ends; the next stage's weights are copied
+                     on a side stream meanwhile, so at most two components are
+                     resident and most of the transfer is hidden.
+        "sequential" weights move per submodule around each forward call,
+                     lowest memory and slowest.
+
+    Offloading never copies weights back: the pinned host copy is the master
+    and the device copy is simply released (inference only).
+    """
+
+    def __init__(self, device="cuda", policy="none"):
+        assert policy in OFFLOAD_POLICIES, f"policy should be one of {OFFLOAD_POLICIES}, but got {policy}"
+        self.device = torch.device(device)
+        self.policy = policy
+        self.use_cuda = self.device.type == "cuda"
+        if self.use_cuda and self.device.index is None:
+            # so tensor.device comparisons against "cuda:N" work
+            self.device = torch.device("cuda", torch.cuda.current_device())
+        self._entries = {}
+        self._prefetched = {}
+        self._stream = torch.cuda.Stream(self.device) if self.use_cuda and policy == "model" else None
+        self.loads = 0
+        self.bytes_transferred = 0
+
+    def _pin(self, tensors):
+        entries = []
+        for tensor in tensors:
+            host = tensor.data.to("cpu")
+            if self.use_cuda:
+                host = host.pin_memory()
+            tensor.data = host
+            entries.append((tensor, host))
+        return entries
+
+    def register(self, name, module):
+        if self.policy == "none":
+            return module
+        if self.policy == "model":
+            self._entries[name] = self._pin(itertools.chain(module.parameters(), module.buffers()))
+        else:
+            # buffers are small and often used to pick the input device; keep them resident
+            for buffer in module.buffers():
+                buffer.data = buffer.data.to(self.device)
+            for submodule in module.modules():
+                params = list(submodule.parameters(recurse=False))
+                if not params:
+                    continue
+                entries = self._pin(params)
+                submodule.register_forward_pre_hook(lambda m, args, entries=entries: self._load_entries(entries))
+                submodule.register_forward_hook(lambda m, args, out, entries=entries: self._release_entries(entries))
+        if self.use_cuda:
+            torch.cuda.empty_cache()
+        return module
+
+    def _load_entries(self, entries):
+        for tensor, host in entries:
+            tensor.data = host.to(self.device, non_blocking=True)
+        self.loads += 1
+        self.bytes_transferred += sum(host.numel() * host.element_size() for _, host in entries)
+
+    @staticmethod
+    def _release_entries(entries):
+        for tensor, host in entries:
+            tensor.data = host
+
+    def prefetch(self, name):
+        if self.policy != "model" or name not in self._entries or name in self._prefetched:
+            return
+        entries = self._entries[name]
+        if entries[0][0].device == self.device:
+            return
+        if self._stream is None:
+            self._prefetched[name] = ([host.to(self.device) for _, host in entries], None)
+            return
+        with torch.cuda.stream(self._stream):
+            copies = [host.to(self.device, non_blocking=True) for _, host in entries]
+            event = torch.cuda.Event()
+            event.record(self._stream)
+        self._prefetched[name] = (copies, event)
+
+    def load(self, name):
+        if self.policy != "model" or name not in self._entries:
+            return
+        entries = self._entries[name]
+        if name in self._prefetched:
+            copies, event = self._prefetched.pop(name)
+            if event is not None:
+                current = torch.cuda.current_stream(self.device)
+                current.wait_event(event)
+                for copy in copies:
+                    # allocated on the side stream, used on the current one
+                    copy.record_stream(current)
+            for (tensor, _), copy in zip(entries, copies):
+                tensor.data = copy
+            self.loads += 1
+            self.bytes_transferred += sum(host.numel() * host.element_size() for _, host in entries)
+        elif entries[0][0].device != self.device:
+            self._load_entries(entries)
+
+    def offload(self, name):
+        if self.policy == "model" and name in self._entries:
+            self._release_entries(self._entries[name])
+
+    @contextmanager
+    def stage(self, name, prefetch=None):
+        self.load(name)
+        if prefetch is not None:
+            self.prefetch(prefetch)
+        try:
+            yield
+        finally:
+            self.offload(name)
+
+    def report(self):
+        report = {
+            "policy": self.policy,
+            "loads": self.loads,
+            "transferred_mb": self.bytes_transferred / 2 ** 20,
+        }
+        if self.use_cuda:
+            report["peak_allocated_mb"] = torch.cuda.max_memory_allocated(self.device) / 2 ** 20
+            report["peak_reserved_mb"] = torch.cuda.max_memory_reserved(self.device) / 2 ** 20
+        return report
+
+
+def offload_stage(manager, name, prefetch=None):
+    if manager is None:
+        return nullcontext()
+    return manager.stage(name, prefetch=prefetch)
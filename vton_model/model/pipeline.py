@@ -7,7 +7,7 @@ import numpy as np
 import torch
 import tqdm
 from accelerate import load_checkpoint_in_model
-from diffusers import AutoencoderKL, DDIMScheduler, UNet2DConditionModel
+from diffusers import AutoencoderKL, DDIMScheduler, LCMScheduler, UNet2DConditionModel
 from diffusers.pipelines.stable_diffusion.safety_checker import \
     StableDiffusionSafetyChecker
 from diffusers.utils.torch_utils import randn_tensor
@@ -15,11 +15,22 @@ from huggingface_hub import snapshot_download
 from transformers import CLIPImageProcessor
 
 from vton_model.model.attn_processor import SkipAttnProcessor
+from vton_model.model.buffer_pool import BufferPool
+from vton_model.model.lcm import load_lcm_lora, set_lora_enabled
+from vton_model.model.offload import offload_stage
 from vton_model.model.utils import get_trainable_module, init_adapter
 from vton_model.utils import (compute_vae_encodings, numpy_to_pil, prepare_image,
                    prepare_mask_image, resize_and_crop, resize_and_padding)
 
 
+class DecodeOutOfMemoryError(torch.cuda.OutOfMemoryError):
+    """CUDA OOM in the final VAE decode; `latents` are the denoised latents, ready for `postprocess`."""
+
+    def __init__(self, latents):
+        super().__init__("CUDA out of memory in the VAE decode")
+        self.latents = latents
+
+
 class CatVTONPipeline:
     def __init__(
         self, 
@@ -31,10 +42,14 @@ class CatVTONPipeline:
         compile=False,
         skip_safety_check=False,
         use_tf32=True,
+        use_buffer_pool=True,
     ):
         self.device = device
         self.weight_dtype = weight_dtype
         self.skip_safety_check = skip_safety_check
+        self.buffers = BufferPool(enabled=use_buffer_pool)
+        self.offload = None
+        self.lcm_scheduler = None
 
         self.noise_scheduler = DDIMScheduler.from_pretrained(base_ckpt, subfolder="scheduler")
         self.vae = AutoencoderKL.from_pretrained("stabilityai/sd-vae-ft-mse").to(device, dtype=weight_dtype)
@@ -68,33 +83,159 @@ class CatVTONPipeline:
             print(f"Downloaded {attn_ckpt} to {repo_path}")
             load_checkpoint_in_model(self.attn_modules, os.path.join(repo_path, sub_folder, 'attention'))
             
+    def load_lcm_lora(self, lora_path):
+        """
+        Add a consistency-distilled LoRA to the attention modules for 4-8 step
+        sampling (`use_lcm=True`). Load it before `enable_offload`. The adapter
+        is switched off for regular DDIM calls, so both modes stay available.
+        """
+        load_lcm_lora(self.attn_modules, lora_path)
+        set_lora_enabled(self.attn_modules, False)
+        self.lcm_scheduler = LCMScheduler.from_config(self.noise_scheduler.config)
+
+    def enable_offload(self, manager):
+        """Hand the UNet, VAE and safety checker to an `OffloadManager`."""
+        manager.register("vae", self.vae)
+        manager.register("unet", self.unet)
+        if not self.skip_safety_check:
+            manager.register("safety_checker", self.safety_checker)
+        self.offload = manager
+
     def run_safety_checker(self, image):
         if self.safety_checker is None:
             has_nsfw_concept = None
         else:
             safety_checker_input = self.feature_extractor(image, return_tensors="pt").to(self.device)
-            image, has_nsfw_concept = self.safety_checker(
-                images=image, clip_input=safety_checker_input.pixel_values.to(self.weight_dtype)
-            )
+            with offload_stage(self.offload, "safety_checker"):
+                image, has_nsfw_concept = self.safety_checker(
+                    images=image, clip_input=safety_checker_input.pixel_values.to(self.weight_dtype)
+                )
         return image, has_nsfw_concept
     
     def check_inputs(self, image, condition_image, mask, width, height):
-        if isinstance(image, torch.Tensor) and isinstance(condition_image, torch.Tensor) and isinstance(mask, torch.Tensor):
-            return image, condition_image, mask
-        assert image.size == mask.size, "Image and mask must have the same size"
-        image = resize_and_crop(image, (width, height))
-        mask = resize_and_crop(mask, (width, height))
-        condition_image = resize_and_padding(condition_image, (width, height))
+        if isinstance(image, list):
+            # Multi-job batch: one (person, garment, mask) triple per job
+            assert len(image) == len(condition_image) == len(mask), "Batch inputs must have the same length"
+            checked = [self.check_inputs(i, c, m, width, height) for i, c, m in zip(image, condition_image, mask)]
+            return tuple(list(x) for x in zip(*checked))
+        # tensors (e.g. from `resize_and_crop_tensor`) are taken as already at (width, height) and normalized
+        if not isinstance(image, torch.Tensor):
+            if not isinstance(mask, torch.Tensor):
+                assert image.size == mask.size, "Image and mask must have the same size"
+            image = resize_and_crop(image, (width, height))
+        if not isinstance(mask, torch.Tensor):
+            mask = resize_and_crop(mask, (width, height))
+        if not isinstance(condition_image, torch.Tensor):
+            condition_image = resize_and_padding(condition_image, (width, height))
         return image, condition_image, mask
+
+    def check_extra_conditions(self, condition_images, width, height):
+        # one entry per additional garment, each shaped like `condition_image` (a list for a batch)
+        checked = []
+        for condition_image in condition_images:
+            if isinstance(condition_image, list):
+                condition_image = [
+                    c if isinstance(c, torch.Tensor) else resize_and_padding(c, (width, height)) for c in condition_image
+                ]
+            elif not isinstance(condition_image, torch.Tensor):
+                condition_image = resize_and_padding(condition_image, (width, height))
+            checked.append(prepare_image(condition_image))
+        return checked
     
-    def prepare_extra_step_kwargs(self, generator, eta):
+    def encode_images(self, *images):
+        """
+        VAE-encode several image batches with a single `vae.encode` call.
+
+        The inputs are copied (and cast) into one pooled, contiguous input
+        buffer that is reused while the batch shape stays the same, so a
+        masked person + garment pair, or 2N images for N batched jobs, cost
+        one kernel sequence instead of one per image. Returns the latents
+        split back per input.
+        """
+        sizes = [image.shape[0] for image in images]
+        shape = (sum(sizes), *images[0].shape[1:])
+        buffer = self.buffers.get("vae_input", shape, self.vae.dtype, self.device)
+        offset = 0
+        for image, size in zip(images, sizes):
+            buffer[offset:offset + size].copy_(image, non_blocking=True)
+            offset += size
+        with offload_stage(self.offload, "vae", prefetch="unet"):
+            latents = compute_vae_encodings(buffer, self.vae, device=self.device)
+        return latents.split(sizes)
+
+    def set_vae_mode(self, mode):
+        """
+        "full" encodes/decodes the whole batch at once, "sliced" one image at
+        a time, "tiled" in overlapping tiles (lowest peak memory, slowest).
+        """
+        if mode == "full":
+            self.vae.disable_slicing()
+            self.vae.disable_tiling()
+        elif mode == "sliced":
+            self.vae.enable_slicing()
+            self.vae.disable_tiling()
+        elif mode == "tiled":
+            self.vae.enable_slicing()
+            self.vae.enable_tiling()
+        else:
+            raise ValueError(f"Unknown vae mode: {mode}")
+
+    def decode_latents(self, latents):
+        latents = 1 / self.vae.config.scaling_factor * latents
+        next_stage = None if self.skip_safety_check else "safety_checker"
+        with offload_stage(self.offload, "vae", prefetch=next_stage):
+            image = self.vae.decode(latents.to(self.device, dtype=self.weight_dtype)).sample
+        image = (image / 2 + 0.5).clamp(0, 1)
+        # we always cast to float32 as this does not cause significant overhead and is compatible with bfloat16
+        image = image.permute(0, 2, 3, 1)
+        pin = torch.device(self.device).type == "cuda"
+        host = self.buffers.get("decode_output", image.shape, torch.float32, "cpu", pin_memory=pin)
+        host.copy_(image)
+        # numpy_to_pil makes its own uint8 copy, so the pooled buffer can be reused
+        return numpy_to_pil(host.numpy())
+
+    def postprocess(self, latents):
+        """Decode the final latents to PIL images and run the safety check."""
+        try:
+            image = self.decode_latents(latents)
+        except torch.cuda.OutOfMemoryError as error:
+            # the denoising is done: hand the latents back so only the decode is retried (see `MemoryPlanner`)
+            raise DecodeOutOfMemoryError(latents) from error
+
+        # Safety Check
+        if not self.skip_safety_check:
+            current_script_directory = os.path.dirname(os.path.realpath(__file__))
+            nsfw_image = os.path.join(os.path.dirname(current_script_directory), 'resource', 'img', 'NSFW.jpg')
+            nsfw_image = PIL.Image.open(nsfw_image).resize(image[0].size)
+            image_np = np.array(image)
+            _, has_nsfw_concept = self.run_safety_checker(image=image_np)
+            for i, not_safe in enumerate(has_nsfw_concept):
+                if not_safe:
+                    image[i] = nsfw_image
+        return image
+
+    def check_resume_state(self, state, image, num_conditions, num_variations, num_steps, num_generators):
+        """True when a snapshot (see `Checkpointer`) was taken for a call shaped like this one."""
+        scale = 2 ** (len(self.vae.config.block_out_channels) - 1)
+        masked_latent = state["masked_latent"]
+        return (
+            (masked_latent.shape[0], *masked_latent.shape[-2:])
+            == (image.shape[0] * num_variations, image.shape[-2] // scale, image.shape[-1] // scale)
+            and len(state["condition_latents"]) == num_conditions
+            and len(state["generator_states"]) == num_generators
+            and state["num_steps"] == num_steps
+            and 0 < state["step"] < num_steps
+        )
+
+    def prepare_extra_step_kwargs(self, generator, eta, scheduler=None):
         # prepare extra kwargs for the scheduler step, since not all schedulers have the same signature
         # eta (η) is only used with the DDIMScheduler, it will be ignored for other schedulers.
         # eta corresponds to η in DDIM paper: https://arxiv.org/abs/2010.02502
         # and should be between [0, 1]
 
+        scheduler = scheduler or self.noise_scheduler
         accepts_eta = "eta" in set(
-            inspect.signature(self.noise_scheduler.step).parameters.keys()
+            inspect.signature(scheduler.step).parameters.keys()
         )
         extra_step_kwargs = {}
         if accepts_eta:
@@ -102,7 +243,7 @@ class CatVTONPipeline:
 
         # check if the scheduler accepts generator
         accepts_generator = "generator" in set(
-            inspect.signature(self.noise_scheduler.step).parameters.keys()
+            inspect.signature(scheduler.step).parameters.keys()
         )
         if accepts_generator:
             extra_step_kwargs["generator"] = generator
@@ -120,62 +261,155 @@ class CatVTONPipeline:
         width: int = 768,
         generator=None,
         eta=1.0,
+        cfg_split=False,
+        extra_condition_images=None,
+        num_variations=1,
+        init_image=None,
+        strength=1.0,
+        use_lcm=False,
+        callback=None,
+        resume_state=None,
+        checkpoint_callback=None,
         **kwargs
     ):
         concat_dim = -2  # FIXME: y axis concat
+        assert 0.0 < strength <= 1.0, f"strength should be in (0, 1], but got {strength}"
+        assert not use_lcm or self.lcm_scheduler is not None, "use_lcm needs `load_lcm_lora` first"
+        # few-step mode: distilled LoRA on, LCM sampler; otherwise the original weights with DDIM
+        scheduler = self.lcm_scheduler if use_lcm else self.noise_scheduler
+        if self.lcm_scheduler is not None:
+            set_lora_enabled(self.attn_modules, use_lcm)
         # Prepare inputs to Tensor
         image, condition_image, mask = self.check_inputs(image, condition_image, mask, width, height)
         image = prepare_image(image).to(self.device, dtype=self.weight_dtype)
-        condition_image = prepare_image(condition_image).to(self.device, dtype=self.weight_dtype)
+        condition_image = prepare_image(condition_image)
+        # Further garments (e.g. the lower half of an outfit) are stacked after the first one
+        extra_condition_images = self.check_extra_conditions(extra_condition_images or [], width, height)
         mask = prepare_mask_image(mask).to(self.device, dtype=self.weight_dtype)
         # Mask image
         masked_image = image * (mask < 0.5)
-        # VAE encoding
-        masked_latent = compute_vae_encodings(masked_image, self.vae)
-        condition_latent = compute_vae_encodings(condition_image, self.vae)
-        mask_latent = torch.nn.functional.interpolate(mask, size=masked_latent.shape[-2:], mode="nearest")
-        del image, mask, condition_image
-        # Concatenate latents
-        masked_latent_concat = torch.cat([masked_latent, condition_latent], dim=concat_dim)
-        mask_latent_concat = torch.cat([mask_latent, torch.zeros_like(mask_latent)], dim=concat_dim)
-        # Prepare noise
-        latents = randn_tensor(
-            masked_latent_concat.shape,
-            generator=generator,
-            device=masked_latent_concat.device,
-            dtype=self.weight_dtype,
-        )
+        # Refinement: a previous result (same framing as the person) to start from
+        init_images = []
+        if init_image is not None:
+            if not isinstance(init_image, torch.Tensor):
+                init_image = resize_and_crop(init_image, (width, height))
+            init_images.append(prepare_image(init_image))
         # Prepare timesteps
-        self.noise_scheduler.set_timesteps(num_inference_steps, device=self.device)
-        timesteps = self.noise_scheduler.timesteps
-        latents = latents * self.noise_scheduler.init_noise_sigma
-        # Classifier-Free Guidance
-        if do_classifier_free_guidance := (guidance_scale > 1.0):
-            masked_latent_concat = torch.cat(
-                [
-                    torch.cat([masked_latent, torch.zeros_like(condition_latent)], dim=concat_dim),
-                    masked_latent_concat,
-                ]
+        scheduler.set_timesteps(num_inference_steps, device=self.device)
+        timesteps = scheduler.timesteps
+        if init_images:
+            # Refinement starts `strength` of the way into the schedule and runs only the remaining steps
+            t_start = num_inference_steps - max(1, min(int(num_inference_steps * strength), num_inference_steps))
+            timesteps = timesteps[t_start * scheduler.order:]
+            num_inference_steps = len(timesteps) // scheduler.order
+        generators = generator if isinstance(generator, list) else [generator] if generator is not None else []
+        if resume_state is not None and not self.check_resume_state(
+            resume_state, image, 1 + len(extra_condition_images), num_variations, len(timesteps), len(generators)
+        ):
+            print("Checkpoint does not match this call, starting from the first step")
+            resume_state = None
+        if resume_state is None:
+            # VAE encoding (masked person, every garment and the init image in one batch)
+            masked_latent, *condition_latents = self.encode_images(
+                masked_image, condition_image, *extra_condition_images, *init_images
+            )
+            init_latents = [condition_latents.pop()] if init_images else []
+            mask_latent = torch.nn.functional.interpolate(mask, size=masked_latent.shape[-2:], mode="nearest")
+        else:
+            # Resuming a preempted job: the snapshot has the conditioning latents, no VAE encode
+            masked_latent, mask_latent, *condition_latents = (
+                latent.to(self.device, dtype=self.weight_dtype)
+                for latent in (resume_state["masked_latent"], resume_state["mask_latent"], *resume_state["condition_latents"])
+            )
+            init_latents = []
+        del image, mask, condition_image, extra_condition_images, init_image, init_images
+        if num_variations > 1 and resume_state is None:
+            # Encoded once; each variation is one more sample in the same denoising batch,
+            # seeded by its own entry of `generator` (a list of num_variations * batch generators)
+            masked_latent, mask_latent, *condition_latents = (
+                latent.repeat_interleave(num_variations, dim=0)
+                for latent in (masked_latent, mask_latent, *condition_latents, *init_latents)
+            )
+            if init_latents:
+                init_latents = [condition_latents.pop()]
+        batch_size = masked_latent.shape[0]
+        num_parts = 1 + len(condition_latents)
+        latent_shape = list(masked_latent.shape)
+        latent_shape[concat_dim] *= num_parts
+        start_step = 0
+        if resume_state is not None:
+            # latents after step `step - 1`, and the generators as they were at that point
+            start_step = resume_state["step"]
+            latents = resume_state["latents"].to(self.device, dtype=self.weight_dtype)
+            for g, generator_state in zip(generators, resume_state["generator_states"]):
+                g.set_state(generator_state)
+        else:
+            # Prepare noise
+            latents = randn_tensor(
+                latent_shape,
+                generator=generator,
+                device=masked_latent.device,
+                dtype=self.weight_dtype,
             )
-            mask_latent_concat = torch.cat([mask_latent_concat] * 2)
+            if init_latents:
+                # Noise the previous result (person part) and the garments up to the first timestep
+                init_latents = torch.cat([init_latents[0], *condition_latents], dim=concat_dim)
+                latents = scheduler.add_noise(init_latents, latents, timesteps[:1])
+                del init_latents
+            else:
+                latents = latents * scheduler.init_noise_sigma
+        # UNet input = [noisy latents | mask | masked person + garment] on the channel axis,
+        # with the CFG batch as [unconditional, conditional]. Only the first 4 channels
+        # change between steps, so the conditioning channels are written once per job.
+        do_classifier_free_guidance = guidance_scale > 1.0
+        num_branches = 2 if do_classifier_free_guidance else 1
+        num_channels = latent_shape[1]
+        unet_input = self.buffers.get(
+            "unet_input",
+            (num_branches * batch_size, 2 * num_channels + 1, *latent_shape[2:]),
+            self.weight_dtype,
+            self.device,
+        )
+        noisy_input = unet_input[:, :num_channels].unflatten(0, (num_branches, batch_size))
+        condition_input = unet_input[:, num_channels:].unflatten(0, (num_branches, batch_size))
+        person_part, *garment_parts = condition_input.chunk(num_parts, dim=concat_dim)
+        person_part[:, :, :1] = mask_latent
+        person_part[:, :, 1:] = masked_latent
+        for garment_part, condition_latent in zip(garment_parts, condition_latents):
+            garment_part.zero_()
+            garment_part[-1, :, 1:] = condition_latent  # unconditional branch keeps a zero garment
+
+        def denoise_state():
+            # everything needed to continue after the current step (see `Checkpointer`)
+            return {
+                "latents": latents,
+                "masked_latent": masked_latent,
+                "mask_latent": mask_latent,
+                "condition_latents": condition_latents,
+                "generator_states": [g.get_state() for g in generators],
+            }
 
         # Denoising loop
-        extra_step_kwargs = self.prepare_extra_step_kwargs(generator, eta)
-        num_warmup_steps = (len(timesteps) - num_inference_steps * self.noise_scheduler.order)
-        with tqdm.tqdm(total=num_inference_steps) as progress_bar:
-            for i, t in enumerate(timesteps):
-                # expand the latents if we are doing classifier free guidance
-                non_inpainting_latent_model_input = (torch.cat([latents] * 2) if do_classifier_free_guidance else latents)
-                non_inpainting_latent_model_input = self.noise_scheduler.scale_model_input(non_inpainting_latent_model_input, t)
-                # prepare the input for the inpainting model
-                inpainting_latent_model_input = torch.cat([non_inpainting_latent_model_input, mask_latent_concat, masked_latent_concat], dim=1)
-                # predict the noise residual
-                noise_pred= self.unet(
-                    inpainting_latent_model_input,
-                    t.to(self.device),
-                    encoder_hidden_states=None, # FIXME
-                    return_dict=False,
-                )[0]
+        extra_step_kwargs = self.prepare_extra_step_kwargs(generator, eta, scheduler)
+        num_warmup_steps = (len(timesteps) - num_inference_steps * scheduler.order)
+        progress = tqdm.tqdm(total=num_inference_steps, initial=start_step // scheduler.order)
+        with offload_stage(self.offload, "unet", prefetch="vae"), progress as progress_bar:
+            for i, t in enumerate(timesteps[start_step:], start=start_step):
+                # write the (scaled) latents into every CFG branch of the input buffer in place
+                noisy_input.copy_(scheduler.scale_model_input(latents, t).unsqueeze(0))
+                # predict the noise residual (one UNet call per CFG branch when memory is tight)
+                if cfg_split and num_branches > 1:
+                    noise_pred = torch.cat([
+                        self.unet(branch, t.to(self.device), encoder_hidden_states=None, return_dict=False)[0]
+                        for branch in unet_input.chunk(num_branches)
+                    ])
+                else:
+                    noise_pred= self.unet(
+                        unet_input,
+                        t.to(self.device),
+                        encoder_hidden_states=None, # FIXME
+                        return_dict=False,
+                    )[0]
                 # perform guidance
                 if do_classifier_free_guidance:
                     noise_pred_uncond, noise_pred_text = noise_pred.chunk(2)
@@ -183,36 +417,25 @@ class CatVTONPipeline:
                         noise_pred_text - noise_pred_uncond
                     )
                 # compute the previous noisy sample x_t -> x_t-1
-                latents = self.noise_scheduler.step(
+                latents = scheduler.step(
                     noise_pred, t, latents, **extra_step_kwargs
                 ).prev_sample
                 # call the callback, if provided
                 if i == len(timesteps) - 1 or (
                     (i + 1) > num_warmup_steps
-                    and (i + 1) % self.noise_scheduler.order == 0
+                    and (i + 1) % scheduler.order == 0
                 ):
                     progress_bar.update()
+                    if callback is not None:
+                        # callback(step, num_steps, latents) with the person part of the latents
+                        callback(i, len(timesteps), latents.chunk(num_parts, dim=concat_dim)[0])
+                if checkpoint_callback is not None:
+                    # checkpoint_callback(step, num_steps, get_state); the callee decides whether to snapshot
+                    checkpoint_callback(i, len(timesteps), denoise_state)
 
         # Decode the final latents
-        latents = latents.split(latents.shape[concat_dim] // 2, dim=concat_dim)[0]
-        latents = 1 / self.vae.config.scaling_factor * latents
-        image = self.vae.decode(latents.to(self.device, dtype=self.weight_dtype)).sample
-        image = (image / 2 + 0.5).clamp(0, 1)
-        # we always cast to float32 as this does not cause significant overhead and is compatible with bfloat16
-        image = image.cpu().permute(0, 2, 3, 1).float().numpy()
-        image = numpy_to_pil(image)
-        
-        # Safety Check
-        if not self.skip_safety_check:
-            current_script_directory = os.path.dirname(os.path.realpath(__file__))
-            nsfw_image = os.path.join(os.path.dirname(current_script_directory), 'resource', 'img', 'NSFW.jpg')
-            nsfw_image = PIL.Image.open(nsfw_image).resize(image[0].size)
-            image_np = np.array(image)
-            _, has_nsfw_concept = self.run_safety_checker(image=image_np)
-            for i, not_safe in enumerate(has_nsfw_concept):
-                if not_safe:
-                    image[i] = nsfw_image
-        return image
+        latents = latents.split(latents.shape[concat_dim] // num_parts, dim=concat_dim)[0]
+        return self.postprocess(latents)
 
 
 class CatVTONPix2PixPipeline(CatVTONPipeline):
@@ -226,7 +449,7 @@ class CatVTONPix2PixPipeline(CatVTONPipeline):
             load_checkpoint_in_model(self.attn_modules, os.path.join(repo_path, version, 'attention'))
     
     def check_inputs(self, image, condition_image, width, height):
-        if isinstance(image, torch.Tensor) and isinstance(condition_image, torch.Tensor) and isinstance(torch.Tensor):
+        if isinstance(image, torch.Tensor) and isinstance(condition_image, torch.Tensor):
             return image, condition_image
         image = resize_and_crop(image, (width, height))
         condition_image = resize_and_padding(condition_image, (width, height))
@@ -243,17 +466,21 @@ class CatVTONPix2PixPipeline(CatVTONPipeline):
         width: int = 768,
         generator=None,
         eta=1.0,
+        num_variations=1,
+        callback=None,
         **kwargs
     ):
         concat_dim = -1
         # Prepare inputs to Tensor
         image, condition_image = self.check_inputs(image, condition_image, width, height)
-        image = prepare_image(image).to(self.device, dtype=self.weight_dtype)
-        condition_image = prepare_image(condition_image).to(self.device, dtype=self.weight_dtype)
-        # VAE encoding
-        image_latent = compute_vae_encodings(image, self.vae)
-        condition_latent = compute_vae_encodings(condition_image, self.vae)
+        image = prepare_image(image)
+        condition_image = prepare_image(condition_image)
+        # VAE encoding (person and garment in one batch)
+        image_latent, condition_latent = self.encode_images(image, condition_image)
         del image, condition_image
+        if num_variations > 1:
+            image_latent = image_latent.repeat_interleave(num_variations, dim=0)
+            condition_latent = condition_latent.repeat_interleave(num_variations, dim=0)
         # Concatenate latents
         condition_latent_concat = torch.cat([image_latent, condition_latent], dim=concat_dim)
         # Prepare noise
@@ -279,7 +506,7 @@ class CatVTONPix2PixPipeline(CatVTONPipeline):
         # Denoising loop
         extra_step_kwargs = self.prepare_extra_step_kwargs(generator, eta)
         num_warmup_steps = (len(timesteps) - num_inference_steps * self.noise_scheduler.order)
-        with tqdm.tqdm(total=num_inference_steps) as progress_bar:
+        with offload_stage(self.offload, "unet", prefetch="vae"), tqdm.tqdm(total=num_inference_steps) as progress_bar:
             for i, t in enumerate(timesteps):
                 # expand the latents if we are doing classifier free guidance
                 latent_model_input = (torch.cat([latents] * 2) if do_classifier_free_guidance else latents)
@@ -309,24 +536,9 @@ class CatVTONPix2PixPipeline(CatVTONPipeline):
                     and (i + 1) % self.noise_scheduler.order == 0
                 ):
                     progress_bar.update()
+                    if callback is not None:
+                        callback(i, len(timesteps), latents.chunk(2, dim=concat_dim)[0])
 
         # Decode the final latents
         latents = latents.split(latents.shape[concat_dim] // 2, dim=concat_dim)[0]
-        latents = 1 / self.vae.config.scaling_factor * latents
-        image = self.vae.decode(latents.to(self.device, dtype=self.weight_dtype)).sample
-        image = (image / 2 + 0.5).clamp(0, 1)
-        # we always cast to float32 as this does not cause significant overhead and is compatible with bfloat16
-        image = image.cpu().permute(0, 2, 3, 1).float().numpy()
-        image = numpy_to_pil(image)
-        
-        # Safety Check
-        if not self.skip_safety_check:
-            current_script_directory = os.path.dirname(os.path.realpath(__file__))
-            nsfw_image = os.path.join(os.path.dirname(current_script_directory), 'resource', 'img', 'NSFW.jpg')
-            nsfw_image = PIL.Image.open(nsfw_image).resize(image[0].size)
-            image_np = np.array(image)
-            _, has_nsfw_concept = self.run_safety_checker(image=image_np)
-            for i, not_safe in enumerate(has_nsfw_concept):
-                if not_safe:
-                    image[i] = nsfw_image
-        return image
+        return self.postprocess(latents)
@@ -0,0 +1,123 @@
+import base64
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from PIL import Image
+
+from vton_model.model.buffer_pool import BufferPool
+
+PREVIEW_CHANNEL_PREFIX = os.getenv("VTON_PREVIEW_CHANNEL_PREFIX", "vton:preview:")
+PREVIEW_EVERY = int(os.getenv("VTON_PREVIEW_EVERY", "5"))
+PREVIEW_MIN_INTERVAL = float(os.getenv("VTON_PREVIEW_MIN_INTERVAL", "0.5"))
+
+# Least-squares projection of SD 1.x VAE latents to RGB in [-1, 1]; good enough
+# for a blurry preview at latent resolution (1/8 of the output) without the VAE.
+LATENT_RGB_FACTORS = [
+    [0.298, 0.207, 0.208],
+    [0.187, 0.286, 0.173],
+    [-0.158, 0.189, 0.264],
+    [-0.184, -0.271, -0.473],
+]
+
+
+def latents_to_rgb(latents):
+    """(B, 4, h, w) latents -> (B, h, w, 3) uint8 on the same device."""
+    factors = torch.tensor(LATENT_RGB_FACTORS, device=latents.device, dtype=latents.dtype)
+    rgb = torch.einsum("bchw,cr->bhwr", latents, factors)
+    return ((rgb + 1) * 127.5).clamp(0, 255).to(torch.uint8)
+
+
+class PreviewPublisher:
+    """
+    Per-step pipeline callback that publishes JPEG previews and progress
+    over Redis pub/sub (channel `PREVIEW_CHANNEL_PREFIX + job_id`).
+
+    Previews are throttled to every `every` steps and at most one per
+    `min_interval` seconds. On the denoising thread a preview costs one
+    einsum on the latents and an async copy into a pinned buffer; the wait
+    for the copy, JPEG encoding and publishing happen on a background
+    thread, and a preview is dropped while the previous one is in flight.
+
+    Messages are JSON: {"job_id", "step", "steps", "progress", "image"},
+    with `image` a base64 JPEG (omitted on the final progress message).
+    """
+
+    def __init__(self, redis_client, every=PREVIEW_EVERY, min_interval=PREVIEW_MIN_INTERVAL,
+                 channel_prefix=PREVIEW_CHANNEL_PREFIX, scale=2, quality=70):
+        self.redis = redis_client
+        self.every = max(1, every)
+        self.min_interval = min_interval
+        self.channel_prefix = channel_prefix
+        self.scale = scale
+        self.quality = quality
+        self.buffers = BufferPool(max_entries=2)
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview")
+        self._in_flight = threading.Event()
+        self.published = 0
+        self.dropped = 0
+
+    def callback(self, job_id):
+        """Returns a `callback(step, num_steps, latents)` for `CatVTONPipeline.__call__`."""
+        last = [0.0]
+
+        def on_step(step, num_steps, latents):
+            done = step + 1
+            if done % self.every and done != num_steps:
+                return
+            now = time.monotonic()
+            if now - last[0] < self.min_interval or self._in_flight.is_set():
+                self.dropped += 1
+                return
+            last[0] = now
+            self._in_flight.set()
+            try:
+                rgb = latents_to_rgb(latents[:1])[0]
+                host = self.buffers.get("preview", rgb.shape, torch.uint8, "cpu", pin_memory=rgb.is_cuda)
+                host.copy_(rgb, non_blocking=True)
+                event = None
+                if rgb.is_cuda:
+                    event = torch.cuda.Event()
+                    event.record()
+                self._pool.submit(self._publish, job_id, done, num_steps, host, event)
+            except Exception:
+                self._in_flight.clear()
+                raise
+
+        return on_step
+
+    def _publish(self, job_id, step, num_steps, host, event):
+        try:
+            if event is not None:
+                event.synchronize()
+            image = Image.fromarray(host.numpy())
+            if self.scale != 1:
+                image = image.resize((image.width * self.scale, image.height * self.scale), Image.BILINEAR)
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=self.quality)
+            self._send(job_id, step, num_steps, base64.b64encode(buffer.getvalue()).decode("ascii"))
+            self.published += 1
+        except Exception as e:
+            print(f"Preview publish failed for job {job_id}: {e}")
+        finally:
+            self._in_flight.clear()
+
+    def _send(self, job_id, step, num_steps, image=None):
+        message = {"job_id": job_id, "step": step, "steps": num_steps, "progress": round(100 * step / num_steps)}
+        if image is not None:
+            message["image"] = image
+        self.redis.publish(self.channel_prefix + str(job_id), json.dumps(message))
+
+    def finish(self, job_id):
+        """Final 100% message (no image; the result itself follows via the job status)."""
+        try:
+            self._send(job_id, 1, 1)
+        except Exception as e:
+            print(f"Preview publish failed for job {job_id}: {e}")
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
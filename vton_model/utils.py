@@ -4,7 +4,7 @@ import math
 import PIL
 import numpy as np
 import torch
-from PIL import Image
+from PIL import Image, ImageOps
 from accelerate.state import AcceleratorState
 from packaging import version
 import accelerate
@@ -95,17 +95,19 @@ def prepare_inpainting_input(
     return noisy_latents
 
 # Compute VAE encodings
-def compute_vae_encodings(image: torch.Tensor, vae: torch.nn.Module) -> torch.Tensor:
+def compute_vae_encodings(image: torch.Tensor, vae: torch.nn.Module, device=None) -> torch.Tensor:
     """
     Args:
         images (torch.Tensor): image to be encoded
         vae (torch.nn.Module): vae model
+        device: execution device, defaults to `vae.device` (pass it when the
+            VAE weights may be offloaded to the host)
 
     Returns:
         torch.Tensor: latent encoding of the image
     """
-    pixel_values = image.to(memory_format=torch.contiguous_format).float()
-    pixel_values = pixel_values.to(vae.device, dtype=vae.dtype)
+    # single cast straight to the VAE dtype/device (no float32 staging copy)
+    pixel_values = image.to(device or vae.device, dtype=vae.dtype, memory_format=torch.contiguous_format)
     with torch.no_grad():
         model_input = vae.encode(pixel_values).latent_dist.sample()
     model_input = model_input * vae.config.scaling_factor
@@ -583,9 +585,41 @@ def is_xformers_available():
         )
 
 
-def resize_and_crop(image, size):
-    # Crop to size ratio
+def load_image_reduced(image, size, fit="crop"):
+    """
+    Decode an image directly at (roughly) the resolution `resize_and_crop`
+    (fit="crop") or `resize_and_padding` (fit="padding") needs for `size`.
+
+    For JPEGs this uses libjpeg DCT scaling via `Image.draft`, which picks the
+    smallest 1/2, 1/4 or 1/8 scale that is still at or above the target, so a
+    48 MP upload is never fully decoded. EXIF orientation is applied after the
+    reduced decode. Accepts a path, file object or a not-yet-loaded PIL image.
+    """
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    orientation = image.getexif().get(0x0112, 1)
     w, h = image.size
+    transposed = orientation in (5, 6, 7, 8)
+    if transposed:
+        w, h = h, w
+    target_w, target_h = size
+    if fit == "crop":
+        scale = max(target_w / w, target_h / h)
+    else:
+        scale = min(target_w / w, target_h / h)
+    if scale < 1:
+        draft_size = (math.ceil(w * scale), math.ceil(h * scale))
+        if transposed:
+            draft_size = draft_size[::-1]
+        # no-op for non-JPEG or already loaded images
+        image.draft("RGB", draft_size)
+    image = ImageOps.exif_transpose(image)
+    return image.convert("RGB")
+
+
+def crop_box(image_size, size):
+    """The (left, top, right, bottom) region of an `image_size` image that `resize_and_crop` keeps for `size`."""
+    w, h = image_size
     target_w, target_h = size
     if w / h < target_w / target_h:
         new_w = w
@@ -593,14 +627,95 @@ def resize_and_crop(image, size):
     else:
         new_h = h
         new_w = h * target_w // target_h
-    image = image.crop(
-        ((w - new_w) // 2, (h - new_h) // 2, (w + new_w) // 2, (h + new_h) // 2)
-    )
+    return ((w - new_w) // 2, (h - new_h) // 2, (w + new_w) // 2, (h + new_h) // 2)
+
+
+def resize_and_crop(image, size):
+    # Crop to size ratio
+    image = image.crop(crop_box(image.size, size))
     # resize
     image = image.resize(size, Image.LANCZOS)
     return image
 
 
+def mask_roi_box(mask, margin=48, bucket=64, min_size=256):
+    """
+    Crop box around the non-zero area of `mask` with `margin` pixels of
+    context on every side, grown to a multiple of `bucket` (at least
+    `min_size`) per axis and shifted to stay inside the frame.
+
+    Returns None when the mask is empty or the box would cover the whole frame.
+    """
+    width, height = mask.size
+    bbox = mask.getbbox()
+    if bbox is None:
+        return None
+
+    def span(low, high, limit):
+        low, high = max(0, low - margin), min(limit, high + margin)
+        length = min(limit, max(min_size, math.ceil((high - low) / bucket) * bucket))
+        start = min(max(0, (low + high - length) // 2), limit - length)
+        return start, start + length
+
+    left, right = span(bbox[0], bbox[2], width)
+    top, bottom = span(bbox[1], bbox[3], height)
+    if (right - left, bottom - top) == (width, height):
+        return None
+    return left, top, right, bottom
+
+
+def frame_box(image_size, size, infer_size):
+    """
+    The (fractional) region of an `image_size` photo that a pipeline output
+    at `infer_size` shows, when the photo was first `resize_and_crop`-ed to
+    the model `size` and then again to `infer_size` (e.g. 2:3 then 3:4).
+    """
+    left, top, right, bottom = crop_box(image_size, size)
+    scale_x = (right - left) / size[0]
+    scale_y = (bottom - top) / size[1]
+    inner = crop_box(size, infer_size)
+    return (left + inner[0] * scale_x, top + inner[1] * scale_y, left + inner[2] * scale_x, top + inner[3] * scale_y)
+
+
+def composite_full_resolution(result, original, mask, box=None):
+    """
+    Map a generated image back onto the original-resolution photo and blend
+    it in with the (blurred) mask.
+
+    Only the mask's bounding box is upscaled and blended, so everything the
+    diffusion model did not repaint keeps the original pixels.
+
+    Args:
+        result: generated PIL image.
+        original: full-resolution RGB PIL image (EXIF orientation applied).
+        mask: PIL mask at `result.size`, 0 = keep original, 255 = take result.
+        box: region of `original` that `result` shows, possibly fractional (see
+            `frame_box`); defaults to the `resize_and_crop(original, result.size)` framing.
+    """
+    mask = mask.convert("L")
+    bbox = mask.getbbox()
+    if bbox is None:
+        return original.copy()
+    left, top, right, bottom = box or crop_box(original.size, result.size)
+    scale_x = (right - left) / result.width
+    scale_y = (bottom - top) / result.height
+    # mask bbox in whole original pixels inside the box, and the matching (fractional) source region of the result
+    x0 = max(math.ceil(left), math.floor(left + bbox[0] * scale_x))
+    y0 = max(math.ceil(top), math.floor(top + bbox[1] * scale_y))
+    x1 = min(math.floor(right), math.ceil(left + bbox[2] * scale_x))
+    y1 = min(math.floor(bottom), math.ceil(top + bbox[3] * scale_y))
+    source = ((x0 - left) / scale_x, (y0 - top) / scale_y, (x1 - left) / scale_x, (y1 - top) / scale_y)
+    region_size = (x1 - x0, y1 - y0)
+    result = np.asarray(result.resize(region_size, Image.LANCZOS, box=source), dtype=np.float32)
+    alpha = np.asarray(mask.resize(region_size, Image.BILINEAR, box=source), dtype=np.float32)[..., None] / 255.0
+    region_box = (x0, y0, x1, y1)
+    region = np.asarray(original.crop(region_box), dtype=np.float32)
+    region += alpha * (result - region)
+    output = original.copy()
+    output.paste(Image.fromarray(np.rint(region).astype(np.uint8)), region_box[:2])
+    return output
+
+
 def resize_and_padding(image, size):
     # Padding to size ratio
     w, h = image.size
@@ -619,5 +734,115 @@ def resize_and_padding(image, size):
 
 
 
+def _uint8_batches(images, device):
+    """
+    Group images by shape into (indices, uint8 BCHW tensor on `device`) so
+    equally sized inputs are resized in one kernel call.
+    """
+    if isinstance(images, torch.Tensor):
+        if images.ndim == 3:
+            images = images.unsqueeze(0)
+        if images.shape[-1] in (1, 3) and images.shape[1] not in (1, 3):
+            images = images.permute(0, 3, 1, 2)
+        return [(list(range(images.shape[0])), images.to(device, non_blocking=True))]
+    groups = {}
+    for i, image in enumerate(images):
+        if isinstance(image, Image.Image):
+            image = np.array(image.convert("RGB"))
+        tensor = torch.as_tensor(image)
+        if tensor.shape[-1] == 3:
+            tensor = tensor.permute(2, 0, 1)
+        groups.setdefault(tuple(tensor.shape), []).append((i, tensor))
+    batches = []
+    for members in groups.values():
+        indices = [i for i, _ in members]
+        batch = torch.stack([t for _, t in members])
+        if device is not None and torch.device(device).type == "cuda":
+            batch = batch.pin_memory()
+        batches.append((indices, batch.to(device, non_blocking=True)))
+    return batches
+
+
+# Largest / mean absolute difference (uint8 levels) allowed between the tensor
+# resize and the PIL LANCZOS one; asserted by benchmarks/bench_resize.py
+# (measured: max 5, mean 0.71 on 1024x1536 to 3000x2000 inputs).
+RESIZE_PARITY_MAX = 8
+RESIZE_PARITY_MEAN = 1.0
+# Same for the 1.5x upscale `vton` does from the prep size to the inference size:
+# bicubic and LANCZOS ring differently at hard edges (measured: max 24, mean 0.42
+# on the demo person / garment, max 10 / mean 1.07 on the synthetic noise).
+RESIZE_UPSCALE_PARITY_MAX = 32
+RESIZE_UPSCALE_PARITY_MEAN = 1.5
+
+
+def _resize_tensor(batch, size):
+    # antialiased bicubic is the closest tensor counterpart of PIL's LANCZOS downscale
+    # (within RESIZE_PARITY_MAX / RESIZE_PARITY_MEAN, RESIZE_UPSCALE_* going up; exact at the same size)
+    return F.interpolate(
+        batch.float(), size=size, mode="bicubic", antialias=True, align_corners=False
+    ).clamp_(0, 255)
+
+
+def resize_and_crop_tensor(images, size, device=None):
+    """
+    Batched tensor version of `resize_and_crop`.
+
+    Args:
+        images: uint8 tensor (B, H, W, 3) / (B, 3, H, W), or a list of uint8
+            arrays, tensors or PIL images of possibly different sizes.
+        size: (width, height) target.
+        device: device to run on; defaults to where `images` already is.
+
+    Returns:
+        torch.Tensor: float32 (B, 3, height, width) in [-1, 1], the same layout
+        `prepare_image` produces.
+    """
+    target_w, target_h = size
+    batches = _uint8_batches(images, device)
+    total = sum(len(i) for i, _ in batches)
+    out = None
+    for indices, batch in batches:
+        h, w = batch.shape[-2:]
+        if w / h < target_w / target_h:
+            new_w = w
+            new_h = w * target_h // target_w
+        else:
+            new_h = h
+            new_w = h * target_w // target_h
+        top, left = (h - new_h) // 2, (w - new_w) // 2
+        resized = _resize_tensor(batch[..., top:top + new_h, left:left + new_w], (target_h, target_w))
+        if out is None:
+            out = resized.new_empty((total, resized.shape[1], target_h, target_w))
+        out[indices] = resized
+    return out.div_(127.5).sub_(1.0)
+
+
+def resize_and_padding_tensor(images, size, device=None):
+    """
+    Batched tensor version of `resize_and_padding`; see `resize_and_crop_tensor`
+    for arguments. Padding is white, i.e. 1.0 after normalization.
+    """
+    target_w, target_h = size
+    batches = _uint8_batches(images, device)
+    total = sum(len(i) for i, _ in batches)
+    out = None
+    for indices, batch in batches:
+        h, w = batch.shape[-2:]
+        if w / h < target_w / target_h:
+            new_h = target_h
+            new_w = w * target_h // h
+        else:
+            new_w = target_w
+            new_h = h * target_w // w
+        resized = _resize_tensor(batch, (new_h, new_w))
+        if out is None:
+            out = resized.new_full((total, resized.shape[1], target_h, target_w), 255.0)
+        top, left = (target_h - new_h) // 2, (target_w - new_w) // 2
+        padded = out[indices]
+        padded[..., top:top + new_h, left:left + new_w] = resized
+        out[indices] = padded
+    return out.div_(127.5).sub_(1.0)
+
+
 if __name__ == "__main__":
     pass